@@ -0,0 +1,105 @@
+# *** Turns the seed ensemble into a single checkpoint, and measures what that costs ***
+# Decoding with all of the seeds (as run_seg.sh does) means running every model on every word.
+# There are two ways to get down to one model here:
+# - Averaging: the seeds' parameters are averaged into one checkpoint (like fairseq's scripts/average_checkpoints.py).
+#   Seeds are trained independently, so their parameters don't necessarily line up; check the evaluation before relying on it.
+# - Distillation: the ensemble segments the train input, and that output is used as train.output for one new model
+#   (preprocess it as usual, then train with train_seg.sh).  Pass that model as --student to evaluate it.
+# The evaluation segments the test input with each option, and prints word-level accuracy, boundary F1 and decoding time
+# for each (using test_seg.evaluate), so you know how much accuracy you're giving up for the speedup.
+import click
+from collections import OrderedDict
+from time import perf_counter
+import seg_model
+from test_seg import evaluate, read_lines_from_file, segment_in_process
+
+RESULTS_HEADER = "Option,Models,Acc,Boundary Prec,B Recall,B F1,Seconds,Words per Second"
+
+# Averages the model parameters of the checkpoints, and saves the result (with everything else taken from the first checkpoint)
+def average_checkpoints(checkpoint_paths, output_path):
+    import torch
+
+    parameter_sums = OrderedDict()
+    for checkpoint_path in checkpoint_paths:
+        state = torch.load(checkpoint_path, map_location = "cpu")
+        parameters = state["model"]
+        if not parameter_sums:
+            first_state = state
+            for name, value in parameters.items():
+                parameter_sums[name] = value.clone().float() if value.is_floating_point() else value.clone()
+        else:
+            assert parameters.keys() == parameter_sums.keys(), f"{checkpoint_path} does not have the same parameters as {checkpoint_paths[0]}."
+            for name, value in parameters.items():
+                if value.is_floating_point():
+                    parameter_sums[name] += value.float()
+
+    first_parameters = first_state["model"]
+    for name, value in parameter_sums.items():
+        if value.is_floating_point():
+            parameter_sums[name] = (value / len(checkpoint_paths)).to(first_parameters[name].dtype)
+    first_state["model"] = parameter_sums
+    torch.save(first_state, output_path)
+
+# Segments the (char-level) train input with the ensemble and writes the predictions, one per line, as a student's train.output
+def write_distillation_targets(input_file, output_file, models, data_dir = seg_model.DEFAULT_DATA_DIR, batch_size = seg_model.DEFAULT_BATCH_SIZE, beam = seg_model.DEFAULT_BEAM):
+    predictions = segment_in_process(read_lines_from_file(input_file), models, data_dir, batch_size, beam)
+    with open(output_file, "w") as file:
+        file.writelines(prediction + "\n" for prediction in predictions)
+
+# Segments the test input with one option (a colon-separated list of checkpoints), and returns its results
+# [accuracy, boundary precision, recall, F1, seconds, words per second]
+def evaluate_option(models, test_input, gold_output, data_dir = seg_model.DEFAULT_DATA_DIR, batch_size = seg_model.DEFAULT_BATCH_SIZE, beam = seg_model.DEFAULT_BEAM):
+    start_time = perf_counter()
+    output = segment_in_process(test_input, models, data_dir, batch_size, beam)
+    seconds = perf_counter() - start_time
+    # Only the type-insensitive boundary results are kept
+    results = evaluate(output, gold_output)[:4]
+
+    return results + [round(seconds, 2), round(len(test_input) / seconds, 2)]
+
+@click.command()
+@click.option("--models", required = True, help = "The ensemble's checkpoints, separated by colons (as in run_seg.sh).")
+@click.option("--data_dir", default = seg_model.DEFAULT_DATA_DIR, show_default = True, help = "The fairseq data directory with the dictionaries.")
+@click.option("--average_to", help = "Write the checkpoint with the ensemble's averaged parameters here.")
+@click.option("--distillation_input_file", help = "A char-level input file (e.g., generated_data/train.input) for the ensemble to segment, to train a student model on.")
+@click.option("--distillation_output_file", help = "Where to write the ensemble's segmentations of --distillation_input_file.")
+@click.option("--student", help = "A single checkpoint trained on the distillation output, to include in the evaluation.")
+@click.option("--test_input_file", help = "The char-level input to evaluate on (e.g., generated_data/test.input).  Each option is only evaluated if this is given.")
+@click.option("--gold_output_file", help = "The gold segmentations for --test_input_file.")
+@click.option("--batch_size", default = seg_model.DEFAULT_BATCH_SIZE, show_default = True, help = "How many words to decode at once.")
+@click.option("--beam", default = seg_model.DEFAULT_BEAM, show_default = True, help = "The beam size to decode with.")
+def main(models, data_dir, average_to, distillation_input_file, distillation_output_file, student, test_input_file, gold_output_file, batch_size, beam):
+    checkpoint_paths = models.split(":")
+
+    if average_to:
+        average_checkpoints(checkpoint_paths, average_to)
+        print(f"Wrote the average of {len(checkpoint_paths)} checkpoints to {average_to}.")
+
+    if distillation_input_file:
+        assert distillation_output_file, "--distillation_output_file is needed with --distillation_input_file."
+        write_distillation_targets(distillation_input_file, distillation_output_file, models, data_dir, batch_size, beam)
+        print(f"Wrote the ensemble's segmentations of {distillation_input_file} to {distillation_output_file}.")
+
+    if test_input_file:
+        assert gold_output_file, "--gold_output_file is needed with --test_input_file."
+        test_input = read_lines_from_file(test_input_file)
+        gold_output = read_lines_from_file(gold_output_file)
+
+        options = [("Ensemble", models), ("Single seed", checkpoint_paths[0])]
+        if average_to:
+            options.append(("Averaged", average_to))
+        if student:
+            options.append(("Distilled", student))
+
+        rows = []
+        for name, option_models in options:
+            print(f"\n** {name} ({option_models}): **")
+            results = evaluate_option(option_models, test_input, gold_output, data_dir, batch_size, beam)
+            rows.append([name, len(option_models.split(":"))] + results)
+
+        print("\n" + RESULTS_HEADER)
+        for row in rows:
+            print(",".join(str(value) for value in row))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# *** Converts whole corpus files between the van Eijk and NAPA orthographies ***
+# The file is read and written a chunk at a time (so big archives never have to fit in memory),
+# and the chunks are converted in parallel by a pool of worker processes.
+# Only the lines chosen with --line_number are converted (e.g., not the gloss or translation lines),
+# counting from 1 within each example, like the other scripts.  If no line numbers are given, every line is converted.
+import click
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from glossed_data_utilities import convert_orthography, get_compiled_conversions, ORTHOGRAPHY_CONVERSIONS
+
+# Chunks always end at the end of an example, so each one starts on the first line of an example
+MIN_LINES_PER_CHUNK = 10000
+
+# Converts one chunk of lines (each still ending in "\n"), and returns it as a single string
+def _convert_chunk(lines, direction, line_numbers):
+    # Without a choice of lines, the whole chunk can be converted in one go (nothing spans a line break)
+    if not line_numbers:
+        return convert_orthography("".join(lines), direction)
+
+    converted_lines = []
+    line_number = 1
+    for line in lines:
+        if line.strip() == "":
+            line_number = 1
+            converted_lines.append(line)
+        else:
+            converted_lines.append(convert_orthography(line, direction) if line_number in line_numbers else line)
+            line_number += 1
+
+    return "".join(converted_lines)
+
+def _read_chunks(file):
+    chunk = []
+    for line in file:
+        chunk.append(line)
+        if len(chunk) >= MIN_LINES_PER_CHUNK and line.strip() == "":
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def convert_file(input_file, output_file, direction, line_numbers = None, num_workers = None):
+    line_numbers = frozenset(line_numbers or [])
+    if num_workers is None:
+        num_workers = cpu_count() or 1
+    # Compile before starting the workers (which then inherit it, where processes are forked)
+    get_compiled_conversions(direction)
+
+    chunk_count = 0
+    with open(input_file) as in_file, open(output_file, "w") as out_file, ProcessPoolExecutor(max_workers = num_workers) as executor:
+        # Keep only a few chunks in flight at a time, and write them out in their original order
+        in_flight = deque()
+        for chunk in _read_chunks(in_file):
+            in_flight.append(executor.submit(_convert_chunk, chunk, direction, line_numbers))
+            if len(in_flight) >= 2 * num_workers:
+                out_file.write(in_flight.popleft().result())
+            chunk_count += 1
+        while in_flight:
+            out_file.write(in_flight.popleft().result())
+
+    return chunk_count
+
+@click.command()
+@click.option("--input_file", required = True, help = "The file to convert.")
+@click.option("--output_file", required = True, help = "Where to write the converted file.")
+@click.option("--direction", default = "van_Eijk_to_NAPA", show_default = True, type = click.Choice(list(ORTHOGRAPHY_CONVERSIONS)), help = "Which orthography to convert from and to.")
+@click.option("--line_number", "line_numbers", multiple = True, type = int, help = "A line (of each example) to convert.  For example, 1 for the transcription line and 2 for the segmentation line.  Can be repeated.  If not given, every line is converted.")
+@click.option("--num_workers", type = int, help = "How many processes to convert with.  Defaults to the number of CPUs.")
+def main(input_file, output_file, direction, line_numbers, num_workers):
+    chunk_count = convert_file(input_file, output_file, direction, line_numbers, num_workers)
+    print(f"Converted {input_file} ({chunk_count} chunks) from {direction.replace('_to_', ' to ').replace('_', ' ')}, and wrote it to {output_file}.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# *** A local SQLite store of glossed corpora, for building gloss inventories ***
+# Each morpheme token is stored as one row (with its sentence, word, morpheme, gloss, and split),
+# so that the gloss inventory and comparisons across languages can come from SQL aggregation
+# instead of re-reading and re-counting every file each time.
+import click
+from hashlib import sha1
+from os import path
+import sqlite3
+from glossed_data_utilities import read_file
+from glossed_data_handling_utilities import gloss_line_to_morphemes, seg_line_to_morphemes
+
+DEFAULT_DB_FILE = "./corpus.db"
+DEFAULT_LANGUAGE = "lang_1"
+SPLITS = ["train", "dev", "test"]
+
+# Each source is one file, imported for one language and split.  Each language and split only has one source at a time
+# (importing a different file for them replaces the old one), so everything stored under a language is from its current files.
+# We keep its hash (and the line numbers used to read it) so re-imports can skip unchanged files.
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS sources (
+    source_id INTEGER PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    language TEXT NOT NULL,
+    split TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    segmentation_line_number INTEGER NOT NULL,
+    gloss_line_number INTEGER NOT NULL,
+    UNIQUE (language, split)
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    source_id INTEGER NOT NULL REFERENCES sources(source_id) ON DELETE CASCADE,
+    language TEXT NOT NULL,
+    split TEXT NOT NULL,
+    sentence INTEGER NOT NULL,
+    word INTEGER NOT NULL,
+    morpheme TEXT NOT NULL,
+    gloss TEXT NOT NULL,
+    is_gram INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tokens_by_source ON tokens (source_id);
+CREATE INDEX IF NOT EXISTS tokens_by_gloss ON tokens (language, gloss, morpheme);
+CREATE INDEX IF NOT EXISTS tokens_by_gram ON tokens (language, is_gram, gloss);
+"""
+
+def connect(db_file = DEFAULT_DB_FILE):
+    connection = sqlite3.connect(db_file)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(CREATE_TABLES)
+    return connection
+
+def _hash_file(file_path):
+    with open(file_path, "rb") as f:
+        return sha1(f.read()).hexdigest()
+
+# Yields one row per morpheme token in the dataset
+# Morphemes and glosses are broken down exactly as get_tags (in prescreen_data.py) does it
+def _dataset_to_rows(dataset, source_id, language, split, segmentation_line_number, gloss_line_number):
+    for sentence_index, sentence in enumerate(dataset):
+        seg_words = seg_line_to_morphemes(sentence[segmentation_line_number], do_ignore_brackets = True, keep_word_boundaries = True)
+        glosses = gloss_line_to_morphemes(sentence[gloss_line_number])
+        assert(sum(len(word) for word in seg_words) == len(glosses))
+        gloss_index = 0
+        for word_index, word in enumerate(seg_words):
+            for morpheme in word:
+                assert(morpheme)
+                gloss = glosses[gloss_index]
+                gloss_index += 1
+                yield (source_id, language, split, sentence_index, word_index, morpheme, gloss, int(gloss.isupper()))
+
+# Loads one file into the database, as the data for this language and split
+# If the same file was already imported for them and hasn't changed since, nothing is done
+# Returns True if the file was (re-)imported, False if it was skipped
+def import_file(connection, file_path, split, language, segmentation_line_number, gloss_line_number):
+    file_path = path.abspath(file_path)
+    content_hash = _hash_file(file_path)
+    existing = connection.execute("SELECT file_path, content_hash, segmentation_line_number, gloss_line_number FROM sources WHERE language = ? AND split = ?", (language, split)).fetchall()
+    if existing == [(file_path, content_hash, segmentation_line_number, gloss_line_number)]:
+        return False
+
+    with connection:
+        # A different (or changed) file replaces whatever was there, so throw out the old tokens (they cascade) before reading it
+        connection.execute("DELETE FROM sources WHERE language = ? AND split = ?", (language, split))
+        cursor = connection.execute("INSERT INTO sources (file_path, language, split, content_hash, segmentation_line_number, gloss_line_number) VALUES (?, ?, ?, ?, ?, ?)", (file_path, language, split, content_hash, segmentation_line_number, gloss_line_number))
+        rows = _dataset_to_rows(read_file(file_path), cursor.lastrowid, language, split, segmentation_line_number, gloss_line_number)
+        connection.executemany("INSERT INTO tokens (source_id, language, split, sentence, word, morpheme, gloss, is_gram) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    return True
+
+# Imports a train/dev/test trio for one language
+def import_datasets(connection, train_file, dev_file, test_file, language, segmentation_line_number, gloss_line_number):
+    for split, file_path in zip(SPLITS, [train_file, dev_file, test_file]):
+        if import_file(connection, file_path, split, language, segmentation_line_number, gloss_line_number):
+            print(f"Imported {file_path} ({language}, {split}).")
+        else:
+            print(f"{file_path} ({language}, {split}) is unchanged since it was last imported.")
+
+def _split_condition(splits):
+    return "split IN (" + ", ".join("?" for split in splits) + ")"
+
+# Returns a dictionary where the keys are glosses, and the values are dicts with morpheme keys and count values
+# This is the same structure that get_tags (in prescreen_data.py) builds before classifying the glosses
+# (including the order, which is the order each gloss/morpheme pair was first imported in)
+def get_gloss_dict(connection, language, splits = SPLITS):
+    gloss_dict = {}
+    query = "SELECT gloss, morpheme, COUNT(*) FROM tokens WHERE language = ? AND " + _split_condition(splits) + " GROUP BY gloss, morpheme ORDER BY MIN(rowid)"
+    for gloss, morpheme, count in connection.execute(query, [language] + list(splits)):
+        gloss_dict.setdefault(gloss, {})[morpheme] = count
+
+    return gloss_dict
+
+# Returns the sorted list of gram glosses used in the given language
+def get_gram_tags(connection, language, splits = SPLITS):
+    query = "SELECT DISTINCT gloss FROM tokens WHERE language = ? AND is_gram = 1 AND " + _split_condition(splits) + " ORDER BY gloss"
+    return [row[0] for row in connection.execute(query, [language] + list(splits))]
+
+# Returns three sorted lists of gram glosses: those only in language 1, only in language 2, and shared
+def compare_gram_tags(connection, language_1, language_2, splits = SPLITS):
+    gram_query = "SELECT gloss FROM tokens WHERE language = ? AND is_gram = 1 AND " + _split_condition(splits)
+    params_1 = [language_1] + list(splits)
+    params_2 = [language_2] + list(splits)
+    only_1 = [row[0] for row in connection.execute(gram_query + " EXCEPT " + gram_query + " ORDER BY gloss", params_1 + params_2)]
+    only_2 = [row[0] for row in connection.execute(gram_query + " EXCEPT " + gram_query + " ORDER BY gloss", params_2 + params_1)]
+    shared = [row[0] for row in connection.execute(gram_query + " INTERSECT " + gram_query + " ORDER BY gloss", params_1 + params_2)]
+
+    return only_1, only_2, shared
+
+@click.command()
+@click.option("--db_file", default = DEFAULT_DB_FILE, show_default = True, help = "The SQLite database to import into (created if it doesn't exist).")
+@click.option("--language", default = DEFAULT_LANGUAGE, show_default = True, help = "A label for the language of the imported data, used to keep languages apart in the database.")
+@click.option("--train_file", required = True, help = "The name of the file containing all sentences in the train set.")
+@click.option("--dev_file", required = True, help = "The name of the file containing all sentences in the dev set.")
+@click.option("--test_file", required = True, help = "The name of the file containing all sentences in the test set.")
+@click.option("--segmentation_line_number", required = True, type = int, help = "The line that contains the segmented sentence.  For example if there are four lines each and the segmentation is the second line, this will be 2.")
+@click.option("--gloss_line_number", required = True, type = int, help = "The line that contains the glossed sentence.  For example if there are four lines each and the gloss is the third line, this will be 3.")
+def main(db_file, language, train_file, dev_file, test_file, segmentation_line_number, gloss_line_number):
+    # Convert right away to prevent off-by-one errors
+    segmentation_line_number = int(segmentation_line_number) - 1
+    gloss_line_number = int(gloss_line_number) - 1
+
+    connection = connect(db_file)
+    import_datasets(connection, train_file, dev_file, test_file, language, segmentation_line_number, gloss_line_number)
+    token_count = connection.execute("SELECT COUNT(*) FROM tokens WHERE language = ?", (language,)).fetchone()[0]
+    print(f"{db_file} now holds {token_count} morpheme tokens for {language}.")
+    connection.close()
+
+if __name__ == '__main__':
+    main()
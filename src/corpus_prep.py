@@ -0,0 +1,175 @@
+# *** Streaming corpus preparation ***
+# tidy_dataset, handle_clitics, mark_OOL_words, handle_OOL_words and fix_inconsistent_stress (from glossed_data_utilities.py)
+# each walk the whole dataset, re-splitting and re-joining every line.
+# Here, each of those steps is a "stage" that works on one sentence at a time, and run_stages chains them
+# in a single pass over the data.  Each line is only split into words once (and only re-joined at the end),
+# and the output is identical to calling the original functions one after another.
+# For example:
+#   stages = [tidy_stage(), clitic_stage(PRE_CLITICS, DOUBLE_PRE_CLITICS, POST_CLITICS, DOUBLE_POST_CLITICS), mark_OOL_stage(OOL_WORDS, 4), handle_OOL_stage(), stress_stage()]
+#   prepared = list(run_stages(dataset, stages))
+import click
+from copy import deepcopy
+import json
+from time import perf_counter
+from glossed_data_utilities import fix_inconsistent_stress, fix_inconsistent_stress_in_lines, compile_clitic_tables, get_OOL_words_case_insensitive, handle_OOL_words, handle_OOL_words_in_line, mark_OOL_words, mark_OOL_words_in_sentence, handle_clitics, read_file, separate_clitics, tidy_dataset, tidy_line, write_sentences, PUNCTUATION_TO_IGNORE_REGEX
+
+CLITIC_LISTS = ["pre_clitics", "double_pre_clitics", "post_clitics", "double_post_clitics"]
+
+# One sentence that is passing through the stages
+# Each line is held as a string, a list of words, or both, and is only converted between the two when a stage needs it
+class _SentenceInProgress:
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.words = [None] * len(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def get_line(self, i):
+        if self.lines[i] is None:
+            self.lines[i] = " ".join(self.words[i])
+        return self.lines[i]
+
+    def get_words(self, i):
+        if self.words[i] is None:
+            self.words[i] = self.get_line(i).split()
+        return self.words[i]
+
+    def set_line(self, i, line):
+        self.lines[i] = line
+        self.words[i] = None
+
+    # Note that setting the words means the line will be re-joined with single spaces,
+    # just like the original functions do whenever they split a line
+    # An empty word (e.g., what's left of a gloss word that had no clitic boundary to split on) joins into an extra space,
+    # which the next function to split the line would drop, so in that case the line is joined now and split again when needed
+    def set_words(self, i, words):
+        if "" in words:
+            self.set_line(i, " ".join(words))
+        else:
+            self.words[i] = words
+            self.lines[i] = None
+
+    def to_list(self):
+        return [self.get_line(i) for i in range(len(self.lines))]
+
+# Each of these returns a stage (a function that updates a _SentenceInProgress),
+# and takes the same parameters as the dataset-level function it stands in for
+
+def tidy_stage(seg_line_number = 1, gloss_line_number = 2, MINIMAL_CHANGES_ONLY = False):
+    def stage(sentence):
+        for i in range(len(sentence)):
+            sentence.set_line(i, tidy_line(sentence.get_line(i), i, seg_line_number, gloss_line_number, MINIMAL_CHANGES_ONLY))
+    return stage
+
+def clitic_stage(pre_clitics, double_pre_clitics, post_clitics, double_post_clitics, seg_line_number = 1, gloss_line_number = 2):
+    clitic_tables = compile_clitic_tables(pre_clitics, double_pre_clitics, post_clitics, double_post_clitics)
+    def stage(sentence):
+        ortho_line_word_list = (PUNCTUATION_TO_IGNORE_REGEX.sub("", sentence.get_line(0))).split()
+        seg_line_word_list = sentence.get_words(seg_line_number)
+        gloss_line_word_list = sentence.get_words(gloss_line_number)
+        separate_clitics(ortho_line_word_list, seg_line_word_list, gloss_line_word_list, clitic_tables)
+        sentence.set_words(seg_line_number, seg_line_word_list)
+        sentence.set_words(gloss_line_number, gloss_line_word_list)
+    return stage
+
+def mark_OOL_stage(OOL_WORDS, LINES_PER_SENTENCE):
+    OOL_WORDS_CASE_INSENSITIVE = get_OOL_words_case_insensitive(OOL_WORDS)
+    def stage(sentence):
+        # Only consider full examples
+        if len(sentence) == LINES_PER_SENTENCE:
+            words = [sentence.get_words(i) for i in range(3)]
+            mark_OOL_words_in_sentence(words[0], words[1], words[2], OOL_WORDS_CASE_INSENSITIVE)
+            for i in range(3):
+                sentence.set_words(i, words[i])
+    return stage
+
+# Unlike handle_OOL_words, this doesn't print the number of OOL tokens handled
+def handle_OOL_stage(replace = False):
+    def stage(sentence):
+        OOL_count = 0
+        for i in range(len(sentence)):
+            updated_words, line_OOL_count = handle_OOL_words_in_line(sentence.get_words(i), replace)
+            OOL_count += line_OOL_count
+            sentence.set_words(i, updated_words)
+        assert(OOL_count % 3 == 0) # Each removal should occur 3x (once in the transcription line, seg line, and gloss line)
+    return stage
+
+def stress_stage(num_lines = 4, transcription_line_number = 0, seg_line_number = 1, maintain_NFC_unicode = False):
+    def stage(sentence):
+        # Only look at proper 4-line glossed lines
+        if len(sentence) == num_lines:
+            transcription_line, seg_line = fix_inconsistent_stress_in_lines(sentence.get_line(transcription_line_number), sentence.get_line(seg_line_number), maintain_NFC_unicode)
+            sentence.set_line(transcription_line_number, transcription_line)
+            sentence.set_line(seg_line_number, seg_line)
+    return stage
+
+# Runs every stage on each sentence in turn, yielding the prepared sentences one at a time
+# The input sentences are not modified
+def run_stages(dataset, stages):
+    for sentence in dataset:
+        sentence_in_progress = _SentenceInProgress(sentence)
+        for stage in stages:
+            stage(sentence_in_progress)
+        yield sentence_in_progress.to_list()
+
+# The original, one-function-at-a-time version of the benchmark's preparation job
+def _prepare_sequentially(dataset, clitics, OOL_words, lines_per_sentence, minimal_changes_only):
+    dataset = tidy_dataset(dataset, MINIMAL_CHANGES_ONLY = minimal_changes_only)
+    dataset = handle_clitics(dataset, *clitics)
+    dataset = mark_OOL_words(dataset, list(OOL_words), lines_per_sentence)
+    dataset = handle_OOL_words([dataset])[0]
+    dataset = fix_inconsistent_stress(dataset, num_lines = lines_per_sentence)
+    return dataset
+
+def _prepare_in_stages(dataset, clitics, OOL_words, lines_per_sentence, minimal_changes_only):
+    stages = [tidy_stage(MINIMAL_CHANGES_ONLY = minimal_changes_only), clitic_stage(*clitics), mark_OOL_stage(list(OOL_words), lines_per_sentence), handle_OOL_stage(), stress_stage(num_lines = lines_per_sentence)]
+    return list(run_stages(dataset, stages))
+
+# Reads the clitic lists for handle_clitics from a JSON file, with one entry (a dict from each clitic
+# to its possible forms in the orthographic line) for each of CLITIC_LISTS (any that are missing are empty)
+def read_clitics(clitics_file):
+    clitics = {}
+    if clitics_file:
+        with open(clitics_file) as file:
+            clitics = json.load(file)
+    for name in clitics:
+        assert name in CLITIC_LISTS, f"\nUnknown clitic list {name} in {clitics_file}.  The lists are: {', '.join(CLITIC_LISTS)}."
+
+    return [clitics.get(name, {}) for name in CLITIC_LISTS]
+
+# Throughput benchmark: runs the same preparation job (tidying, clitic separation, OOL marking and removal, stress fixing)
+# both ways, checks that the outputs are identical, and reports sentences per second
+@click.command()
+@click.option("--input_file", required = True, help = "A file of glossed sentences to prepare (seg line second, gloss line third).")
+@click.option("--clitics_file", help = "Optional JSON file with the clitic lists to separate (pre_clitics, double_pre_clitics, post_clitics and double_post_clitics).")
+@click.option("--OOL_word", "OOL_words", multiple = True, help = "A word to mark as out-of-language.  Can be repeated.")
+@click.option("--copies", default = 1, show_default = True, help = "How many copies of the input to run on (to benchmark with more data).")
+@click.option("--minimal_changes_only", is_flag = True, help = "Tidy with MINIMAL_CHANGES_ONLY.")
+@click.option("--output_file", help = "Optional file to write the prepared sentences to.")
+def main(input_file, clitics_file, OOL_words, copies, minimal_changes_only, output_file):
+    # Each copy gets its own lists, since the original functions update the sentences in place
+    dataset = [list(sentence) for copy in range(copies) for sentence in read_file(input_file)]
+    clitics = read_clitics(clitics_file)
+    lines_per_sentence = len(dataset[0])
+
+    # The original functions modify their input, so each run gets its own copy
+    sequential_input = deepcopy(dataset)
+    start = perf_counter()
+    sequential_output = _prepare_sequentially(sequential_input, clitics, OOL_words, lines_per_sentence, minimal_changes_only)
+    sequential_time = perf_counter() - start
+
+    start = perf_counter()
+    staged_output = _prepare_in_stages(dataset, clitics, OOL_words, lines_per_sentence, minimal_changes_only)
+    staged_time = perf_counter() - start
+
+    assert staged_output == sequential_output, "The staged output does not match the sequential output!"
+    print(f"\nPrepared {len(dataset)} sentences.")
+    print(f"One function at a time: {sequential_time:.2f}s ({len(dataset) / sequential_time:.0f} sentences/s).")
+    print(f"In stages: {staged_time:.2f}s ({len(dataset) / staged_time:.0f} sentences/s).")
+
+    if output_file:
+        write_sentences(staged_output, output_file)
+
+if __name__ == '__main__':
+    main()
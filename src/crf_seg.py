@@ -0,0 +1,138 @@
+# *** A CRF segmenter, as a faster alternative to the fairseq ensemble ***
+# Reads the same char-level word lists as fairseq (train.input/train.output, written by preprocess_seg.py),
+# and learns to tag each char with the boundary (or boundaries, e.g. ">-") that come right before it, or "O" for none.
+# Each word also gets an end-of-word item, so boundaries at the very end of a word can be tagged too.
+# The output is written in the same format as train.output (e.g., "t a o w e n - m í n - a s"), so test_seg.py can score it
+# (without --output_file_is_fairseq_formatted).
+# Since it only inserts boundaries, it can't reproduce words whose segmented form has different chars than the input
+# (e.g., from normalization).  Those words are left out of training, and counted.
+import click
+import pickle
+from time import perf_counter
+from gloss import create_crf
+from glossed_data_handling_utilities import REGULAR_BOUNDARY, CLITIC_BOUNDARY, REDUPLICATION_BOUNDARY, LEFT_INFIX_BOUNDARY, RIGHT_INFIX_BOUNDARY, LEFT_REDUP_INFIX_BOUNDARY, RIGHT_REDUP_INFIX_BOUNDARY
+from segment_words import get_word_types, read_words
+
+BOUNDARIES = {REGULAR_BOUNDARY, CLITIC_BOUNDARY, REDUPLICATION_BOUNDARY, LEFT_INFIX_BOUNDARY, RIGHT_INFIX_BOUNDARY, LEFT_REDUP_INFIX_BOUNDARY, RIGHT_REDUP_INFIX_BOUNDARY}
+NO_BOUNDARY_LABEL = "O"
+END_OF_WORD = "</w>"
+START_OF_WORD = "<w>"
+# How many chars on each side to use as context features
+WINDOW = 3
+MAX_ITERATIONS = 100
+ALGORITHM = "lbfgs"
+C2 = 0.1
+DEFAULT_MODEL_FILE = "seg_crf.pkl"
+
+# Splits a segmented word (as its list of tokens) into its chars and the label for each one (and the end of the word)
+# Returns None if the word has chars that the input word doesn't
+def _word_to_labels(input_tokens, output_tokens):
+    chars = []
+    labels = []
+    boundaries = ""
+    for token in output_tokens:
+        if token in BOUNDARIES:
+            boundaries += token
+        else:
+            chars.append(token)
+            labels.append(boundaries or NO_BOUNDARY_LABEL)
+            boundaries = ""
+    labels.append(boundaries or NO_BOUNDARY_LABEL)
+
+    return labels if chars == input_tokens else None
+
+# Returns the features for each char of the word (as its list of tokens), plus the end of the word
+# Each char's features are a list of "name=value" strings (which is what crfsuite turns a dict of features into anyway)
+def word_to_features(tokens):
+    padded = [START_OF_WORD] * WINDOW + tokens + [END_OF_WORD] * (WINDOW + 1)
+    word_length = len(tokens)
+    features = []
+    for i in range(word_length + 1):
+        position = i + WINDOW
+        before = ""
+        after = ""
+        char_features = [f"char={padded[position]}", f"from_start={min(i, WINDOW)}", f"from_end={min(word_length - i, WINDOW)}", f"-1:+1={padded[position - 1]}|{padded[position]}"]
+        for offset in range(1, WINDOW + 1):
+            # The chars on each side of where the boundary would go, as single chars and as growing strings
+            before = padded[position - offset] + "|" + before
+            after = after + "|" + padded[position + offset - 1]
+            char_features += [f"-{offset}={padded[position - offset]}", f"+{offset}={padded[position + offset]}", f"-{offset}:={before}", f":+{offset}={after}"]
+        features.append(char_features)
+
+    return features
+
+# Returns each distinct (input, output) pair of words as features and labels, and how many pairs had to be skipped
+def format_training_data(input_words, output_words):
+    assert len(input_words) == len(output_words), f"\nThere are {len(input_words)} input words and {len(output_words)} output words."
+    X = []
+    y = []
+    skipped_count = 0
+    for input_word, output_word in dict.fromkeys(zip(input_words, output_words)):
+        input_tokens = input_word.split()
+        labels = _word_to_labels(input_tokens, output_word.split())
+        if labels is None:
+            skipped_count += 1
+            continue
+        X.append(word_to_features(input_tokens))
+        y.append(labels)
+
+    return X, y, skipped_count
+
+def train(input_words, output_words, max_iterations = MAX_ITERATIONS, c2 = C2):
+    X, y, skipped_count = format_training_data(input_words, output_words)
+    print(f"Training on {len(X)} distinct words ({skipped_count} skipped because their segmented form has different chars).")
+    return create_crf(X, y, max_iterations, ALGORITHM, 0, c2)
+
+# Puts the predicted boundaries into the word, returning it with spaces in between the tokens
+def _insert_boundaries(tokens, labels):
+    segmented = []
+    for token, label in zip(tokens + [None], labels):
+        if label != NO_BOUNDARY_LABEL:
+            segmented.extend(label)
+        if token is not None:
+            segmented.append(token)
+
+    return " ".join(segmented)
+
+# Segments the (char-level) words, running each distinct word through the model only once
+def segment(words, crf):
+    word_types = get_word_types(words)
+    token_lists = [word.split() for word in word_types]
+    labels = crf.predict([word_to_features(tokens) for tokens in token_lists])
+    segmented_by_word = {word: _insert_boundaries(tokens, word_labels) for word, tokens, word_labels in zip(word_types, token_lists, labels)}
+
+    return [segmented_by_word[word] for word in words]
+
+@click.command()
+@click.option("--train_input_file", help = "The char-level train input (e.g., generated_data/train.input).  If given, a new model is trained.")
+@click.option("--train_output_file", help = "The char-level train output (e.g., generated_data/train.output).")
+@click.option("--model_file", default = DEFAULT_MODEL_FILE, show_default = True, help = "Where to save the trained model, or the model to load if not training.")
+@click.option("--input_file", help = "The char-level words to segment (e.g., generated_data/test.input).")
+@click.option("--output_file", help = "Where to write the segmented words, in the same format as train.output.")
+@click.option("--max_iterations", default = MAX_ITERATIONS, show_default = True, help = "The most training iterations to run.")
+@click.option("--c2", default = C2, show_default = True, help = "The L2 regularization coefficient.")
+def main(train_input_file, train_output_file, model_file, input_file, output_file, max_iterations, c2):
+    if train_input_file:
+        assert train_output_file, "--train_output_file is needed with --train_input_file."
+        start_time = perf_counter()
+        crf = train(read_words(train_input_file), read_words(train_output_file), max_iterations, c2)
+        print(f"Trained in {perf_counter() - start_time:.1f} seconds.")
+        with open(model_file, "wb") as file:
+            pickle.dump(crf, file)
+        print(f"Saved the model to {model_file}.")
+    else:
+        with open(model_file, "rb") as file:
+            crf = pickle.load(file)
+
+    if input_file:
+        assert output_file, "--output_file is needed with --input_file."
+        words = read_words(input_file)
+        start_time = perf_counter()
+        predictions = segment(words, crf)
+        seconds = perf_counter() - start_time
+        with open(output_file, "w") as file:
+            file.writelines(prediction + "\n" for prediction in predictions)
+        print(f"Segmented {len(words)} words in {seconds:.2f} seconds ({round(len(words) / max(seconds, 1e-9))} words per second).  Wrote them to {output_file}.")
+
+if __name__ == '__main__':
+    main()
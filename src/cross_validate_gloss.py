@@ -0,0 +1,178 @@
+# *** Cross-validation for the glossing model ***
+# gloss.py trains on one train set and evaluates on one test set, which (with small corpora) gives noisy numbers.
+# Here, the sentences from every data file are pooled, shuffled and split into k folds.  Each fold is the test set once,
+# with the other folds as the train set, and the results (the same ones eval_gloss.py gives) are reported for every fold,
+# along with their mean and standard deviation.
+# Each fold is trained and evaluated in its own process.  The features for every sentence only depend on the sentence,
+# so they are computed once, before the folds are split, and every process uses them from there.
+# The steps for each fold are the same as gloss.py followed by eval_gloss.py, just without going through the files.
+import click
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+import io
+from os import cpu_count
+from random import Random
+from statistics import mean, stdev
+from time import perf_counter
+from eval_gloss import evaluate_system, OUTPUT_CSV_HEADER
+from gloss import add_word_boundaries_to_gloss, deal_with_stems, extract_X_and_y, format_X_and_y, reassemble_predicted_words, run_system, seg_line_to_features, train_system
+from glossed_data_utilities import add_back_OOL_words, handle_OOL_words, handle_OOL_words_in_line, read_file
+from glossed_data_handling_utilities import gloss_line_to_morphemes, seg_line_to_morphemes
+
+DEFAULT_FOLDS = 5
+DEFAULT_RESULTS_FILE = "gloss_cv_results.csv"
+RESULTS_HEADER = "Fold,Train Sentences,Test Sentences,Seconds," + OUTPUT_CSV_HEADER
+
+# The features for every sentence, set in each worker process before it runs any folds
+_sentence_features = None
+
+# Returns everything about each sentence that training and evaluation need, as a dict of lists (one entry per sentence)
+# None of it depends on which fold a sentence is in, so this only has to be done once
+def get_sentence_features(dataset, segmentation_line_number, gloss_line_number):
+    # As in gloss.py, OOL words are replaced with a label for the features, and then taken out of X and y
+    with_OOL_labels = handle_OOL_words([dataset], replace = True)[0]
+    X, y = format_X_and_y(*extract_X_and_y(with_OOL_labels, segmentation_line_number, gloss_line_number))
+    # As in eval_gloss.py, OOL words are left out of the evaluation altogether
+    without_OOL = handle_OOL_words([dataset])[0]
+    seg_lines, gloss_lines = extract_X_and_y(without_OOL, segmentation_line_number, gloss_line_number)
+
+    return {
+        "X": X,
+        "y": y,
+        "seg_lines": seg_lines,
+        "seg_line_features": [seg_line_to_features(line) for line in seg_lines],
+        "seg_morphemes": [seg_line_to_morphemes(line, do_ignore_brackets = True, keep_word_boundaries = True) for line in seg_lines],
+        "gold_y": [gloss_line_to_morphemes(line, keep_word_boundaries = True) for line in gloss_lines],
+        "transcription_lines": [sentence[0] for sentence in dataset]
+    }
+
+# Returns the sentence numbers in each fold, after shuffling them (with the given seed)
+def split_into_folds(sentence_count, fold_count, seed):
+    assert 2 <= fold_count <= sentence_count, f"\nCan't split {sentence_count} sentences into {fold_count} folds."
+    sentence_numbers = list(range(sentence_count))
+    Random(seed).shuffle(sentence_numbers)
+
+    return [sorted(sentence_numbers[fold::fold_count]) for fold in range(fold_count)]
+
+def _pick(features, name, numbers):
+    return [features[name][i] for i in numbers]
+
+# Trains on the sentences with the given numbers, like gloss.py
+# Returns the stem dictionary and the CRF
+def train(features, train_numbers):
+    train_y_no_stems, stem_dict, crf = train_system(_pick(features, "X", train_numbers), _pick(features, "y", train_numbers))
+    return stem_dict, crf
+
+# Glosses the test sentences (given by their numbers) and evaluates the predictions, like gloss.py and then eval_gloss.py
+# Returns the results from eval_gloss.evaluate_system
+def evaluate(features, stem_dict, crf, test_numbers):
+    def pick(name, numbers):
+        return _pick(features, name, numbers)
+
+    test_seg_lines = pick("seg_lines", test_numbers)
+    pred_y = run_system(pick("X", test_numbers), pick("y", test_numbers), test_seg_lines, crf, stem_dict)
+    pred_gloss_lines = add_back_OOL_words(pick("transcription_lines", test_numbers), reassemble_predicted_words([line.split() for line in test_seg_lines], pred_y))
+
+    # Now evaluate the predicted lines as eval_gloss.py would, with the OOL words taken back out
+    pred_gloss_lines = [" ".join(handle_OOL_words_in_line(line.split())[0]) for line in pred_gloss_lines]
+    pred_y = [gloss_line_to_morphemes(line, keep_word_boundaries = True) for line in pred_gloss_lines]
+    pred_y_no_stems = [deal_with_stems(line_features, gloss_line_to_morphemes(line))[0] for line_features, line in zip(pick("seg_line_features", test_numbers), pred_gloss_lines)]
+    pred_y_no_stems = add_word_boundaries_to_gloss(pred_y_no_stems, test_seg_lines)
+
+    return evaluate_system(pick("gold_y", test_numbers), pred_y, pred_y_no_stems, True, pick("seg_morphemes", test_numbers), stem_dict)
+
+def train_and_evaluate(features, train_numbers, test_numbers):
+    stem_dict, crf = train(features, train_numbers)
+    return evaluate(features, stem_dict, crf, test_numbers)
+
+def _set_sentence_features(features):
+    global _sentence_features
+    _sentence_features = features
+
+# Starts a pool of worker processes that each have the features, without sending them along with every task
+def start_workers(features, max_workers):
+    return ProcessPoolExecutor(max_workers = max_workers, initializer = _set_sentence_features, initargs = (features,))
+
+# In a worker process from start_workers, returns the features it was started with
+def get_worker_features():
+    return _sentence_features
+
+# Runs one fold in a worker process (without all of the printing that training and evaluation do)
+# Returns the fold, its results, and how long it took in seconds
+def _run_fold(fold, train_numbers, test_numbers):
+    start_time = perf_counter()
+    with redirect_stdout(io.StringIO()):
+        results = train_and_evaluate(_sentence_features, train_numbers, test_numbers)
+
+    return fold, results, perf_counter() - start_time
+
+# Runs every fold, up to max_parallel at a time, and returns the results and seconds for each one (in fold order)
+def cross_validate(features, folds, max_parallel = None):
+    sentence_count = len(features["X"])
+    fold_results = [None] * len(folds)
+    with start_workers(features, max_parallel or min(len(folds), cpu_count() or 1)) as executor:
+        futures = []
+        for fold, test_numbers in enumerate(folds):
+            test_set = set(test_numbers)
+            train_numbers = [i for i in range(sentence_count) if i not in test_set]
+            futures.append(executor.submit(_run_fold, fold, train_numbers, test_numbers))
+        for future in as_completed(futures):
+            fold, results, seconds = future.result()
+            fold_results[fold] = (results, seconds)
+            print(f"Fold {fold + 1} finished in {seconds:.1f} seconds: {', '.join(str(result) for result in results)}")
+
+    return fold_results
+
+# Returns the mean and the standard deviation of each result across the folds (or None, for results that none of the folds had)
+def summarize(fold_results):
+    means = []
+    standard_deviations = []
+    for i in range(len(fold_results[0][0])):
+        values = [float(results[i]) for results, seconds in fold_results if results[i] is not None]
+        means.append(round(mean(values), 2) if values else None)
+        standard_deviations.append(round(stdev(values), 2) if len(values) > 1 else None)
+
+    return means, standard_deviations
+
+def _format_results(results):
+    return ",".join("" if result is None else f"{float(result):.2f}%" for result in results)
+
+@click.command()
+@click.option("--data_file", "data_files", required = True, multiple = True, help = "A file of glossed sentences to include in the pool (e.g., data/train.txt).  Can be repeated.")
+@click.option("--folds", "fold_count", default = DEFAULT_FOLDS, show_default = True, help = "How many folds to split the pooled sentences into.")
+@click.option("--seed", default = 0, show_default = True, help = "The seed for shuffling the sentences before they're split.")
+@click.option("--max_parallel", type = int, help = "The most folds to run at once.  By default, as many as there are CPUs.")
+@click.option("--results_file", default = DEFAULT_RESULTS_FILE, show_default = True, help = "Where to write the results for each fold, and their mean and standard deviation.")
+@click.option("--segmentation_line_number", required = True, help = "The line that contains the segmented sentence.  For example if there are four lines each and the segmentation is the second line, this will be 2.")
+@click.option("--gloss_line_number", required = True, help = "The line that contains the glossed sentence.  For example if there are four lines each and the gloss is the third line, this will be 3.")
+def main(data_files, fold_count, seed, max_parallel, results_file, segmentation_line_number, gloss_line_number):
+    # Convert right away to prevent off-by-one errors
+    segmentation_line_number = int(segmentation_line_number) - 1
+    gloss_line_number = int(gloss_line_number) - 1
+
+    dataset = [sentence for data_file in data_files for sentence in read_file(data_file)]
+    start_time = perf_counter()
+    features = get_sentence_features(dataset, segmentation_line_number, gloss_line_number)
+    folds = split_into_folds(len(dataset), fold_count, seed)
+    print(f"\nRunning {fold_count} folds over {len(dataset)} sentences.")
+    fold_results = cross_validate(features, folds, max_parallel)
+    means, standard_deviations = summarize(fold_results)
+    seconds = perf_counter() - start_time
+
+    with open(results_file, "w") as file:
+        file.write(RESULTS_HEADER + "\n")
+        for fold, (results, fold_seconds) in enumerate(fold_results):
+            file.write(f"{fold + 1},{len(dataset) - len(folds[fold])},{len(folds[fold])},{round(fold_seconds, 2)},{_format_results(results)}\n")
+        file.write(f"Mean,,,,{_format_results(means)}\n")
+        file.write(f"Std Dev,,,,{_format_results(standard_deviations)}\n")
+
+    print("\n** Mean (standard deviation) across the folds: **")
+    for name, result_mean, standard_deviation in zip(OUTPUT_CSV_HEADER.split(","), means, standard_deviations):
+        if result_mean is None:
+            print(f"{name}: no results")
+        else:
+            print(f"{name}: {result_mean:.2f}%" + (f" ({standard_deviation:.2f})" if standard_deviation is not None else ""))
+    print(f"\nFinished in {seconds:.1f} seconds ({sum(fold_seconds for results, fold_seconds in fold_results):.1f} seconds across the folds).  Wrote the results to {results_file}.")
+
+if __name__ == '__main__':
+    main()
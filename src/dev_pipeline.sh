@@ -12,5 +12,6 @@ GLOSS_LINE_NUMBER=3 # 3 for Nɬeʔkepmxcín and St̓át̓imcets, 4 for Gitksan
 
 # The seg predictions used come from running the segmenter first
 # Now, run the glosser on those predictions
-python3 src/pipeline.py --seg_pred_file=$SEG_PREDICTIONS --gloss_train_file=$GLOSS_TRAIN_SET --gloss_dev_file=$GLOSS_DEV_SET --gloss_test_file=$GLOSS_TEST_SET --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER
+# Sentences already glossed in an earlier run (with the same seg prediction and glossing model) come from the cache
+python3 src/pipeline.py --seg_pred_file=$SEG_PREDICTIONS --gloss_train_file=$GLOSS_TRAIN_SET --gloss_dev_file=$GLOSS_DEV_SET --gloss_test_file=$GLOSS_TEST_SET --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER --gloss_cache_file=gloss_cache.db
 python3 src/eval_pipeline.py --test_file=$GLOSS_TEST_SET --output_file=$OUTPUT_FOLDER$OUTPUT_FILE --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER --train_input_file=$TRAIN_INPUT --test_input_file=$TEST_INPUT
@@ -13,5 +13,9 @@ for i in $(seq 1 1 $SEED_COUNT); do MODELS=$MODELS":models_seed"$i"/checkpoint"$
 echo "Using model(s): "$MODELS
 
 # To run on the unsegmenting baseline, set output_file=$INPUT and don't use the fairseq flag
-cat $INPUT | fairseq-interactive --path $MODELS data-bin > $OUTPUT
+# Each distinct word is only run through the ensemble once (the output still has every token, in order),
+# and words these checkpoints already segmented in an earlier run come from the cache
+python3 src/segment_words.py --input_file=$INPUT --output_file=$OUTPUT --models=$MODELS --data_dir=data-bin --cache_file=segmentation_cache.db
+# Or, to load the ensemble and segment in-process (no fairseq-interactive calls), replace both lines with:
+# python3 src/test_seg.py --whole_input_file=$WHOLE_INPUT --models=$MODELS --data_dir=data-bin --gold_output_file=$GOLD_OUTPUT --train_input_file=$TRAIN_INPUT --test_input_file=$INPUT
 python3 src/test_seg.py --whole_input_file=$WHOLE_INPUT --output_file=$OUTPUT --output_file_is_fairseq_formatted --gold_output_file=$GOLD_OUTPUT --train_input_file=$TRAIN_INPUT --test_input_file=$INPUT
\ No newline at end of file
@@ -1,7 +1,7 @@
 import click
 import json
 import re
-from gloss import add_word_boundaries_to_gloss, deal_with_stems, extract_X_and_y, gloss_line_to_morphemes, match_stem, seg_line_to_features, seg_line_to_morphemes
+from gloss import add_word_boundaries_to_gloss, deal_with_stems, extract_X_and_y, gloss_line_to_morphemes, index_stems, match_stem, seg_line_to_features, seg_line_to_morphemes
 from glossed_data_utilities import as_percent, handle_OOL_words, print_results_csv, read_file
 
 OUTPUT_CSV = "./gloss_results.csv"
@@ -122,6 +122,8 @@ def get_accuracy_by_stems_and_grams(interim_pred_y, pred_y, y, test_X, use_syste
     y_stems = []
     IV_pred_y_stems = []
     IV_y_stems = []
+    if stem_dict:
+        stem_index = index_stems(stem_dict)
 
     # Go sentence by sentence
     for input_sentence, sentence_without_stems, sentence_with_stems, gold_sentence in zip(test_X, interim_pred_y, pred_y, y):
@@ -143,7 +145,7 @@ def get_accuracy_by_stems_and_grams(interim_pred_y, pred_y, y, test_X, use_syste
                     if re.search(r'[a-z]', gold_gloss): # It's a stem
                         pred_y_stems.append(gloss_with_stems)
                         y_stems.append(gold_gloss)
-                        if stem_dict and match_stem(input_gloss, stem_dict): # It's an IV stem
+                        if stem_dict and match_stem(input_gloss, stem_dict, stem_index): # It's an IV stem
                             IV_pred_y_stems.append(gloss_with_stems)
                             IV_y_stems.append(gold_gloss)
                     else: # It's a gram
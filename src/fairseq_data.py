@@ -0,0 +1,154 @@
+# *** Writes binarized fairseq datasets directly from our word lists ***
+# This does what `fairseq-preprocess` (with its default settings, as in prepare_seg.sh) does for our char-level files:
+# the input and output dictionaries are built from the train set, and each set is written as an indexed binary dataset
+# (fairseq's "mmap" format) under the destination directory.  The data never has to be re-read from the text files.
+# Each line is one word, given as its list of space-separated "chars" (see preprocess_seg.space_chars).
+from array import array
+import click
+from collections import Counter
+from os import mkdir, path
+import struct
+import sys
+
+# fairseq's special symbols always come first in the dictionary, in this order
+SPECIAL_SYMBOLS = ["<s>", "<pad>", "</s>", "<unk>"]
+EOS_INDEX = 2
+UNK_INDEX = 3
+# fairseq pads the dictionary with made-up words until its size is a multiple of this
+DICTIONARY_PADDING_FACTOR = 8
+MADE_UP_WORD = "madeupword{:04d}"
+
+# Index file layout for the mmap dataset format (as fairseq's MMapIndexedDataset.Index reads it):
+# the header, the version (<Q), the dtype code (<B), the number of lines (<Q), then each line's size (int32)
+# and each line's byte offset in the .bin file (int64)
+INDEX_HEADER = b"MMIDIDX\x00\x00"
+INDEX_VERSION = 1
+# fairseq's codes for the dtype of the token ids in the .bin file
+UINT16_CODE = 8
+INT32_CODE = 4
+MAX_UINT16_VOCAB_SIZE = 65500
+
+# Returns the dictionary as a list of symbols, where each symbol's index is its id
+# Like fairseq, symbols are ordered by count (most frequent first), with ties in alphabetical order
+def build_dictionary(tokenized_lines):
+    counts = Counter()
+    for tokens in tokenized_lines:
+        counts.update(tokens)
+
+    symbols = SPECIAL_SYMBOLS + [symbol for symbol, count in sorted(counts.items(), key = lambda item: (-item[1], item[0])) if symbol not in SPECIAL_SYMBOLS]
+    made_up_word_count = 0
+    while len(symbols) % DICTIONARY_PADDING_FACTOR != 0:
+        symbols.append(MADE_UP_WORD.format(made_up_word_count))
+        made_up_word_count += 1
+
+    return symbols, counts
+
+# Writes the dictionary in fairseq's dict.*.txt format (one "symbol count" per line, without the special symbols)
+def write_dictionary(symbols, counts, file_path):
+    with open(file_path, "w") as file:
+        file.writelines(f"{symbol} {counts.get(symbol, 0)}\n" for symbol in symbols[len(SPECIAL_SYMBOLS):])
+
+# Reads a dict.*.txt file (e.g., one made for pre-training, like with fairseq-preprocess --srcdict)
+def read_dictionary(file_path):
+    symbols = list(SPECIAL_SYMBOLS)
+    counts = Counter()
+    with open(file_path) as file:
+        for line in file:
+            symbol, count = line.rstrip("\n").rsplit(" ", 1)
+            symbols.append(symbol)
+            counts[symbol] = int(count)
+
+    return symbols, counts
+
+# Writes one set (e.g., train.input-output.input) as a .bin file of token ids and a .idx file that indexes it
+# Each line ends with the end-of-sentence symbol, and unknown symbols get the <unk> id
+def write_indexed_dataset(tokenized_lines, symbols, file_prefix):
+    ids = {symbol: index for index, symbol in enumerate(symbols)}
+    if len(symbols) < MAX_UINT16_VOCAB_SIZE:
+        typecode, dtype_code = "H", UINT16_CODE
+    else:
+        typecode, dtype_code = "i", INT32_CODE
+
+    data = array(typecode)
+    sizes = array("i")
+    for tokens in tokenized_lines:
+        data.extend(ids.get(token, UNK_INDEX) for token in tokens)
+        data.append(EOS_INDEX)
+        sizes.append(len(tokens) + 1)
+
+    # Byte offset of each line in the .bin file
+    pointers = array("q", [0] * len(sizes))
+    for i in range(1, len(sizes)):
+        pointers[i] = pointers[i - 1] + sizes[i - 1] * data.itemsize
+
+    # fairseq reads these as little-endian
+    if sys.byteorder == "big":
+        for values in [data, sizes, pointers]:
+            values.byteswap()
+
+    with open(file_prefix + ".bin", "wb") as file:
+        data.tofile(file)
+    with open(file_prefix + ".idx", "wb") as file:
+        file.write(INDEX_HEADER)
+        file.write(struct.pack("<Q", INDEX_VERSION))
+        file.write(struct.pack("<B", dtype_code))
+        file.write(struct.pack("<Q", len(sizes)))
+        sizes.tofile(file)
+        pointers.tofile(file)
+
+# Writes everything fairseq-train needs into destdir
+# sets is a dict from set name ("train", "valid", or "test") to a pair of lists of tokenized lines (input, then output)
+def write_binarized_datasets(sets, destdir, source_lang = "input", target_lang = "output", srcdict = None, tgtdict = None):
+    if not path.exists(destdir):
+        mkdir(destdir)
+
+    train_X, train_y = sets["train"]
+    source_symbols, source_counts = read_dictionary(srcdict) if srcdict else build_dictionary(train_X)
+    target_symbols, target_counts = read_dictionary(tgtdict) if tgtdict else build_dictionary(train_y)
+    write_dictionary(source_symbols, source_counts, path.join(destdir, f"dict.{source_lang}.txt"))
+    write_dictionary(target_symbols, target_counts, path.join(destdir, f"dict.{target_lang}.txt"))
+
+    for set_name, (X, y) in sets.items():
+        write_indexed_dataset(X, source_symbols, path.join(destdir, f"{set_name}.{source_lang}-{target_lang}.{source_lang}"))
+        write_indexed_dataset(y, target_symbols, path.join(destdir, f"{set_name}.{source_lang}-{target_lang}.{target_lang}"))
+
+# Reads a dataset written by write_indexed_dataset (or fairseq-preprocess) back, the way fairseq's MMapIndexedDataset does
+# Returns the token ids of each line
+def read_indexed_dataset(file_prefix):
+    with open(file_prefix + ".idx", "rb") as file:
+        index = file.read()
+    assert index[:len(INDEX_HEADER)] == INDEX_HEADER, f"{file_prefix}.idx is not an mmap dataset index."
+    offset = len(INDEX_HEADER)
+    version, dtype_code, line_count = struct.unpack_from("<QBQ", index, offset)
+    assert version == INDEX_VERSION, f"{file_prefix}.idx has version {version}, not {INDEX_VERSION}."
+    offset += struct.calcsize("<QBQ")
+    sizes = struct.unpack_from(f"<{line_count}i", index, offset)
+    offset += 4 * line_count
+    pointers = struct.unpack_from(f"<{line_count}q", index, offset)
+    offset += 8 * line_count
+    assert offset == len(index), f"{file_prefix}.idx has {len(index) - offset} bytes after its pointers."
+
+    typecode = {UINT16_CODE: "H", INT32_CODE: "i"}[dtype_code]
+    data = array(typecode)
+    with open(file_prefix + ".bin", "rb") as file:
+        data.frombytes(file.read())
+    if sys.byteorder == "big":
+        data.byteswap()
+
+    return [list(data[pointer // data.itemsize : pointer // data.itemsize + size]) for pointer, size in zip(pointers, sizes)]
+
+# Prints the lines of a binarized dataset as the symbols they stand for (without the end-of-sentence symbol),
+# one line per line, to check them against the text file they were made from
+@click.command()
+@click.option("--dataset", required = True, help = "The prefix of the .idx and .bin files (e.g., data-bin/train.input-output.input).")
+@click.option("--dictionary", required = True, help = "The dictionary the dataset was written with (e.g., data-bin/dict.input.txt).")
+@click.option("--output_file", required = True, help = "Where to write the lines.")
+def main(dataset, dictionary, output_file):
+    symbols, counts = read_dictionary(dictionary)
+    with open(output_file, "w") as file:
+        for ids in read_indexed_dataset(dataset):
+            assert ids and ids[-1] == EOS_INDEX, f"A line in {dataset} doesn't end with the end-of-sentence symbol."
+            file.write(" ".join(symbols[id] for id in ids[:-1]) + "\n")
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,19 @@
 import click
+from collections import Counter
 import json
 from os import getcwd, mkdir, path
 import re
 import sklearn_crfsuite
-from unicodedata import normalize
-from glossed_data_utilities import add_back_OOL_words, as_percent, handle_OOL_words, read_file, write_sentences, OUT_OF_LANGUAGE_LABEL, UNICODE_STRESS
+from glossed_data_utilities import add_back_OOL_words, as_percent, generalize_token, handle_OOL_words, read_file, write_sentences, OUT_OF_LANGUAGE_LABEL
 from glossed_data_handling_utilities import gloss_line_to_morphemes, ignore_brackets, seg_line_to_morphemes, REGULAR_BOUNDARY, LEFT_INFIX_BOUNDARY, RIGHT_INFIX_BOUNDARY, LEFT_REDUP_INFIX_BOUNDARY, RIGHT_REDUP_INFIX_BOUNDARY, NON_INFIXING_BOUNDARIES, LANG_LABEL_SYMBOLS
 
 GOLD_OUTPUT_FILE_NAME = "gloss_gold.txt"
 ALL_BOUNDARIES_FOR_REGEX = "[<>\{\}\-=~]"
 LANG_IS_LABELED = False
+# The ways a CRFEnsemble can combine its CRFs' predictions
+VOTE = "vote"
+MARGINALS = "marginals"
+COMBINATIONS = [VOTE, MARGINALS]
 
 # Quick note: we are *always* removing brackets when glossing.
 # This is to handle the glossing style where unrealized morphemes/pieces of morphemes
@@ -173,6 +177,34 @@ def create_crf(train_X, train_y, max_iter, alg, min_freq, c2):
 
     return crf
 
+# Several CRFs that predict as one (with the same predict method as a single CRF), e.g. from gloss_ensemble.py
+# It's kept here so that a pickled glossing model with an ensemble can be loaded anywhere this module is
+class CRFEnsemble:
+    def __init__(self, crfs, combination = VOTE):
+        assert combination in COMBINATIONS, f"\n{combination} is not one of the ways to combine predictions: {', '.join(COMBINATIONS)}."
+        self.crfs = crfs
+        self.combination = combination
+
+    # Returns the predicted labels for each sentence (a list of morpheme features)
+    def predict(self, X):
+        if self.combination == VOTE:
+            member_predictions = [crf.predict(X) for crf in self.crfs]
+            # Ties go to whichever label the earliest member predicted
+            return [[Counter(labels).most_common(1)[0][0] for labels in zip(*sentence_predictions)] for sentence_predictions in zip(*member_predictions)]
+
+        member_marginals = [crf.predict_marginals(X) for crf in self.crfs]
+        predictions = []
+        for sentence_marginals in zip(*member_marginals):
+            sentence_predictions = []
+            for morpheme_marginals in zip(*sentence_marginals):
+                label_totals = Counter()
+                for marginals in morpheme_marginals:
+                    label_totals.update(marginals)
+                sentence_predictions.append(max(label_totals, key = label_totals.get))
+            predictions.append(sentence_predictions)
+
+        return predictions
+
 # No return value
 # This function makes the model and does hyperparameter tuning!
 def test_crf(train_X, train_y, dev_X, dev_y):
@@ -274,44 +306,35 @@ def deal_with_stems_helper(segmented_lines_as_features, gloss_lines):
 
 # Look for (some kind of) match for a given stem morpheme in our stem_dict
 # Returns None if no match found, otherwise returns the matching stem morpheme from the stem_dict
-def match_stem(morpheme, stem_dict):
-    match = None
-
+# When matching many morphemes against the same stem_dict, build its stem_index (see index_stems) once and pass it in
+def match_stem(morpheme, stem_dict, stem_index = None):
     # First, try for an exact match
     if morpheme in stem_dict:
-        match = morpheme
+        return morpheme
 
     # Otherwise -- try to find a close match
     # For now we will consider:
     # 1) e/ə ambiguity and 2) stress ambiguity
     # A simple way to do this: convert all ə to e and remove all stress, then check for equality
-    modified_morpheme = _generalize_morpheme(morpheme)
-
-    stems = list(stem_dict.keys())
-    stem_index = 0
-    # Loop until we find a match or run out of stems to consider
-    while match == None and stem_index < len(stem_dict):
-        stem = stems[stem_index]
-        modified_stem = _generalize_morpheme(stem)
-        if modified_morpheme == modified_stem:
-            match = stem
-        stem_index += 1
-
-    return match
+    if stem_index is None:
+        stem_index = index_stems(stem_dict)
 
-# Permits stress variation, and schwa vs. e variation
-def _generalize_morpheme(morpheme):
-    # Be able to handle NFC or NFD stress
-    modified_morpheme = normalize('NFD', morpheme)
-    modified_morpheme = modified_morpheme.replace(UNICODE_STRESS, "")
-    # Once stress is removed, NFD vs NFC makes no difference!
+    return stem_index.get(generalize_token(morpheme))
 
-    modified_morpheme = modified_morpheme.replace("ə", "e")
+# Maps the generalized form of each stem in the stem_dict to the stem
+# If several stems share a generalized form, the first one in the stem_dict is kept
+def index_stems(stem_dict):
+    stem_index = {}
+    for stem in stem_dict:
+        stem_index.setdefault(generalize_token(stem), stem)
 
-    return modified_morpheme
+    return stem_index
 
 # Returns the predicted glosses
-def gloss_stems(dev_X, interim_pred_dev_y, stem_dict):
+# As with match_stem, the stem_index can be passed in when the same stem_dict is used many times
+def gloss_stems(dev_X, interim_pred_dev_y, stem_dict, stem_index = None):
+    if stem_index is None:
+        stem_index = index_stems(stem_dict)
     pred_dev_y = []
     known_stem_count = 0
     unknown_stem_count = 0
@@ -322,7 +345,7 @@ def gloss_stems(dev_X, interim_pred_dev_y, stem_dict):
             # Look at everything the CRF identified as a stem
             if predicted_gloss == "STEM":
                 # Check for a match
-                match = match_stem(morpheme, stem_dict)
+                match = match_stem(morpheme, stem_dict, stem_index)
                 if match:
                     # We know this stem! Fill it in
                     predicted_gloss = stem_dict[match]
@@ -333,7 +356,8 @@ def gloss_stems(dev_X, interim_pred_dev_y, stem_dict):
         pred_dev_y.append(pred_glossed_sentence)
     
     total_stem_count = known_stem_count + unknown_stem_count
-    print(f"In the test set, {as_percent(unknown_stem_count/total_stem_count)}% ({unknown_stem_count}/{total_stem_count}) of morphemes *identified as stems* were not in the stem dictionary.")
+    if total_stem_count:
+        print(f"In the test set, {as_percent(unknown_stem_count/total_stem_count)}% ({unknown_stem_count}/{total_stem_count}) of morphemes *identified as stems* were not in the stem dictionary.")
     return pred_dev_y
 
 # Trains and returns the dictionary and the CRF!
@@ -349,12 +373,12 @@ def train_system(train_X, train_y):
 
 # Returns the glossed output pre- and post stem glossing,
 # plus the gold output, all with boundaries re-added
-def run_system(X, y, X_with_boundaries, crf, stem_dict):
+def run_system(X, y, X_with_boundaries, crf, stem_dict, stem_index = None):
     # Run the CRF model for bound morphemes
     interim_pred_y = run_crf(crf, X, y)
 
     # Take that prediction, and apply the stem dictionary to it
-    pred_y = gloss_stems(X, interim_pred_y, stem_dict)
+    pred_y = gloss_stems(X, interim_pred_y, stem_dict, stem_index)
 
     # Evaluate the overall result
     pred_y = add_word_boundaries_to_gloss(pred_y, X_with_boundaries)
@@ -520,6 +544,7 @@ def _is_y_token_OOL(y_token):
 def print_OOV_stem_proportion(test_X, test_y, stem_dict):
     stem_count = 0
     stem_OOV_count = 0
+    stem_index = index_stems(stem_dict)
 
     assert(len(test_X) == len(test_y))
     for X_sentence, y_sentence in zip(test_X, test_y):
@@ -529,7 +554,7 @@ def print_OOV_stem_proportion(test_X, test_y, stem_dict):
             # Check if it's a stem - defined as having 1+ lowercase letter in its gloss
             if re.search(r'[a-z]', morpheme_gloss):
                 # Now -- is this stem in the stem dictionary?
-                potential_match = match_stem(morpheme, stem_dict)
+                potential_match = match_stem(morpheme, stem_dict, stem_index)
                 if not potential_match:
                     stem_OOV_count += 1
                 stem_count += 1
@@ -0,0 +1,84 @@
+# *** A persistent store of predicted gloss lines, by sentence, for each glossing model ***
+# Kept in a local SQLite file (like segmentation_cache.py), so that when the pipeline is re-run
+# (e.g., with segmentations from a new checkpoint), only the sentences whose predicted segmentation line changed
+# have to be glossed again.
+# Each glossing model is identified by the data it was trained on (and the line numbers used), and by the code that trains it
+# and glosses with it, and is stored too, so it doesn't have to be retrained either.  A new model starts with no stored glosses.
+from hashlib import sha1
+from os import path
+import pickle
+import sqlite3
+
+DEFAULT_CACHE_FILE = "./gloss_cache.db"
+# The scripts whose code decides the model (its features and CRF settings) and the gloss lines it predicts
+# A change to any of them means a new model
+MODEL_SCRIPTS = ["gloss.py", "pipeline.py", "glossed_data_utilities.py", "glossed_data_handling_utilities.py"]
+# SQLite limits how many values can be passed to one query
+SENTENCES_PER_QUERY = 250
+
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS gloss_models (
+    model_id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL UNIQUE,
+    model BLOB
+);
+CREATE TABLE IF NOT EXISTS glosses (
+    model_id INTEGER NOT NULL REFERENCES gloss_models(model_id) ON DELETE CASCADE,
+    transcription_line TEXT NOT NULL,
+    segmentation_line TEXT NOT NULL,
+    gloss_line TEXT NOT NULL,
+    PRIMARY KEY (model_id, transcription_line, segmentation_line)
+);
+"""
+
+def connect(cache_file = DEFAULT_CACHE_FILE):
+    connection = sqlite3.connect(cache_file)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(CREATE_TABLES)
+    return connection
+
+def _update_with_file(fingerprint, file_path):
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            fingerprint.update(block)
+
+# Identifies a glossing model by the contents of its train file, which lines it was trained on, and the code in MODEL_SCRIPTS
+def get_fingerprint(train_file, segmentation_line_number, gloss_line_number):
+    fingerprint = sha1(f"{segmentation_line_number}\t{gloss_line_number}\n".encode())
+    for script in MODEL_SCRIPTS:
+        _update_with_file(fingerprint, path.join(path.dirname(path.abspath(__file__)), script))
+    _update_with_file(fingerprint, train_file)
+
+    return fingerprint.hexdigest()
+
+# Returns the id for the model with this fingerprint, and the model itself (or None, if it hasn't been stored yet)
+def get_model(connection, fingerprint):
+    existing = connection.execute("SELECT model_id, model FROM gloss_models WHERE fingerprint = ?", (fingerprint,)).fetchone()
+    if existing:
+        return existing[0], (pickle.loads(existing[1]) if existing[1] is not None else None)
+
+    with connection:
+        cursor = connection.execute("INSERT INTO gloss_models (fingerprint) VALUES (?)", (fingerprint,))
+
+    return cursor.lastrowid, None
+
+def store_model(connection, model_id, model):
+    with connection:
+        connection.execute("UPDATE gloss_models SET model = ? WHERE model_id = ?", (pickle.dumps(model), model_id))
+
+# Returns a dict from each (transcription line, segmentation line) pair that's stored for this model to its gloss line
+def look_up(connection, model_id, keys):
+    gloss_lines = {}
+    keys = list(dict.fromkeys(keys))
+    for start in range(0, len(keys), SENTENCES_PER_QUERY):
+        keys_to_query = keys[start : start + SENTENCES_PER_QUERY]
+        query = "SELECT transcription_line, segmentation_line, gloss_line FROM glosses WHERE model_id = ? AND (" + " OR ".join("(transcription_line = ? AND segmentation_line = ?)" for key in keys_to_query) + ")"
+        for transcription_line, segmentation_line, gloss_line in connection.execute(query, [model_id] + [line for key in keys_to_query for line in key]):
+            gloss_lines[(transcription_line, segmentation_line)] = gloss_line
+
+    return gloss_lines
+
+# Adds the gloss lines (a dict from (transcription line, segmentation line) to gloss line) for this model
+def store(connection, model_id, gloss_lines):
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO glosses (model_id, transcription_line, segmentation_line, gloss_line) VALUES (?, ?, ?, ?)", ((model_id, transcription_line, segmentation_line, gloss_line) for (transcription_line, segmentation_line), gloss_line in gloss_lines.items()))
@@ -0,0 +1,145 @@
+# *** An ensemble of glossing CRFs ***
+# gloss.py trains one CRF (with the online 'pa' algorithm, so the result depends on the order of the train sentences).
+# Here, several CRFs are trained side by side, each in its own process, on a differently shuffled (or bootstrapped) copy of
+# the train set, and their predictions for each morpheme are combined, either by majority vote or by summing each
+# CRF's marginal probabilities for every label.  Stems are still glossed with the stem dictionary from the whole train set.
+# The ensemble predicts like a single CRF (each member predicts the whole batch of sentences at once), so it can be used
+# anywhere the CRF is, e.g. saved with --model_file and used as stream_pipeline.py's --gloss_model_file.
+# With --benchmark, the single CRF and ensembles of 1 up to --size members (with each way of combining them) are all
+# evaluated on the test set, with how long each takes to predict, to show how much accuracy each added bit of latency buys.
+import click
+from contextlib import redirect_stdout
+import io
+from os import cpu_count
+import pickle
+from random import Random
+from time import perf_counter
+from cross_validate_gloss import evaluate, get_sentence_features, get_worker_features, start_workers, train
+from gloss import create_crf, deal_with_stems_helper, CRFEnsemble, COMBINATIONS, VOTE
+from glossed_data_utilities import read_file
+
+SHUFFLE = "shuffle"
+BOOTSTRAP = "bootstrap"
+RESAMPLINGS = [SHUFFLE, BOOTSTRAP]
+ALGORITHMS = ['lbfgs', 'l2sgd', 'ap', 'pa', 'arow']
+# The same settings as gloss.train_system
+ALGORITHM = 'pa'
+MAX_ITERATIONS = 50
+C2 = -1
+DEFAULT_SIZE = 5
+DEFAULT_MODEL_FILE = "gloss_ensemble.pkl"
+TIMING_REPEATS = 3
+BENCHMARK_HEADER = "Model,Members,Combination,Morpheme Acc,Word Acc,Predict Seconds,ms per Sentence,Acc Gain,Added ms per Sentence,Acc Gain per Added ms"
+
+# Returns the train sentence numbers for one member: all of them in a new order, or a bootstrap sample (drawn with replacement)
+def resample(train_numbers, resampling, seed, member):
+    random = Random(f"{seed}:{member}")
+    if resampling == BOOTSTRAP:
+        return [random.choice(train_numbers) for i in range(len(train_numbers))]
+
+    sample = list(train_numbers)
+    random.shuffle(sample)
+    return sample
+
+# Trains one member in a worker process, on its resampled train sentences
+def _train_member(sample, algorithm, max_iterations, c2):
+    features = get_worker_features()
+    train_X = [features["X"][i] for i in sample]
+    train_y_no_stems, stem_dict = deal_with_stems_helper(train_X, [features["y"][i] for i in sample])
+
+    return create_crf(train_X, train_y_no_stems, max_iterations, algorithm, 0, c2)
+
+# Trains the members in parallel (up to max_parallel at a time), and returns them in order
+def train_members(features, train_numbers, size, resampling, seed, algorithm = ALGORITHM, max_iterations = MAX_ITERATIONS, c2 = C2, max_parallel = None):
+    with start_workers(features, max_parallel or min(size, cpu_count() or 1)) as executor:
+        futures = [executor.submit(_train_member, resample(train_numbers, resampling, seed, member), algorithm, max_iterations, c2) for member in range(size)]
+        return [future.result() for future in futures]
+
+# Trains the whole glossing model, like gloss.train_system, but with an ensemble of CRFs
+# Returns the stem dictionary (from every train sentence) and the ensemble
+def train_ensemble_system(features, train_numbers, size, resampling, combination, seed, algorithm = ALGORITHM, max_iterations = MAX_ITERATIONS, c2 = C2, max_parallel = None):
+    train_y_no_stems, stem_dict = deal_with_stems_helper([features["X"][i] for i in train_numbers], [features["y"][i] for i in train_numbers])
+    crfs = train_members(features, train_numbers, size, resampling, seed, algorithm, max_iterations, c2, max_parallel)
+
+    return stem_dict, CRFEnsemble(crfs, combination)
+
+# Returns how long the model takes to predict every test sentence, in seconds (the fastest of TIMING_REPEATS tries)
+def time_prediction(model, test_X):
+    fastest = None
+    for i in range(TIMING_REPEATS):
+        start_time = perf_counter()
+        model.predict(test_X)
+        seconds = perf_counter() - start_time
+        fastest = seconds if fastest is None else min(fastest, seconds)
+
+    return fastest
+
+# Evaluates the single CRF (as trained by gloss.train_system) and ensembles of every size up to all of the members,
+# combined each way, and returns a row of BENCHMARK_HEADER for each
+def benchmark_models(features, train_numbers, test_numbers, stem_dict, crfs):
+    test_X = [features["X"][i] for i in test_numbers]
+    single_stem_dict, single_crf = train(features, train_numbers)
+    models = [("Single CRF", 1, "", single_crf)]
+    for size in range(1, len(crfs) + 1):
+        for combination in COMBINATIONS:
+            models.append(("Ensemble", size, combination, CRFEnsemble(crfs[:size], combination)))
+
+    rows = []
+    for name, size, combination, model in models:
+        results = evaluate(features, single_stem_dict if model is single_crf else stem_dict, model, test_numbers)
+        seconds = time_prediction(model, test_X)
+        ms_per_sentence = 1000 * seconds / len(test_numbers)
+        if model is single_crf:
+            base_accuracy = float(results[0])
+            base_ms_per_sentence = ms_per_sentence
+        accuracy_gain = float(results[0]) - base_accuracy
+        added_ms_per_sentence = ms_per_sentence - base_ms_per_sentence
+        gain_per_added_ms = round(accuracy_gain / added_ms_per_sentence, 2) if added_ms_per_sentence > 0 else ""
+        rows.append([name, size, combination, results[0], results[1], round(seconds, 3), round(ms_per_sentence, 3), round(accuracy_gain, 2), round(added_ms_per_sentence, 3), gain_per_added_ms])
+
+    return rows
+
+@click.command()
+@click.option("--train_file", required = True, help = "The name of the file containing all sentences in the train set.")
+@click.option("--test_file", help = "The name of the file containing all sentences in the test set (for --benchmark).")
+@click.option("--size", default = DEFAULT_SIZE, show_default = True, help = "How many CRFs to train.")
+@click.option("--resampling", type = click.Choice(RESAMPLINGS), default = SHUFFLE, show_default = True, help = "Train each CRF on the train set in a different order (shuffle), or on a sample of it drawn with replacement (bootstrap).")
+@click.option("--combination", type = click.Choice(COMBINATIONS), default = VOTE, show_default = True, help = "Combine the CRFs' predictions for each morpheme by majority vote, or by summing their marginal probabilities.")
+@click.option("--algorithm", type = click.Choice(ALGORITHMS), default = ALGORITHM, show_default = True, help = "The training algorithm for each CRF.")
+@click.option("--max_iterations", default = MAX_ITERATIONS, show_default = True, help = "The most training iterations for each CRF.")
+@click.option("--c2", type = float, default = C2, show_default = True, help = "The L2 regularization coefficient (only for lbfgs and l2sgd).")
+@click.option("--seed", default = 0, show_default = True, help = "The seed for resampling the train set.")
+@click.option("--max_parallel", type = int, help = "The most CRFs to train at once.  By default, as many as there are CPUs.")
+@click.option("--model_file", default = DEFAULT_MODEL_FILE, show_default = True, help = "Where to save the glossing model (the stem dictionary and the ensemble), in the same format as stream_pipeline.py's --gloss_model_file.")
+@click.option("--benchmark", is_flag = True, help = "Compare the accuracy and prediction time of the single CRF and of ensembles of each size on --test_file.")
+@click.option("--segmentation_line_number", required = True, help = "The line that contains the segmented sentence.  For example if there are four lines each and the segmentation is the second line, this will be 2.")
+@click.option("--gloss_line_number", required = True, help = "The line that contains the glossed sentence.  For example if there are four lines each and the gloss is the third line, this will be 3.")
+def main(train_file, test_file, size, resampling, combination, algorithm, max_iterations, c2, seed, max_parallel, model_file, benchmark, segmentation_line_number, gloss_line_number):
+    # Convert right away to prevent off-by-one errors
+    segmentation_line_number = int(segmentation_line_number) - 1
+    gloss_line_number = int(gloss_line_number) - 1
+    assert test_file or not benchmark, "--test_file is needed with --benchmark."
+
+    train = read_file(train_file)
+    test = read_file(test_file) if test_file else []
+    # The features are computed once, and shared by every member's training
+    features = get_sentence_features(train + test, segmentation_line_number, gloss_line_number)
+    train_numbers = list(range(len(train)))
+    test_numbers = list(range(len(train), len(train) + len(test)))
+
+    start_time = perf_counter()
+    stem_dict, ensemble = train_ensemble_system(features, train_numbers, size, resampling, combination, seed, algorithm, max_iterations, c2, max_parallel)
+    print(f"\nTrained {size} CRFs ({resampling}, {algorithm}) in {perf_counter() - start_time:.1f} seconds.")
+    with open(model_file, "wb") as file:
+        pickle.dump((stem_dict, ensemble), file)
+    print(f"Saved the glossing model to {model_file}.")
+
+    if benchmark:
+        with redirect_stdout(io.StringIO()):
+            rows = benchmark_models(features, train_numbers, test_numbers, stem_dict, ensemble.crfs)
+        print("\n" + BENCHMARK_HEADER)
+        for row in rows:
+            print(",".join(str(value) for value in row))
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,8 @@ RIGHT_INFIX_BOUNDARY = ">"
 LEFT_REDUP_INFIX_BOUNDARY = "{"
 RIGHT_REDUP_INFIX_BOUNDARY = "}"
 NON_INFIXING_BOUNDARIES = [REGULAR_BOUNDARY, REDUPLICATION_BOUNDARY, CLITIC_BOUNDARY]
+# Compiled once, since these splits run for every word in the corpus
+NON_INFIXING_BOUNDARY_REGEX = re.compile(r"[" + re.escape("".join(NON_INFIXING_BOUNDARIES)) + r"]")
 
 LANG_LABEL_SYMBOLS = ["&", "#"]
 LANG_LABEL_REGEX = r"[" + "".join(LANG_LABEL_SYMBOLS) + r"]"
@@ -34,7 +36,7 @@ def seg_line_to_morphemes(seg_line, do_ignore_brackets, keep_word_boundaries = F
 
     for word in seg_line.split(" "):
         # Grab the morphemes from this current word
-        morpheme_list += re.split(r"[" + re.escape("".join(NON_INFIXING_BOUNDARIES)) + r"]", word)
+        morpheme_list += NON_INFIXING_BOUNDARY_REGEX.split(word)
         # Infix marking requires special handling
         for i, morpheme in enumerate(morpheme_list):
             # Check for infixing
@@ -87,7 +89,7 @@ def gloss_line_to_morphemes(gloss_line, keep_word_boundaries = False):
         gloss_line = gloss_line.split()
         updated_gloss_line = []
         for word in gloss_line:
-            word = re.split(r"[" + re.escape("".join(NON_INFIXING_BOUNDARIES)) + r"]", word)
+            word = NON_INFIXING_BOUNDARY_REGEX.split(word)
             updated_gloss_line.append(word)
         gloss_line = updated_gloss_line
     else: # Just split the line into a list of morphemes, with no word structure maintained
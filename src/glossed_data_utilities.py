@@ -1,4 +1,6 @@
 # *** Common functions for creating train/dev/tests datasets ***
+from functools import lru_cache
+from itertools import product
 from os import mkdir, path
 from random import shuffle
 import re
@@ -13,7 +15,7 @@ PUNCTUATION_TO_IGNORE = "\.|,|\?|!|:"
 
 OUT_OF_LANGUAGE_MARKER = "*"
 OUT_OF_LANGUAGE_LABEL = "OOL"
-DOUBLE_OOL_MARKER_REGEX = "\*[\*]+"
+DOUBLE_OOL_MARKER_REGEX = re.compile("\*[\*]+")
 
 NUMBER_OF_LINES = 4
 UNICODE_COMMA_ABOVE = "\u0313"
@@ -77,45 +79,61 @@ def read_file(file_path):
 
     return(sentences)
 
+# Compiled once, since tidying runs these on every line of the corpus
+TRANSCRIPTION_SEG_PUNCTUATION_REGEX = re.compile(punctuation_list_to_regex(NON_PERMITTED_PUNCTUATION_TRANSCRIPTION_SEG))
+GLOSS_PUNCTUATION_REGEX = re.compile(punctuation_list_to_regex(NON_PERMITTED_PUNCTUATION_GLOSS))
+PUNCTUATION_AND_BRACKETS_REGEX = re.compile(punctuation_list_to_regex(NON_PERMITTED_PUNCTUATION_TRANSCRIPTION_SEG) + "|\[|\]")
+PUNCTUATION_TO_IGNORE_REGEX = re.compile(PUNCTUATION_TO_IGNORE)
+PROBLEMATIC_BOUNDARY_PUNCTUATION_REGEX = re.compile(r"[-=~][\.,\?\"“”`!♪;–]+")
+MULTIPLE_SPACES_REGEX = re.compile(r"[ ]+[ ]+")
+INITIAL_SPACE_REGEX = re.compile(r"^ ")
+FINAL_SPACE_REGEX = re.compile(r" $")
+
 # Takes a list of sentences, each of which is a list of transcription line, seg line, etc.
 # Returns the list in the same format, just tidied!
 def tidy_dataset(dataset, seg_line_number = 1, gloss_line_number = 2, MINIMAL_CHANGES_ONLY = False):
     updated_dataset = []
     for sentence in dataset:
-        updated_sentence = []
-        for i, line in enumerate(sentence):
-            # Handle transcription and seg line punc (question marks, periods, etc.)
-            if i == 0 or i == seg_line_number:
-                if MINIMAL_CHANGES_ONLY:
-                    # Handle some very problematic punc, without removing it all!
-                    line = re.sub(r"`` ", " ", line)
-                    line = re.sub(r"[-=~][\.,\?\"“”`!♪;–]+", "", line)
-                else: # Remove it all!
-                    line = re.sub(punctuation_list_to_regex(NON_PERMITTED_PUNCTUATION_TRANSCRIPTION_SEG), r"\1\2", line)
-            elif i == gloss_line_number:
-                line = re.sub(punctuation_list_to_regex(NON_PERMITTED_PUNCTUATION_GLOSS), "", line)
-            # Find 2+ spaces, and replace them with only one space
-            line = re.sub(r"[ ]+[ ]+", " ", line)
-            if not MINIMAL_CHANGES_ONLY:
-                # Find sentence-initial or -final spaces, and remove them
-                line = re.sub(r"^ ", "", line)
-                line = re.sub(r" $", "", line)
-
-            updated_sentence.append(line)
+        updated_sentence = [tidy_line(line, i, seg_line_number, gloss_line_number, MINIMAL_CHANGES_ONLY) for i, line in enumerate(sentence)]
         updated_dataset.append(updated_sentence)
-        updated_sentence = []
 
     return updated_dataset
 
+# Tidies one line, where i is its position in the sentence (which determines the punctuation handling)
+def tidy_line(line, i, seg_line_number = 1, gloss_line_number = 2, MINIMAL_CHANGES_ONLY = False):
+    # Handle transcription and seg line punc (question marks, periods, etc.)
+    if i == 0 or i == seg_line_number:
+        if MINIMAL_CHANGES_ONLY:
+            # Handle some very problematic punc, without removing it all!
+            line = line.replace("`` ", " ")
+            line = PROBLEMATIC_BOUNDARY_PUNCTUATION_REGEX.sub("", line)
+        else: # Remove it all!
+            line = TRANSCRIPTION_SEG_PUNCTUATION_REGEX.sub(r"\1\2", line)
+    elif i == gloss_line_number:
+        line = GLOSS_PUNCTUATION_REGEX.sub("", line)
+    # Find 2+ spaces, and replace them with only one space
+    line = MULTIPLE_SPACES_REGEX.sub(" ", line)
+    if not MINIMAL_CHANGES_ONLY:
+        # Find sentence-initial or -final spaces, and remove them
+        line = INITIAL_SPACE_REGEX.sub("", line)
+        line = FINAL_SPACE_REGEX.sub("", line)
+
+    return line
+
 # Remove the usual, plus brackets (we just want the morpheme!)
+# The results are cached, since clitic separation looks up the same words over and over
+# (but only for the most recently used words, so the cache doesn't grow with the corpus)
+REMOVE_PUNC_CACHE_SIZE = 2 ** 16
+@lru_cache(maxsize = REMOVE_PUNC_CACHE_SIZE)
 def _remove_punc(str):
-    return re.sub(punctuation_list_to_regex(NON_PERMITTED_PUNCTUATION_TRANSCRIPTION_SEG) + "|\[|\]", r"\1\2", str)
+    return PUNCTUATION_AND_BRACKETS_REGEX.sub(r"\1\2", str)
 
 # Fix the issue of clitics which are standalone in the orthographic line, but attached to a larger word in the segmentation and gloss lines
 # Solution: Make it standalone in the seg and gloss lines too (to prevent altering the orthographic line)
 # Note: This code has been modified to not be affected by rogue punctuation (via calls to _remove_punc)
 # so that you can still separate clitics in non-tidied data.
 def handle_clitics(data, pre_clitics, double_pre_clitics, post_clitics, double_post_clitics, seg_line_number = 1, gloss_line_number = 2):
+    clitic_tables = compile_clitic_tables(pre_clitics, double_pre_clitics, post_clitics, double_post_clitics)
     updated_data = []
     for example in data:
         ortho_line = example[0]
@@ -123,159 +141,10 @@ def handle_clitics(data, pre_clitics, double_pre_clitics, post_clitics, double_p
         gloss_line = example[gloss_line_number]
         # Grab all the words in the orthography line, so we can look for clitics as words there
         # Remove punctuation so it doesn't get in the way of looking for the particular clitic
-        ortho_line_word_list = (re.sub(PUNCTUATION_TO_IGNORE, "", ortho_line)).split()
+        ortho_line_word_list = (PUNCTUATION_TO_IGNORE_REGEX.sub("", ortho_line)).split()
         seg_line_word_list = seg_line.split()
         gloss_line_word_list = gloss_line.split()
-        # We're going to look word-by-word in the seg line
-        for seg_word_index, seg_word in enumerate(seg_line_word_list):
-            possibly_more_pre_clitics = True
-            possibly_more_post_clitics = True
-            while possibly_more_pre_clitics:
-                # SINGLE PROCLITIC CHECK
-                # Does the seg word start with a clitic from our list, connected with a '='?
-                clitic_check = seg_word.partition(CLITIC_BOUNDARY)
-                # If there was indeed an equals sign, and a proclitic before it
-                if clitic_check[1] != "" and _remove_punc(clitic_check[0]) in pre_clitics.keys():
-                    clitic = clitic_check[0]
-                    word_without_clitic = clitic_check[2]
-                    # Now: does that clitic appear as its own word in the orthographic line?
-                    # This check is quite strict -
-                    # It will prevent problems with the wrong word being looked at, but it's also going to (at present)
-                    # exclude a lot of problematic lines from being fixed. Something to think about...
-                    if len(ortho_line_word_list) > seg_word_index and _remove_punc(ortho_line_word_list[seg_word_index].lower()) in pre_clitics[_remove_punc(clitic)] and word_without_clitic != "":
-                        # Confirmed: we've found a clitic to fix!
-                        # Now we need to modify the seg and gloss lines
-                        assert len(seg_line_word_list) == len(gloss_line_word_list), f"Error: There are {len(seg_line_word_list)} words in the seg line, but {len(gloss_line_word_list)} words in the gloss line! \nSeg line word list: {seg_line_word_list}"
-
-                        # Replace the seg word with two words - leaving the clitic standalone
-                        seg_line_word_list.pop(seg_word_index)
-                        seg_line_word_list.insert(seg_word_index, clitic)
-                        seg_line_word_list.insert(seg_word_index + 1, word_without_clitic)
-
-                        # Replace the *gloss* word with two words - leaving the clitic standalone
-                        removed_gloss_word = gloss_line_word_list.pop(seg_word_index)
-                        removed_gloss_split = removed_gloss_word.partition(CLITIC_BOUNDARY)
-                        gloss_line_word_list.insert(seg_word_index, removed_gloss_split[0])
-                        gloss_line_word_list.insert(seg_word_index + 1, removed_gloss_split[2])
-
-                        # Update the current word and its position, for the sake of the while loop
-                        seg_word = word_without_clitic
-                        seg_word_index += 1
-                    else:
-                        possibly_more_pre_clitics = False
-
-                # DOUBLE PROCLITIC CHECK
-                # Repeat, but this time for the DOUBLE clitics
-                double_clitic_check = clitic_check[2].partition(CLITIC_BOUNDARY)
-                # Reassemble, around this SECOND equals sign
-                clitic_check = (clitic_check[0] + CLITIC_BOUNDARY + double_clitic_check[0], CLITIC_BOUNDARY, double_clitic_check[2])
-                if clitic_check[1] != "" and _remove_punc(clitic_check[0]) in double_pre_clitics.keys():
-                    clitic = clitic_check[0]
-                    word_without_clitic = clitic_check[2]
-                    # Now: does that clitic appear as its own word in the orthographic line?
-                    # This check is quite strict -
-                    # It will prevent problems with the wrong word being looked at, but it's also going to (at present)
-                    # exclude a lot of problematic lines from being fixed. Something to think about...
-                    if len(ortho_line_word_list) > seg_word_index and _remove_punc(ortho_line_word_list[seg_word_index]) in double_pre_clitics[_remove_punc(clitic)] and word_without_clitic != "":
-                        # Okay, now we need to modify the seg and gloss lines
-                        assert len(seg_line_word_list) == len(gloss_line_word_list), f"Error: There are {len(seg_line_word_list)} words in the seg line, but {len(gloss_line_word_list)} words in the gloss line! \nSeg line word list: {seg_line_word_list}"
-
-                        # Replace this word in the list with two words, separating the clitic
-                        seg_line_word_list.pop(seg_word_index)
-                        seg_line_word_list.insert(seg_word_index, clitic)
-                        seg_line_word_list.insert(seg_word_index + 1, word_without_clitic)
-
-                        # Split the gloss
-                        removed_gloss_word = gloss_line_word_list.pop(seg_word_index)
-                        removed_gloss_split = removed_gloss_word.partition(CLITIC_BOUNDARY)
-                        double_removed_gloss_split = removed_gloss_split[2].partition(CLITIC_BOUNDARY)
-                        removed_gloss_split = (removed_gloss_split[0] + CLITIC_BOUNDARY + double_removed_gloss_split[0], CLITIC_BOUNDARY, double_removed_gloss_split[2])
-                        gloss_line_word_list.insert(seg_word_index, removed_gloss_split[0])
-                        gloss_line_word_list.insert(seg_word_index + 1, removed_gloss_split[2])
-
-                        # Update the current word and its position, for the sake of the while loop
-                        seg_word = word_without_clitic
-                        seg_word_index += 1
-
-                    else:
-                        possibly_more_pre_clitics = False
-                else:
-                    possibly_more_pre_clitics = False
-
-            # Now that we've dealt with initial clitics, check for final clitics
-            while possibly_more_post_clitics:
-                # SINGLE ENCLITIC CHECK
-                # Does the word end with a clitic from our list, connected with a '='?
-                clitic_check = seg_word.rpartition(CLITIC_BOUNDARY) # rpartition starts from the end of the word
-                # If there was an equals sign, and a clitic after it
-                potential_clitic_original_form = clitic_check[2]
-                potential_clitic = re.sub(PUNCTUATION_TO_IGNORE, "", potential_clitic_original_form)
-                if clitic_check[1] != "" and _remove_punc(potential_clitic) in post_clitics.keys():
-                    clitic = potential_clitic
-                    clitic_original_form = potential_clitic_original_form
-                    word_without_clitic = clitic_check[0]
-                    # Now: does that clitic appear as its own word in the orthographic line?
-                    if _clitic_in_word_list(post_clitics[_remove_punc(clitic)], ortho_line_word_list) and word_without_clitic != "":
-                        # Okay, now we need to modify the seg and gloss lines
-                        assert len(seg_line_word_list) == len(gloss_line_word_list), f"Error: There are {len(seg_line_word_list)} words in the seg line, but {len(gloss_line_word_list)} words in the gloss line! \nSeg line word list: {seg_line_word_list}"
-
-                        # Replace this word in the list with two words, separating the clitic
-                        seg_line_word_list.pop(seg_word_index)
-                        seg_line_word_list.insert(seg_word_index, word_without_clitic)
-                        seg_line_word_list.insert(seg_word_index + 1, clitic_original_form)
-
-                        # Split the gloss
-                        removed_gloss_word = gloss_line_word_list.pop(seg_word_index)
-                        removed_gloss_split = removed_gloss_word.rpartition(CLITIC_BOUNDARY)
-                        gloss_line_word_list.insert(seg_word_index, removed_gloss_split[0])
-                        gloss_line_word_list.insert(seg_word_index + 1, removed_gloss_split[2])
-
-                        # Update the current word, for the sake of the while loop
-                        seg_word = word_without_clitic
-
-                    else:
-                        possibly_more_post_clitics = False
-                else:
-                    possibly_more_post_clitics = False
-
-                # DOUBLE ENCLITIC CHECK
-                # Now let's check for double post clitics - literally done for THREE examples... oh well
-                # I've fully separated this from the regular post clitic check because they don't need to
-                # interact at this point, and it's simpler this way
-                clitic_check = seg_word.rpartition(CLITIC_BOUNDARY)
-                second_clitic = clitic_check[2]
-                clitic_check = clitic_check[0].rpartition(CLITIC_BOUNDARY)
-                first_clitic = clitic_check[2]
-                potential_double_clitic_original_form = first_clitic + CLITIC_BOUNDARY + second_clitic
-                potential_double_clitic = re.sub(PUNCTUATION_TO_IGNORE, "", potential_double_clitic_original_form)
-                # Does this segmented word end in a double clitic?
-                if clitic_check[1] != "" and _remove_punc(potential_double_clitic) in double_post_clitics.keys():
-                    clitic = potential_double_clitic
-                    clitic_original_form = potential_double_clitic_original_form
-                    word_without_clitic = clitic_check[0]
-                    # Now: does that clitic appear as its own word in the orthographic line?
-                    if _clitic_in_word_list(double_post_clitics[_remove_punc(clitic)], ortho_line_word_list) and word_without_clitic != "":
-                        assert len(seg_line_word_list) == len(gloss_line_word_list), f"Error: There are {len(seg_line_word_list)} words in the seg line, but {len(gloss_line_word_list)} words in the gloss line! \nSeg line word list: {seg_line_word_list}"
-
-                        # Replace this word in the list with two words, separating the clitic
-                        seg_line_word_list.pop(seg_word_index)
-                        seg_line_word_list.insert(seg_word_index, word_without_clitic)
-                        seg_line_word_list.insert(seg_word_index + 1, clitic_original_form)
-
-                        # Split the gloss
-                        removed_gloss_word = gloss_line_word_list.pop(seg_word_index)
-                        removed_gloss_split = removed_gloss_word.rpartition(CLITIC_BOUNDARY)
-                        second_clitic_gloss = removed_gloss_split[2]
-                        removed_gloss_split = removed_gloss_split[0].rpartition(CLITIC_BOUNDARY)
-                        first_clitic_gloss = removed_gloss_split[2]
-                        # Stuff before the double clitic
-                        gloss_line_word_list.insert(seg_word_index, removed_gloss_split[0])
-                        # The double clitic
-                        gloss_line_word_list.insert(seg_word_index + 1, first_clitic_gloss + CLITIC_BOUNDARY + second_clitic_gloss)
-
-                        # Update the current word, for the sake of the while loop
-                        # (We're already at the end of the loop here, but for consistency)
-                        seg_word = word_without_clitic
+        separate_clitics(ortho_line_word_list, seg_line_word_list, gloss_line_word_list, clitic_tables)
 
         # Reassemble the modified lines
         seg_line = " ".join(seg_line_word_list)
@@ -287,28 +156,171 @@ def handle_clitics(data, pre_clitics, double_pre_clitics, post_clitics, double_p
 
     return updated_data
 
-# Compare without worrying about accents, because stress can be inconsistenly marked between orthog/seg
-def _same_clitic(clitic_1, clitic_2):
-    clitic_1 = re.sub("á", "a", clitic_1)
-    clitic_2 = re.sub("á", "a", clitic_2)
-    clitic_1 = re.sub("ú", "u", clitic_1)
-    clitic_2 = re.sub("ú", "u", clitic_2)
+# Turns the clitic lists (each a dict from the clitic to its possible forms in the orthographic line) into lookup tables,
+# so they only have to be prepared once per dataset
+# The enclitic forms are stored without stress (see _fold_clitic), so they can be compared directly with the orthographic words
+def compile_clitic_tables(pre_clitics, double_pre_clitics, post_clitics, double_post_clitics):
+    pre_clitic_table = {clitic: set(forms) for clitic, forms in pre_clitics.items()}
+    double_pre_clitic_table = {clitic: set(forms) for clitic, forms in double_pre_clitics.items()}
+    post_clitic_table = {clitic: {_fold_clitic(form) for form in forms} for clitic, forms in post_clitics.items()}
+    double_post_clitic_table = {clitic: {_fold_clitic(form) for form in forms} for clitic, forms in double_post_clitics.items()}
+
+    return pre_clitic_table, double_pre_clitic_table, post_clitic_table, double_post_clitic_table
+
+# Does the clitic separation for one sentence, given as word lists
+# (the orthography words should already have PUNCTUATION_TO_IGNORE removed)
+# clitic_tables comes from compile_clitic_tables
+# The seg and gloss word lists are updated in place
+def separate_clitics(ortho_line_word_list, seg_line_word_list, gloss_line_word_list, clitic_tables):
+    # Without any clitic boundaries, there's nothing to separate
+    if not any(CLITIC_BOUNDARY in seg_word for seg_word in seg_line_word_list):
+        return
+
+    pre_clitics, double_pre_clitics, post_clitics, double_post_clitics = clitic_tables
+    # The orthographic words, as they're compared against enclitics
+    folded_ortho_words = {_fold_clitic(_remove_punc(word)) for word in ortho_line_word_list}
+
+    # We're going to look word-by-word in the seg line
+    for seg_word_index, seg_word in enumerate(seg_line_word_list):
+        possibly_more_pre_clitics = True
+        possibly_more_post_clitics = True
+        while possibly_more_pre_clitics:
+            # SINGLE PROCLITIC CHECK
+            # Does the seg word start with a clitic from our list, connected with a '='?
+            clitic_check = seg_word.partition(CLITIC_BOUNDARY)
+            # If there was indeed an equals sign, and a proclitic before it
+            if clitic_check[1] != "" and _remove_punc(clitic_check[0]) in pre_clitics.keys():
+                clitic = clitic_check[0]
+                word_without_clitic = clitic_check[2]
+                # Now: does that clitic appear as its own word in the orthographic line?
+                # This check is quite strict -
+                # It will prevent problems with the wrong word being looked at, but it's also going to (at present)
+                # exclude a lot of problematic lines from being fixed. Something to think about...
+                if len(ortho_line_word_list) > seg_word_index and _remove_punc(ortho_line_word_list[seg_word_index].lower()) in pre_clitics[_remove_punc(clitic)] and word_without_clitic != "":
+                    # Confirmed: we've found a clitic to fix!
+                    # Now we need to modify the seg and gloss lines
+                    assert len(seg_line_word_list) == len(gloss_line_word_list), f"Error: There are {len(seg_line_word_list)} words in the seg line, but {len(gloss_line_word_list)} words in the gloss line! \nSeg line word list: {seg_line_word_list}"
+
+                    # Replace the seg word with two words - leaving the clitic standalone
+                    seg_line_word_list[seg_word_index : seg_word_index + 1] = [clitic, word_without_clitic]
+
+                    # Replace the *gloss* word with two words - leaving the clitic standalone
+                    removed_gloss_split = gloss_line_word_list[seg_word_index].partition(CLITIC_BOUNDARY)
+                    gloss_line_word_list[seg_word_index : seg_word_index + 1] = [removed_gloss_split[0], removed_gloss_split[2]]
+
+                    # Update the current word and its position, for the sake of the while loop
+                    seg_word = word_without_clitic
+                    seg_word_index += 1
+                else:
+                    possibly_more_pre_clitics = False
 
-    return clitic_1 == clitic_2
+            # DOUBLE PROCLITIC CHECK
+            # Repeat, but this time for the DOUBLE clitics
+            double_clitic_check = clitic_check[2].partition(CLITIC_BOUNDARY)
+            # Reassemble, around this SECOND equals sign
+            clitic_check = (clitic_check[0] + CLITIC_BOUNDARY + double_clitic_check[0], CLITIC_BOUNDARY, double_clitic_check[2])
+            if clitic_check[1] != "" and _remove_punc(clitic_check[0]) in double_pre_clitics.keys():
+                clitic = clitic_check[0]
+                word_without_clitic = clitic_check[2]
+                # Now: does that clitic appear as its own word in the orthographic line?
+                # This check is quite strict -
+                # It will prevent problems with the wrong word being looked at, but it's also going to (at present)
+                # exclude a lot of problematic lines from being fixed. Something to think about...
+                if len(ortho_line_word_list) > seg_word_index and _remove_punc(ortho_line_word_list[seg_word_index]) in double_pre_clitics[_remove_punc(clitic)] and word_without_clitic != "":
+                    # Okay, now we need to modify the seg and gloss lines
+                    assert len(seg_line_word_list) == len(gloss_line_word_list), f"Error: There are {len(seg_line_word_list)} words in the seg line, but {len(gloss_line_word_list)} words in the gloss line! \nSeg line word list: {seg_line_word_list}"
+
+                    # Replace this word in the list with two words, separating the clitic
+                    seg_line_word_list[seg_word_index : seg_word_index + 1] = [clitic, word_without_clitic]
+
+                    # Split the gloss
+                    removed_gloss_split = gloss_line_word_list[seg_word_index].partition(CLITIC_BOUNDARY)
+                    double_removed_gloss_split = removed_gloss_split[2].partition(CLITIC_BOUNDARY)
+                    removed_gloss_split = (removed_gloss_split[0] + CLITIC_BOUNDARY + double_removed_gloss_split[0], CLITIC_BOUNDARY, double_removed_gloss_split[2])
+                    gloss_line_word_list[seg_word_index : seg_word_index + 1] = [removed_gloss_split[0], removed_gloss_split[2]]
+
+                    # Update the current word and its position, for the sake of the while loop
+                    seg_word = word_without_clitic
+                    seg_word_index += 1
 
-def _clitic_in_word_list(clitic_forms, word_list):
-    found = False
-    for clitic_form in clitic_forms:
-        for word in word_list:
-            if _same_clitic(clitic_form, _remove_punc(word)):
-                found = True
+                else:
+                    possibly_more_pre_clitics = False
+            else:
+                possibly_more_pre_clitics = False
+
+        # Now that we've dealt with initial clitics, check for final clitics
+        while possibly_more_post_clitics:
+            # SINGLE ENCLITIC CHECK
+            # Does the word end with a clitic from our list, connected with a '='?
+            clitic_check = seg_word.rpartition(CLITIC_BOUNDARY) # rpartition starts from the end of the word
+            # If there was an equals sign, and a clitic after it
+            potential_clitic_original_form = clitic_check[2]
+            potential_clitic = PUNCTUATION_TO_IGNORE_REGEX.sub("", potential_clitic_original_form)
+            if clitic_check[1] != "" and _remove_punc(potential_clitic) in post_clitics.keys():
+                clitic = potential_clitic
+                clitic_original_form = potential_clitic_original_form
+                word_without_clitic = clitic_check[0]
+                # Now: does that clitic appear as its own word in the orthographic line?
+                if not post_clitics[_remove_punc(clitic)].isdisjoint(folded_ortho_words) and word_without_clitic != "":
+                    # Okay, now we need to modify the seg and gloss lines
+                    assert len(seg_line_word_list) == len(gloss_line_word_list), f"Error: There are {len(seg_line_word_list)} words in the seg line, but {len(gloss_line_word_list)} words in the gloss line! \nSeg line word list: {seg_line_word_list}"
+
+                    # Replace this word in the list with two words, separating the clitic
+                    seg_line_word_list[seg_word_index : seg_word_index + 1] = [word_without_clitic, clitic_original_form]
+
+                    # Split the gloss
+                    removed_gloss_split = gloss_line_word_list[seg_word_index].rpartition(CLITIC_BOUNDARY)
+                    gloss_line_word_list[seg_word_index : seg_word_index + 1] = [removed_gloss_split[0], removed_gloss_split[2]]
+
+                    # Update the current word, for the sake of the while loop
+                    seg_word = word_without_clitic
 
-    return found
+                else:
+                    possibly_more_post_clitics = False
+            else:
+                possibly_more_post_clitics = False
+
+            # DOUBLE ENCLITIC CHECK
+            # Now let's check for double post clitics - literally done for THREE examples... oh well
+            # I've fully separated this from the regular post clitic check because they don't need to
+            # interact at this point, and it's simpler this way
+            clitic_check = seg_word.rpartition(CLITIC_BOUNDARY)
+            second_clitic = clitic_check[2]
+            clitic_check = clitic_check[0].rpartition(CLITIC_BOUNDARY)
+            first_clitic = clitic_check[2]
+            potential_double_clitic_original_form = first_clitic + CLITIC_BOUNDARY + second_clitic
+            potential_double_clitic = PUNCTUATION_TO_IGNORE_REGEX.sub("", potential_double_clitic_original_form)
+            # Does this segmented word end in a double clitic?
+            if clitic_check[1] != "" and _remove_punc(potential_double_clitic) in double_post_clitics.keys():
+                clitic = potential_double_clitic
+                clitic_original_form = potential_double_clitic_original_form
+                word_without_clitic = clitic_check[0]
+                # Now: does that clitic appear as its own word in the orthographic line?
+                if not double_post_clitics[_remove_punc(clitic)].isdisjoint(folded_ortho_words) and word_without_clitic != "":
+                    assert len(seg_line_word_list) == len(gloss_line_word_list), f"Error: There are {len(seg_line_word_list)} words in the seg line, but {len(gloss_line_word_list)} words in the gloss line! \nSeg line word list: {seg_line_word_list}"
+
+                    # Replace this word in the list with two words, separating the clitic
+                    seg_line_word_list[seg_word_index : seg_word_index + 1] = [word_without_clitic, clitic_original_form]
+
+                    # Split the gloss
+                    removed_gloss_split = gloss_line_word_list[seg_word_index].rpartition(CLITIC_BOUNDARY)
+                    second_clitic_gloss = removed_gloss_split[2]
+                    removed_gloss_split = removed_gloss_split[0].rpartition(CLITIC_BOUNDARY)
+                    first_clitic_gloss = removed_gloss_split[2]
+                    # Stuff before the double clitic, then the double clitic
+                    gloss_line_word_list[seg_word_index : seg_word_index + 1] = [removed_gloss_split[0], first_clitic_gloss + CLITIC_BOUNDARY + second_clitic_gloss]
+
+                    # Update the current word, for the sake of the while loop
+                    # (We're already at the end of the loop here, but for consistency)
+                    seg_word = word_without_clitic
+
+# Remove accents, so clitics can be compared without worrying about them
+# (stress can be inconsistenly marked between orthog/seg)
+def _fold_clitic(clitic):
+    return clitic.replace("á", "a").replace("ú", "u")
 
 def mark_OOL_words(data, OOL_WORDS, LINES_PER_SENTENCE):
-    OOL_WORDS_CASE_INSENSITIVE = OOL_WORDS.copy()
-    for word in OOL_WORDS:
-        OOL_WORDS_CASE_INSENSITIVE.append(word.lower())
+    OOL_WORDS_CASE_INSENSITIVE = get_OOL_words_case_insensitive(OOL_WORDS)
 
     for example in data:
         # Only consider full examples
@@ -316,28 +328,43 @@ def mark_OOL_words(data, OOL_WORDS, LINES_PER_SENTENCE):
             transcription_words = example[0].split()
             seg_words = example[1].split()
             gloss_words = example[2].split()
-                # Go word-by-word through the sentence
-            for word_index, (transciption_word, seg_word, gloss_word) in enumerate(zip(transcription_words, seg_words, gloss_words)):
-                # Check for any of the target words
-                if transciption_word in OOL_WORDS_CASE_INSENSITIVE:
-                    word = transciption_word
-                    # Next check this word is identical in the seg and gloss lines, too
-                    # Do a case-insensitive check!
-                    if seg_word.lower() == word.lower() and gloss_word.lower() == word.lower():
-                        # Mark the word in the transcription, segmentation, and gloss lines
-                        transcription_words[word_index] = OUT_OF_LANGUAGE_MARKER + word
-                        seg_words[word_index] = OUT_OF_LANGUAGE_MARKER + seg_word
-                        gloss_words[word_index] = OUT_OF_LANGUAGE_MARKER + gloss_word
-
+            mark_OOL_words_in_sentence(transcription_words, seg_words, gloss_words, OOL_WORDS_CASE_INSENSITIVE)
             example[0] = " ".join(transcription_words)
             example[1] = " ".join(seg_words)
             example[2] = " ".join(gloss_words)
-            for i in range(0, 3):
-                # Prevent double OOL markers
-                example[i] = re.sub(DOUBLE_OOL_MARKER_REGEX, OUT_OF_LANGUAGE_MARKER, example[i])
 
     return data
 
+# Returns a set (for fast lookups) of the OOL words, plus their lowercase versions
+def get_OOL_words_case_insensitive(OOL_WORDS):
+    OOL_WORDS_CASE_INSENSITIVE = set(OOL_WORDS)
+    for word in OOL_WORDS:
+        OOL_WORDS_CASE_INSENSITIVE.add(word.lower())
+
+    return OOL_WORDS_CASE_INSENSITIVE
+
+# Does the marking for one sentence, given as word lists (which are updated in place)
+def mark_OOL_words_in_sentence(transcription_words, seg_words, gloss_words, OOL_WORDS_CASE_INSENSITIVE):
+    # Go word-by-word through the sentence
+    for word_index, (transciption_word, seg_word, gloss_word) in enumerate(zip(transcription_words, seg_words, gloss_words)):
+        # Check for any of the target words
+        if transciption_word in OOL_WORDS_CASE_INSENSITIVE:
+            word = transciption_word
+            # Next check this word is identical in the seg and gloss lines, too
+            # Do a case-insensitive check!
+            if seg_word.lower() == word.lower() and gloss_word.lower() == word.lower():
+                # Mark the word in the transcription, segmentation, and gloss lines
+                transcription_words[word_index] = OUT_OF_LANGUAGE_MARKER + word
+                seg_words[word_index] = OUT_OF_LANGUAGE_MARKER + seg_word
+                gloss_words[word_index] = OUT_OF_LANGUAGE_MARKER + gloss_word
+
+    for words in [transcription_words, seg_words, gloss_words]:
+        for word_index, word in enumerate(words):
+            # Prevent double OOL markers
+            # (Runs of markers never cross a space, so doing this word-by-word is the same as line-by-line)
+            if OUT_OF_LANGUAGE_MARKER + OUT_OF_LANGUAGE_MARKER in word:
+                words[word_index] = DOUBLE_OOL_MARKER_REGEX.sub(OUT_OF_LANGUAGE_MARKER, word)
+
 # Matches any words that are marked as OOL (e.g., "*Mary" OR "OOL")
 # Can replace with "OOL" or just delete (does the latter by default)
 def handle_OOL_words(datasets, replace = False):
@@ -348,23 +375,8 @@ def handle_OOL_words(datasets, replace = False):
         for example in dataset:
             updated_example = []
             for line in example:
-                words = line.split()
-                updated_words = words.copy()
-                word_number = 0
-                # Go word-by-word, and remove any marked with an asterisk
-                # We are looping with while because the number of words can *change* if we remove any!
-                # If replace = True, replace the asterisked words with a generic label
-                while word_number < len(updated_words):
-                    word = updated_words[word_number]
-                    if word.startswith(OUT_OF_LANGUAGE_MARKER) or word == OUT_OF_LANGUAGE_LABEL:
-                        OOL_count += 1
-                        updated_words.pop(word_number)
-                        if not replace:
-                            word_number -= 1 # To cancel out the incrementation
-                        else: # Replace!
-                            updated_words.insert(word_number, OUT_OF_LANGUAGE_LABEL)
-                    word_number += 1
-
+                updated_words, line_OOL_count = handle_OOL_words_in_line(line.split(), replace)
+                OOL_count += line_OOL_count
                 updated_line = " ".join(updated_words)
                 updated_example.append(updated_line)
             updated_dataset.append(updated_example)
@@ -377,6 +389,23 @@ def handle_OOL_words(datasets, replace = False):
 
     return updated_datasets
 
+def is_OOL_word(word):
+    return word.startswith(OUT_OF_LANGUAGE_MARKER) or word == OUT_OF_LANGUAGE_LABEL
+
+# Does the OOL handling for one line, given as a list of words (which isn't modified)
+# Removes any words marked with an asterisk (or already replaced with the label),
+# or if replace = True, replaces them with a generic label
+# Returns the updated list of words, and the number of OOL words found
+def handle_OOL_words_in_line(words, replace = False):
+    if replace:
+        updated_words = [OUT_OF_LANGUAGE_LABEL if is_OOL_word(word) else word for word in words]
+        OOL_count = updated_words.count(OUT_OF_LANGUAGE_LABEL)
+    else:
+        updated_words = [word for word in words if not is_OOL_word(word)]
+        OOL_count = len(words) - len(updated_words)
+
+    return updated_words, OOL_count
+
 # We have a list of predicted lines, each of which is a list of words
 # Go through the input lines to know where to add back in OOL words, then convert the whole line to a string for printing
 def add_back_OOL_words(transcription_lines, predicted_lines):
@@ -384,18 +413,22 @@ def add_back_OOL_words(transcription_lines, predicted_lines):
 
     # But also, add back in words marked as OOL.
     for transcription_line, predicted_line in zip(transcription_lines, predicted_lines):
-        updated_predicted_line = predicted_line
-        # Add back any asterisk-marked words
+        updated_predicted_line = []
+        predicted_words = iter(predicted_line)
+        # Add back any asterisk-marked words, at the same position they had in the input
+        # (or at the end, if the predicted line is too short to reach that position)
         for index, input_word in enumerate(transcription_line.split()):
             if input_word.startswith(OUT_OF_LANGUAGE_MARKER):
-                updated_predicted_line.insert(index, input_word)
+                while len(updated_predicted_line) < index:
+                    predicted_word = next(predicted_words, None)
+                    if predicted_word is None:
+                        break
+                    updated_predicted_line.append(predicted_word)
+                updated_predicted_line.append(input_word)
+        updated_predicted_line.extend(predicted_words)
 
         # Remove any instances of the OOL label, if used
-        while OUT_OF_LANGUAGE_LABEL in updated_predicted_line:
-            OOL_pos = updated_predicted_line.index(OUT_OF_LANGUAGE_LABEL)
-            updated_predicted_line.pop(OOL_pos)
-
-        updated_predicted_line = " ".join(updated_predicted_line)
+        updated_predicted_line = " ".join(word for word in updated_predicted_line if word != OUT_OF_LANGUAGE_LABEL)
         # Update our progress through the predicted word list
         updated_predicted_lines.append(updated_predicted_line)
 
@@ -429,6 +462,32 @@ def write_sentences(examples, file_path, randomize_order = False):
         file.close()
     print(f"{total_token_count} tokens were printed.")
 
+# Normalized views of tokens (words or morphemes)
+# Each token is normalized once, and its NFD form, stress-free form, and generalized form
+# (stress-free, with ə as e, for matching stems) are stored together and reused from then on
+# Only the most recently used tokens are kept, so the cache doesn't grow with the corpus
+NORMALIZED_VIEWS_CACHE_SIZE = 2 ** 16
+
+@lru_cache(maxsize = NORMALIZED_VIEWS_CACHE_SIZE)
+def get_normalized_view(token):
+    # Converting to split chars/diacritics means we don't have to handle both input styles
+    NFD_form = normalize('NFD', token)
+    unstressed_form = NFD_form.replace(UNICODE_STRESS, "")
+    # Once stress is removed, NFD vs NFC makes no difference!
+    generalized_form = unstressed_form.replace("ə", "e")
+
+    return (NFD_form, unstressed_form, generalized_form)
+
+def to_NFD(token):
+    return get_normalized_view(token)[0]
+
+def remove_stress(token):
+    return get_normalized_view(token)[1]
+
+# Permits stress variation, and schwa vs. e variation
+def generalize_token(token):
+    return get_normalized_view(token)[2]
+
 # Problem: a word has stress marked in one of the transcription or segmented lines, but not the other
 # Sol'n: add stress in the right spot to the word in the other line!
 def fix_inconsistent_stress(examples, num_lines = 4, transcription_line_number = 0, seg_line_number = 1, maintain_NFC_unicode = False):
@@ -439,76 +498,7 @@ def fix_inconsistent_stress(examples, num_lines = 4, transcription_line_number =
 
         # Only look at proper 4-line glossed lines
         if len(example) == num_lines:
-
-            # Convert to split chars/diacritics so we don't have to handle both input styles
-            transcription_line = normalize('NFD', example[transcription_line_number])
-            seg_line = normalize('NFD', example[seg_line_number])
-
-            # This is wrong -- won't split infixes properly
-            BOUNDARIES_OR_SPACE_REGEX = "-|=|~|<|>|{|}| "
-            seg_morphemes = re.split(BOUNDARIES_OR_SPACE_REGEX, seg_line)
-            transcription_line_unstressed = transcription_line.replace(UNICODE_STRESS, "")
-            seg_line_unstressed = seg_line.replace(UNICODE_STRESS, "")
-
-            for i, morpheme in enumerate(seg_morphemes):
-                # Check for stress in the seg line that's missing in the transcription line
-                if UNICODE_STRESS in morpheme:
-                    morpheme_unstressed = morpheme.replace(UNICODE_STRESS, "")
-                    # Have to use regex because we want to search for "example" without getting a match from "examplé" because the diacritic is considered the following character
-                    # Regex: Do we find the unstressed morpheme in the transcription line (followed by either a) a char that is NOT the stress marker or b) nothing)?
-                    unstressed_morpheme_is_in_transcription_line_with_stress = re.search(_prepare_string_brackets_for_regex(morpheme_unstressed) + "([^" + UNICODE_STRESS + "]|$)", _prepare_string_brackets_for_regex(transcription_line))
-                    # If we're missing the corresponding stress in the transcription line...
-                    if (transcription_line.count(morpheme) < seg_line.count(morpheme)) and unstressed_morpheme_is_in_transcription_line_with_stress:
-                        # ...then add the stress to the transcription line!
-                        if transcription_line.count(morpheme_unstressed) == 1: # Easy case -- only one possible target for changing
-                            transcription_line = transcription_line.replace(morpheme_unstressed, morpheme, 1)
-                        elif transcription_line_unstressed.count(morpheme_unstressed) == seg_line_unstressed.count(morpheme_unstressed): # Slightly more complex case
-                            # This is the xth instance of this morpheme in the seg line. Solve for x.
-                            prev_seg_line_unstressed = (" ".join(seg_morphemes[:i])).replace(UNICODE_STRESS, "")
-                            instances_to_skip = prev_seg_line_unstressed.count(morpheme_unstressed)
-                            starting_point = 0
-                            for j in range(instances_to_skip): # Should never run if x = 0
-                                next_unstressed_instance_pos = transcription_line.find(morpheme_unstressed, starting_point)
-                                next_stressed_instance_pos = transcription_line.find(morpheme, starting_point)
-                                assert((next_unstressed_instance_pos != -1) or (next_stressed_instance_pos != -1)) # at least one instance was found
-                                if next_unstressed_instance_pos == -1:
-                                    starting_point = next_stressed_instance_pos + len(morpheme)
-                                elif next_stressed_instance_pos == -1:
-                                    starting_point = next_unstressed_instance_pos + len(morpheme_unstressed)
-                                # Both have values
-                                elif next_stressed_instance_pos < next_unstressed_instance_pos:
-                                    starting_point = next_stressed_instance_pos + len(morpheme)
-                                else:
-                                    starting_point = next_unstressed_instance_pos + len(morpheme_unstressed)
-
-                            morpheme_pos = transcription_line.find(morpheme_unstressed, starting_point)
-                            assert(morpheme_pos != -1)
-                            transcription_line = transcription_line[:morpheme_pos] + morpheme + transcription_line[morpheme_pos + len(morpheme_unstressed):]
-
-                # Check for stress in the transcription line that's missing in the seg line
-                else:
-                    # Does the morpheme only appear in the transcription line *with stress*?
-                    # First check: do we find the unstressed version in the transcription line?
-                    # Have to use regex because we want to search for "example" without getting a match from "examplé" because the diacritic is considered the following character
-                    # Regex: Do we find the unstressed morpheme in the transcription line (followed by either a) a char that is NOT the stress marker or b) nothing)?
-                    morpheme_is_in_transcription_line_with_stress = re.search(_prepare_string_brackets_for_regex(morpheme) + "([^" + UNICODE_STRESS + "]|$)", _prepare_string_brackets_for_regex(transcription_line))
-                    # If we're missing the corresponding stress in the seg line...
-                    # (The last condition here is ridiculous but necessary to not over-fix in some erroenous data).
-                    if (not (morpheme_is_in_transcription_line_with_stress)) and (morpheme in transcription_line_unstressed) and (transcription_line_unstressed.count(morpheme) >= seg_line_unstressed.count(morpheme)):
-                        if seg_line.count(morpheme) == 1: # Don't do anything if there's multiple possible targets.
-                            # Find the stressed version of the morpheme in the transcription line
-                            for transcription_word in transcription_line.split():
-                                if len(transcription_word) >= len(morpheme) + 1: # +1 because stress adds a char
-                                    for starting_index in range(len(transcription_word) - (len(morpheme))):
-                                        possible_morpheme = transcription_word[starting_index : (starting_index + len(morpheme) + 1)]
-                                        if possible_morpheme.replace(UNICODE_STRESS, "") == morpheme:
-                                            # ...then add the stress to the seg line!
-                                            seg_line = seg_line.replace(morpheme, possible_morpheme)
-                                            seg_morphemes[i] == possible_morpheme # To keep this loop updated
-
-            if maintain_NFC_unicode:
-                transcription_line = normalize('NFC', transcription_line)
-                seg_line = normalize('NFC', seg_line)
+            transcription_line, seg_line = fix_inconsistent_stress_in_lines(example[transcription_line_number], example[seg_line_number], maintain_NFC_unicode)
             updated_example[transcription_line_number] = transcription_line
             updated_example[seg_line_number] = seg_line
 
@@ -516,6 +506,81 @@ def fix_inconsistent_stress(examples, num_lines = 4, transcription_line_number =
 
     return updated_examples
 
+# Does the stress fixing for one sentence's transcription and seg lines
+# Returns the two updated lines
+def fix_inconsistent_stress_in_lines(transcription_line, seg_line, maintain_NFC_unicode = False):
+    # Convert to split chars/diacritics so we don't have to handle both input styles
+    transcription_line = normalize('NFD', transcription_line)
+    seg_line = normalize('NFD', seg_line)
+
+    # This is wrong -- won't split infixes properly
+    BOUNDARIES_OR_SPACE_REGEX = "-|=|~|<|>|{|}| "
+    seg_morphemes = re.split(BOUNDARIES_OR_SPACE_REGEX, seg_line)
+    transcription_line_unstressed = transcription_line.replace(UNICODE_STRESS, "")
+    seg_line_unstressed = seg_line.replace(UNICODE_STRESS, "")
+
+    for i, morpheme in enumerate(seg_morphemes):
+        # Check for stress in the seg line that's missing in the transcription line
+        if UNICODE_STRESS in morpheme:
+            morpheme_unstressed = morpheme.replace(UNICODE_STRESS, "")
+            # Have to use regex because we want to search for "example" without getting a match from "examplé" because the diacritic is considered the following character
+            # Regex: Do we find the unstressed morpheme in the transcription line (followed by either a) a char that is NOT the stress marker or b) nothing)?
+            unstressed_morpheme_is_in_transcription_line_with_stress = re.search(_prepare_string_brackets_for_regex(morpheme_unstressed) + "([^" + UNICODE_STRESS + "]|$)", _prepare_string_brackets_for_regex(transcription_line))
+            # If we're missing the corresponding stress in the transcription line...
+            if (transcription_line.count(morpheme) < seg_line.count(morpheme)) and unstressed_morpheme_is_in_transcription_line_with_stress:
+                # ...then add the stress to the transcription line!
+                if transcription_line.count(morpheme_unstressed) == 1: # Easy case -- only one possible target for changing
+                    transcription_line = transcription_line.replace(morpheme_unstressed, morpheme, 1)
+                elif transcription_line_unstressed.count(morpheme_unstressed) == seg_line_unstressed.count(morpheme_unstressed): # Slightly more complex case
+                    # This is the xth instance of this morpheme in the seg line. Solve for x.
+                    prev_seg_line_unstressed = (" ".join(seg_morphemes[:i])).replace(UNICODE_STRESS, "")
+                    instances_to_skip = prev_seg_line_unstressed.count(morpheme_unstressed)
+                    starting_point = 0
+                    for j in range(instances_to_skip): # Should never run if x = 0
+                        next_unstressed_instance_pos = transcription_line.find(morpheme_unstressed, starting_point)
+                        next_stressed_instance_pos = transcription_line.find(morpheme, starting_point)
+                        assert((next_unstressed_instance_pos != -1) or (next_stressed_instance_pos != -1)) # at least one instance was found
+                        if next_unstressed_instance_pos == -1:
+                            starting_point = next_stressed_instance_pos + len(morpheme)
+                        elif next_stressed_instance_pos == -1:
+                            starting_point = next_unstressed_instance_pos + len(morpheme_unstressed)
+                        # Both have values
+                        elif next_stressed_instance_pos < next_unstressed_instance_pos:
+                            starting_point = next_stressed_instance_pos + len(morpheme)
+                        else:
+                            starting_point = next_unstressed_instance_pos + len(morpheme_unstressed)
+
+                    morpheme_pos = transcription_line.find(morpheme_unstressed, starting_point)
+                    assert(morpheme_pos != -1)
+                    transcription_line = transcription_line[:morpheme_pos] + morpheme + transcription_line[morpheme_pos + len(morpheme_unstressed):]
+
+        # Check for stress in the transcription line that's missing in the seg line
+        else:
+            # Does the morpheme only appear in the transcription line *with stress*?
+            # First check: do we find the unstressed version in the transcription line?
+            # Have to use regex because we want to search for "example" without getting a match from "examplé" because the diacritic is considered the following character
+            # Regex: Do we find the unstressed morpheme in the transcription line (followed by either a) a char that is NOT the stress marker or b) nothing)?
+            morpheme_is_in_transcription_line_with_stress = re.search(_prepare_string_brackets_for_regex(morpheme) + "([^" + UNICODE_STRESS + "]|$)", _prepare_string_brackets_for_regex(transcription_line))
+            # If we're missing the corresponding stress in the seg line...
+            # (The last condition here is ridiculous but necessary to not over-fix in some erroenous data).
+            if (not (morpheme_is_in_transcription_line_with_stress)) and (morpheme in transcription_line_unstressed) and (transcription_line_unstressed.count(morpheme) >= seg_line_unstressed.count(morpheme)):
+                if seg_line.count(morpheme) == 1: # Don't do anything if there's multiple possible targets.
+                    # Find the stressed version of the morpheme in the transcription line
+                    for transcription_word in transcription_line.split():
+                        if len(transcription_word) >= len(morpheme) + 1: # +1 because stress adds a char
+                            for starting_index in range(len(transcription_word) - (len(morpheme))):
+                                possible_morpheme = transcription_word[starting_index : (starting_index + len(morpheme) + 1)]
+                                if possible_morpheme.replace(UNICODE_STRESS, "") == morpheme:
+                                    # ...then add the stress to the seg line!
+                                    seg_line = seg_line.replace(morpheme, possible_morpheme)
+                                    seg_morphemes[i] == possible_morpheme # To keep this loop updated
+
+    if maintain_NFC_unicode:
+        transcription_line = normalize('NFC', transcription_line)
+        seg_line = normalize('NFC', seg_line)
+
+    return transcription_line, seg_line
+
 # Temporary bracket replacement stuff to prevent them from being read as regex chars
 def _prepare_string_brackets_for_regex(string):
      return re.sub(r"(\[|\])", r"\\\1", string)
@@ -547,10 +612,11 @@ def as_percent(number):
     return '{:.2f}'.format(round(number * 100, 2))
 
 # Orthography converter
-def van_Eijk_to_NAPA(target_string):
-    RIGHT_SINGLE_QUOTATION_MARK = "\u2019" #’
+RIGHT_SINGLE_QUOTATION_MARK = "\u2019" #’
+# Orthography conversions are done in order, and the order matters (e.g., c -> x has to happen before ts -> c)
+ORTHOGRAPHY_CONVERSIONS = {
                    # General letter conversions
-    conversions = [["7", "ʔ"], ["t'", "ƛ̓"], ["c", "x"], ["ts", "c"],["r", "γ"], ["g", "ʕ"], ["lh", "ɬ"],
+    "van_Eijk_to_NAPA": [["7", "ʔ"], ["t'", "ƛ̓"], ["c", "x"], ["ts", "c"],["r", "γ"], ["g", "ʕ"], ["lh", "ɬ"],
                    # Labialized letters
                    ["kw", "kʷ"], ["k'w", "k̓ʷ"], ["qw", "qʷ"], ["q'w", "q̓ʷ"], ["xw", "xʷ"],
                    # Glottalized letters
@@ -558,9 +624,62 @@ def van_Eijk_to_NAPA(target_string):
                    # This apostrophe is used for glottalization in our Se data, but not the St'
                    [RIGHT_SINGLE_QUOTATION_MARK, UNICODE_COMMA_ABOVE],
                    # Retracted letters
-                   [UNICODE_UNDERLINE, UNICODE_UNDERDOT]]
-
+                   [UNICODE_UNDERLINE, UNICODE_UNDERDOT]],
+                   # The reverse, which undoes the above (glottalization always comes back as an apostrophe)
+                   # ƛ̓ has to go before the other glottalized letters, and c -> ts before x -> c
+    "NAPA_to_van_Eijk": [["ƛ̓", "t'"], [UNICODE_COMMA_ABOVE, "'"], ["ʷ", "w"], ["ɬ", "lh"], ["ʕ", "g"], ["γ", "r"], ["c", "ts"], ["x", "c"], ["ʔ", "7"],
+                   [UNICODE_UNDERDOT, UNICODE_UNDERLINE]]
+}
+# Filled in by get_compiled_conversions, the first time each direction is used
+COMPILED_ORTHOGRAPHY_CONVERSIONS = {}
+
+# Applies each conversion to the whole string, one after the other
+def apply_conversions_sequentially(target_string, conversions):
     for conversion_pair in conversions:
         target_string = target_string.replace(conversion_pair[0], conversion_pair[1])
 
     return target_string
+
+# Turns a list of conversions into a regex and a lookup table, so that strings can be converted in one scan
+# (instead of one pass per conversion) with exactly the same result as applying the conversions in order.
+# The table holds every string of (up to the longest conversion's length) characters from the conversions
+# that can't already be converted correctly with shorter entries.  For example, the van Eijk to NAPA table
+# maps "ts'" to "c̓", since ts -> c happens before c' -> c̓.
+def compile_conversions(conversions):
+    alphabet = sorted(set("".join(conversion_pair[0] for conversion_pair in conversions)))
+    max_length = max(len(conversion_pair[0]) for conversion_pair in conversions)
+    table = {}
+    regex = None
+    for length in range(1, max_length + 1):
+        new_entries = {}
+        for characters in product(alphabet, repeat = length):
+            candidate = "".join(characters)
+            converted = apply_conversions_sequentially(candidate, conversions)
+            if convert_with_table(candidate, regex, table) != converted:
+                new_entries[candidate] = converted
+        table.update(new_entries)
+        # Longest first, so that e.g. "k'w" is matched instead of "k'"
+        regex = re.compile("|".join(re.escape(source) for source in sorted(table, key = len, reverse = True)))
+
+    return regex, table
+
+def convert_with_table(target_string, regex, table):
+    if not table:
+        return target_string
+    return regex.sub(lambda match: table[match.group()], target_string)
+
+def get_compiled_conversions(direction):
+    if direction not in COMPILED_ORTHOGRAPHY_CONVERSIONS:
+        COMPILED_ORTHOGRAPHY_CONVERSIONS[direction] = compile_conversions(ORTHOGRAPHY_CONVERSIONS[direction])
+    return COMPILED_ORTHOGRAPHY_CONVERSIONS[direction]
+
+# direction is one of the keys of ORTHOGRAPHY_CONVERSIONS
+def convert_orthography(target_string, direction):
+    regex, table = get_compiled_conversions(direction)
+    return convert_with_table(target_string, regex, table)
+
+def van_Eijk_to_NAPA(target_string):
+    return convert_orthography(target_string, "van_Eijk_to_NAPA")
+
+def NAPA_to_van_Eijk(target_string):
+    return convert_orthography(target_string, "NAPA_to_van_Eijk")
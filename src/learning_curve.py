@@ -0,0 +1,85 @@
+# *** Glossing accuracy as a function of how much training data there is ***
+# Trains the glossing model (gloss.train_system) on growing subsets of the train set, e.g. 5%, 10%, 25%, 50% and 100%,
+# and evaluates each one on the same test set, to help plan how much more data is worth annotating.
+# The subsets are nested: the train sentences are shuffled once (with --seed), and each subset is the first part of that order
+# (so the 10% subset has all of the 5% subset's sentences, and so on).  Within a subset, the sentences keep their order in the file.
+# The points are trained in parallel, each in its own process, using features that are computed once for every sentence
+# (see cross_validate_gloss.py).  Each point's results, with how long its training took, are added to the results file
+# with glossed_data_utilities.print_results_csv (like eval_gloss.py does with gloss_results.csv).
+import click
+from contextlib import redirect_stdout
+import io
+from math import ceil
+from os import cpu_count
+from random import Random
+from time import perf_counter
+from cross_validate_gloss import evaluate, get_sentence_features, get_worker_features, start_workers, train
+from eval_gloss import NO_RESULTS_MARKER, OUTPUT_CSV_HEADER
+from glossed_data_utilities import print_results_csv, read_file
+
+DEFAULT_PERCENTAGES = [5, 10, 25, 50, 100]
+DEFAULT_RESULTS_FILE = "./learning_curve.csv"
+RESULTS_HEADER = "Train %,Train Sentences,Train Morphemes,Training Seconds," + OUTPUT_CSV_HEADER
+
+# Returns the train sentence numbers for each percentage, as nested subsets
+def get_nested_subsets(train_count, percentages, seed):
+    order = list(range(train_count))
+    Random(seed).shuffle(order)
+    subsets = []
+    for percentage in percentages:
+        assert 0 < percentage <= 100, f"\n{percentage}% is not a percentage of the train set that can be trained on."
+        subsets.append(sorted(order[:max(1, ceil(train_count * percentage / 100))]))
+
+    return subsets
+
+# Trains and evaluates one point of the curve in a worker process (without all of the printing that training and evaluation do)
+# Returns the point, how long training took in seconds, and the results
+def _run_point(point, train_numbers, test_numbers):
+    features = get_worker_features()
+    with redirect_stdout(io.StringIO()):
+        start_time = perf_counter()
+        stem_dict, crf = train(features, train_numbers)
+        training_seconds = perf_counter() - start_time
+        results = evaluate(features, stem_dict, crf, test_numbers)
+
+    return point, training_seconds, results
+
+@click.command()
+@click.option("--train_file", required = True, help = "The name of the file containing all sentences in the train set.")
+@click.option("--test_file", required = True, help = "The name of the file containing the sentences to evaluate each point on (e.g., data/dev.txt).")
+@click.option("--percentage", "percentages", type = float, multiple = True, default = DEFAULT_PERCENTAGES, show_default = True, help = "A percentage of the train set to train on.  Can be repeated.")
+@click.option("--seed", default = 0, show_default = True, help = "The seed for shuffling the train sentences before the subsets are taken.")
+@click.option("--max_parallel", type = int, help = "The most points to train at once.  By default, as many as there are CPUs.")
+@click.option("--results_file", default = DEFAULT_RESULTS_FILE, show_default = True, help = "The CSV file to add each point's results to.")
+@click.option("--segmentation_line_number", required = True, help = "The line that contains the segmented sentence.  For example if there are four lines each and the segmentation is the second line, this will be 2.")
+@click.option("--gloss_line_number", required = True, help = "The line that contains the glossed sentence.  For example if there are four lines each and the gloss is the third line, this will be 3.")
+def main(train_file, test_file, percentages, seed, max_parallel, results_file, segmentation_line_number, gloss_line_number):
+    # Convert right away to prevent off-by-one errors
+    segmentation_line_number = int(segmentation_line_number) - 1
+    gloss_line_number = int(gloss_line_number) - 1
+
+    train = read_file(train_file)
+    test = read_file(test_file)
+    start_time = perf_counter()
+    features = get_sentence_features(train + test, segmentation_line_number, gloss_line_number)
+    percentages = sorted(set(int(percentage) if percentage.is_integer() else percentage for percentage in percentages))
+    subsets = get_nested_subsets(len(train), percentages, seed)
+    test_numbers = list(range(len(train), len(train) + len(test)))
+
+    print(f"\nTraining on {len(percentages)} subsets of {len(train)} sentences, and evaluating on {len(test)} sentences.")
+    point_results = [None] * len(percentages)
+    with start_workers(features, max_parallel or min(len(percentages), cpu_count() or 1)) as executor:
+        # The biggest subsets take the longest, so they go first
+        futures = [executor.submit(_run_point, point, subsets[point], test_numbers) for point in reversed(range(len(percentages)))]
+        for future in futures:
+            point, training_seconds, results = future.result()
+            point_results[point] = (training_seconds, results)
+            print(f"{percentages[point]:g}% ({len(subsets[point])} sentences): trained in {training_seconds:.1f} seconds, {results[0]}% morpheme accuracy.")
+
+    for point, (training_seconds, results) in enumerate(point_results):
+        morpheme_count = sum(len(features["y"][i]) for i in subsets[point])
+        print_results_csv([percentages[point], len(subsets[point]), morpheme_count, round(training_seconds, 2)] + results, RESULTS_HEADER, results_file, NO_RESULTS_MARKER)
+    print(f"\nFinished in {perf_counter() - start_time:.1f} seconds.  Added the results to {results_file}.")
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,9 @@ import re
 from gloss import extract_X_and_y, format_X_and_y, make_sentence_list_with_prediction, read_datasets, reassemble_predicted_words, run_system, train_system, write_output_file
 from glossed_data_handling_utilities import REGULAR_BOUNDARY, REDUPLICATION_BOUNDARY, LEFT_INFIX_BOUNDARY, RIGHT_INFIX_BOUNDARY, LEFT_REDUP_INFIX_BOUNDARY, RIGHT_REDUP_INFIX_BOUNDARY
 from glossed_data_utilities import add_back_OOL_words, handle_OOL_words, read_file
+import gloss_cache
 from prescreen_data import DOUBLE_BOUNDARY_REGEX
+from test_seg import predictions_to_sentences, read_fairseq_predictions
 
 GOLD_OUTPUT_FILE_NAME = "pipeline_gold.txt"
 PRED_OUTPUT_FILE_NAME = "pipeline_pred.txt"
@@ -43,14 +45,46 @@ def remove_boundary_errors(seg_line_list):
 
     return updated_seg_line_list
 
+# Trains the glossing model (the stem dictionary and the CRF) on the train set
+def train_gloss_model(train, segmentation_line_number, gloss_line_number):
+    # Replace OOL words with "OOL" for now, but after feature generation the formatting code will remove these tokens altogether
+    train = handle_OOL_words([train], replace = True)[0]
+    train_X, train_y = extract_X_and_y(train, segmentation_line_number, gloss_line_number)
+    train_X, train_y = format_X_and_y(train_X, train_y)
+    throwaway, stem_dict, crf = train_system(train_X, train_y)
+
+    return stem_dict, crf
+
+# Glosses the test sentences (which have the *predicted* seg lines), returning the predicted gloss lines
+# seg_output is the same sentences as output by the segmentation step, whose transcription lines are used to add back OOL words
+def gloss_sentences(test, seg_output, gloss_model, segmentation_line_number, gloss_line_number):
+    stem_dict, crf = gloss_model
+    # Replace them with "OOL" for now, but after feature generation the formatting code will remove these tokens altogether
+    test = handle_OOL_words([test], replace = True)[0]
+
+    test_X, test_y = extract_X_and_y(test, segmentation_line_number, gloss_line_number)
+
+    # Keep versions with boundaries (but no OOL tokens!) for word-by-word evaluation
+    test_without_OOL = handle_OOL_words([test])[0]
+    test_X_with_boundaries, throwaway  = extract_X_and_y(test_without_OOL, segmentation_line_number, gloss_line_number)
+
+    # Now we can format the input and output for glossing
+    test_X, test_y = format_X_and_y(test_X, test_y)
+    pred_y = run_system(test_X, test_y, test_X_with_boundaries, crf, stem_dict)
+
+    # Add back OOl words to our predicted gloss lines (using untouched transcription lines)
+    return add_back_OOL_words(list(sentence[0] for sentence in seg_output), reassemble_predicted_words([line.split() for line in test_X_with_boundaries], pred_y))
+
 @click.command()
 @click.option("--seg_pred_file", help = "The name of the predicted file from the segmentation process.")
+@click.option("--seg_fairseq_output_file", help = "Instead of --seg_pred_file, read the segmenter's predictions straight from its fairseq output (e.g., generated_data/test_fairseq.output).")
 @click.option("--gloss_train_file", help = "The name of the file containing all sentences in the train set.")
 @click.option("--gloss_dev_file", help = "The name of the file containing all sentences in the dev set.")
 @click.option("--gloss_test_file", help = "The name of the file containing all sentences in the test set.")
 @click.option("--segmentation_line_number", help = "The line that contains the segmented sentence.  For example if there are four lines each and the segmentation is the second line, this will be 2.")
 @click.option("--gloss_line_number", help = "The line that contains the glossed sentence.  For example if there are four lines each and the gloss is the third line, this will be 3.")
-def main(seg_pred_file, gloss_train_file, gloss_dev_file, gloss_test_file, segmentation_line_number, gloss_line_number):
+@click.option("--gloss_cache_file", help = "Optional SQLite file to keep the glossing model and its predicted gloss lines in between runs, so only sentences with new segmentations get glossed again (created if it doesn't exist).")
+def main(seg_pred_file, seg_fairseq_output_file, gloss_train_file, gloss_dev_file, gloss_test_file, segmentation_line_number, gloss_line_number, gloss_cache_file):
     # Convert right away to prevent off-by-one errors
     gloss_line_number = int(gloss_line_number) - 1
     segmentation_line_number = int(segmentation_line_number) - 1
@@ -61,7 +95,10 @@ def main(seg_pred_file, gloss_train_file, gloss_dev_file, gloss_test_file, segme
     write_output_file(test, "generated_data/", GOLD_OUTPUT_FILE_NAME)
 
     # Next, get the predicted seg lines.  These will be our input.
-    seg_output = read_file(seg_pred_file)
+    if seg_fairseq_output_file:
+        seg_output = predictions_to_sentences((word for word, score in read_fairseq_predictions(seg_fairseq_output_file)), test)
+    else:
+        seg_output = read_file(seg_pred_file)
     seg_line_predictions = (sentence[1] for sentence in seg_output)
     # For now... remove single infix markers (incorrect!)
     seg_line_predictions = remove_boundary_errors(seg_line_predictions)
@@ -70,31 +107,38 @@ def main(seg_pred_file, gloss_train_file, gloss_dev_file, gloss_test_file, segme
     # Now we have the original training set,
     # and a test set with the correct X and y for the pipeline.
 
-    # Replace them with "OOL" for now, but after feature generation the formatting code will remove these tokens altogether
-    train, test = handle_OOL_words([train, test], replace = True)[:2]
+    # Keep the predictions for any sentences that were already glossed (with this same glossing model) in an earlier run
+    predicted_gloss_lines = [None] * len(test)
+    if gloss_cache_file:
+        connection = gloss_cache.connect(gloss_cache_file)
+        model_id, gloss_model = gloss_cache.get_model(connection, gloss_cache.get_fingerprint(gloss_train_file, segmentation_line_number, gloss_line_number))
+        keys = [(seg_sentence[0], sentence[segmentation_line_number]) for seg_sentence, sentence in zip(seg_output, test)]
+        stored_gloss_lines = gloss_cache.look_up(connection, model_id, keys)
+        predicted_gloss_lines = [stored_gloss_lines.get(key) for key in keys]
+        print(f"{len(test) - predicted_gloss_lines.count(None)}/{len(test)} sentences were already glossed with this glossing model.")
+    else:
+        gloss_model = None
+
+    # Gloss everything else
+    indices_to_gloss = [i for i, gloss_line in enumerate(predicted_gloss_lines) if gloss_line is None]
+    if indices_to_gloss:
+        if gloss_model is None:
+            gloss_model = train_gloss_model(train, segmentation_line_number, gloss_line_number)
+            if gloss_cache_file:
+                gloss_cache.store_model(connection, model_id, gloss_model)
+        new_gloss_lines = gloss_sentences([test[i] for i in indices_to_gloss], [seg_output[i] for i in indices_to_gloss], gloss_model, segmentation_line_number, gloss_line_number)
+        for i, gloss_line in zip(indices_to_gloss, new_gloss_lines):
+            predicted_gloss_lines[i] = gloss_line
+        if gloss_cache_file:
+            gloss_cache.store(connection, model_id, {keys[i]: gloss_line for i, gloss_line in zip(indices_to_gloss, new_gloss_lines)})
+    if gloss_cache_file:
+        connection.close()
 
-    test_X, test_y = extract_X_and_y(test, segmentation_line_number, gloss_line_number)
-
-    # Keep versions with boundaries (but no OOL tokens!) for word-by-word evaluation
-    test_without_OOL = handle_OOL_words([test])[0]
-    test_X_with_boundaries, throwaway  = extract_X_and_y(test_without_OOL, segmentation_line_number, gloss_line_number)
-
-    # Create the model
-    train_X, train_y = extract_X_and_y(train, segmentation_line_number, gloss_line_number)
-    train_X, train_y = format_X_and_y(train_X, train_y)
-    throwaway, stem_dict, crf = train_system(train_X, train_y)
-
-    # Now we can format the input and output for glossing
-    test_X, test_y = format_X_and_y(test_X, test_y)
-    pred_y = run_system(test_X, test_y, test_X_with_boundaries, crf, stem_dict)
-
-    # Create the predictions output file
-    # Add back OOl words to our predicted gloss lines (using untouched transcription lines)
-    pred_y_to_print = add_back_OOL_words(list(sentence[0] for sentence in seg_output), reassemble_predicted_words([line.split() for line in test_X_with_boundaries], pred_y))
     # Now we can just take the printed output from the seg step, and add in our new gloss line predictions
-    test_with_predictions = make_sentence_list_with_prediction(seg_output, pred_y_to_print, gloss_line_number)
+    test_with_predictions = make_sentence_list_with_prediction(seg_output, predicted_gloss_lines, gloss_line_number)
     # Write!
     write_output_file(test_with_predictions, "generated_data/", PRED_OUTPUT_FILE_NAME)
 
 
-main()
+if __name__ == '__main__':
+    main()
@@ -8,5 +8,8 @@ SEED_COUNT=0 # Starts at 0 so you'll train n + 1 models
 # Prepare the data for fairseq
 python3 src/preprocess_seg.py --train_file=$TRAIN_SET --dev_file=$DEV_SET --test_file=$TEST_SET
 fairseq-preprocess --source-lang input --target-lang output --trainpref generated_data/train --validpref generated_data/dev --destdir data-bin/
-# Train fairseq (with various random seed values)
-for i in $(seq 0 $SEED_COUNT); do sh src/train_seg.sh $i; done
+# Or, to skip fairseq-preprocess, binarize directly in the line above:
+# python3 src/preprocess_seg.py --train_file=$TRAIN_SET --dev_file=$DEV_SET --test_file=$TEST_SET --binarize_to=data-bin/
+# Train fairseq (with various random seed values), several seeds at a time
+# Seeds that already have a checkpoint_best.pt are skipped, so this can be re-run if it's interrupted
+python3 src/train_seeds.py --first_seed=0 --last_seed=$SEED_COUNT
@@ -3,6 +3,7 @@
 
 import click
 import re
+from fairseq_data import write_binarized_datasets
 from gloss import read_datasets
 from os import getcwd, mkdir, path
 from glossed_data_utilities import handle_OOL_words
@@ -15,27 +16,38 @@ DEV_INPUT_NAME = "dev.input"
 DEV_OUTPUT_NAME = "dev.output"
 TEST_INPUT_NAME = "test.input"
 TEST_OUTPUT_NAME = "test.output"
+# Characters that stay attached to the char before them (e.g., kʷ is one "char" to fairseq, not two)
+MODIFIER_CHARACTERS = ["ʷ"]
+# How many words to build up in memory before each write
+WORDS_PER_WRITE = 100000
+
+# Matches the space that space_chars would put before a modifier character, so it can be taken out again
+# (A modifier at the very start of a word has nothing to attach to, so it has no space before it and stands alone)
+def modifier_regex(modifier_characters = MODIFIER_CHARACTERS):
+    return re.compile(" (?=[" + re.escape("".join(modifier_characters)) + "])")
+
+# Returns the words as one string, one word per line with spaces in between the chars (except before modifier characters)
+def space_chars(words, modifier_characters = MODIFIER_CHARACTERS):
+    spaced_words = "".join(" ".join(word) + "\n" for word in words if len(word) > 0)
+    if modifier_characters:
+        spaced_words = modifier_regex(modifier_characters).sub("", spaced_words)
+
+    return spaced_words
+
+# Returns each word as the list of "chars" fairseq will see (the same ones written by create_file_of_words)
+def tokenize_words(words, modifier_characters = MODIFIER_CHARACTERS):
+    return [line.split(" ") for line in space_chars(words, modifier_characters).split("\n")[:-1]]
 
 # Given a list of words, creates a file where each word is on a new line, with spaces in between the chars
-def create_file_of_words(list, file_name):
+def create_file_of_words(list, file_name, modifier_characters = MODIFIER_CHARACTERS):
     # Create the generated_data subdirectory, if it doesn't already exist
     dir_path = getcwd() + OUTPUT_FOLDER
     if not path.exists(dir_path):
         mkdir(dir_path)
 
     with open(dir_path + file_name, "w") as file:
-        for word in list:
-            if len(word) > 0:
-                for i, char in enumerate(word):
-                    file.write(char)
-                    # Don't print a space if the next "char" is ʷ
-                    if i < len(word) - 1 and word[i + 1] == 'ʷ':
-                        pass
-                    elif i < len(word) - 1: # non-final char
-                        file.write(" ")
-                    else: # final char - this should end the line
-                        file.write("\n")
-        file.close()
+        for start in range(0, len(list), WORDS_PER_WRITE):
+            file.write(space_chars(list[start : start + WORDS_PER_WRITE], modifier_characters))
 
 # Char removal that applies to both unsegmented and segmented lines
 def general_preprocess(sentence):
@@ -102,7 +114,11 @@ def format_data(X, y):
 @click.option("--train_file", help = "The name of the file containing all sentences in the train set.")
 @click.option("--dev_file", help = "The name of the file containing all sentences in the dev set.")
 @click.option("--test_file", help = "The name of the file containing all sentences in the test set.")
-def main(train_file, dev_file, test_file):
+@click.option("--modifier_character", "modifier_characters", multiple = True, default = MODIFIER_CHARACTERS, show_default = True, help = "A character to keep attached to the char before it, rather than treating it as its own char.  Can be repeated.")
+@click.option("--binarize_to", help = "Also write the binarized train and dev sets (and dictionaries) that fairseq-train reads straight to this directory (e.g., data-bin/), instead of running fairseq-preprocess.")
+@click.option("--srcdict", help = "With --binarize_to, use this existing input dictionary instead of building one from the train set (like fairseq-preprocess --srcdict).")
+@click.option("--tgtdict", help = "With --binarize_to, use this existing output dictionary instead of building one from the train set (like fairseq-preprocess --tgtdict).")
+def main(train_file, dev_file, test_file, modifier_characters, binarize_to, srcdict, tgtdict):
     # Break down the data into three sets
     train, dev, test = read_datasets(train_file, dev_file, test_file)
 
@@ -124,20 +140,27 @@ def main(train_file, dev_file, test_file):
     # Convert these to the appropriate format for fairseq
     train_X_formatted, train_y_formatted = format_data(train_X, train_y)
     assert len(train_X_formatted) == len(train_y_formatted), f"\nX length: {len(train_X_formatted)} words.\ny length: {len(train_y_formatted)} words."
-    create_file_of_words(train_X_formatted, TRAIN_INPUT_NAME)
-    create_file_of_words(train_y_formatted, TRAIN_OUTPUT_NAME)
+    create_file_of_words(train_X_formatted, TRAIN_INPUT_NAME, modifier_characters)
+    create_file_of_words(train_y_formatted, TRAIN_OUTPUT_NAME, modifier_characters)
 
     dev_X_formatted, dev_y_formatted = format_data(dev_X, dev_y)
     assert(len(dev_X_formatted) == len(dev_y_formatted))
-    create_file_of_words(dev_X_formatted, DEV_INPUT_NAME)
-    create_file_of_words(dev_y_formatted, DEV_OUTPUT_NAME)
+    create_file_of_words(dev_X_formatted, DEV_INPUT_NAME, modifier_characters)
+    create_file_of_words(dev_y_formatted, DEV_OUTPUT_NAME, modifier_characters)
 
     test_X_formatted, test_y_formatted = format_data(test_X, test_y)
     assert(len(test_X_formatted) == len(test_y_formatted))
-    create_file_of_words(test_X_formatted, TEST_INPUT_NAME)
-    create_file_of_words(test_y_formatted, TEST_OUTPUT_NAME)
+    create_file_of_words(test_X_formatted, TEST_INPUT_NAME, modifier_characters)
+    create_file_of_words(test_y_formatted, TEST_OUTPUT_NAME, modifier_characters)
 
     print("\nWrote to " + ", ".join([TRAIN_INPUT_NAME, TRAIN_OUTPUT_NAME, DEV_INPUT_NAME, DEV_OUTPUT_NAME, TEST_INPUT_NAME]) + ", and " + TEST_OUTPUT_NAME + ".\n")
 
+    if binarize_to:
+        # Like fairseq-preprocess in prepare_seg.sh, the dev set is fairseq's "valid" set
+        sets = {"train": (tokenize_words(train_X_formatted, modifier_characters), tokenize_words(train_y_formatted, modifier_characters)),
+                "valid": (tokenize_words(dev_X_formatted, modifier_characters), tokenize_words(dev_y_formatted, modifier_characters))}
+        write_binarized_datasets(sets, binarize_to, srcdict = srcdict, tgtdict = tgtdict)
+        print(f"Wrote the binarized train and dev sets to {binarize_to}.\n")
+
 if __name__ == '__main__':
     main()
@@ -1,12 +1,16 @@
 # For formatting fixes that can be done irrespective of language
 # Ensuring that the glossing code doesn't need to worry about screening for these kinds of anomalies
 import click
-from os import listdir, path
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, repeat
+from math import ceil
+from os import cpu_count, listdir, path
 import re
-from unicodedata import normalize
-from gloss import read_datasets, ALL_BOUNDARIES_FOR_REGEX, UNICODE_STRESS
+from corpus_db import compare_gram_tags, connect, get_gloss_dict, import_datasets, DEFAULT_LANGUAGE
+from gloss import read_datasets, ALL_BOUNDARIES_FOR_REGEX
 from glossed_data_handling_utilities import gloss_line_to_morphemes, seg_line_to_morphemes, REGULAR_BOUNDARY, CLITIC_BOUNDARY, REDUPLICATION_BOUNDARY, LEFT_INFIX_BOUNDARY, RIGHT_INFIX_BOUNDARY, LEFT_REDUP_INFIX_BOUNDARY, RIGHT_REDUP_INFIX_BOUNDARY
-from glossed_data_utilities import read_file, punctuation_list_to_regex, punctuation_list_to_string, NON_PERMITTED_PUNCTUATION_GLOSS, NON_PERMITTED_PUNCTUATION_TRANSCRIPTION_SEG, OUT_OF_LANGUAGE_MARKER
+from glossed_data_utilities import as_percent, read_file, punctuation_list_to_regex, remove_stress, to_NFD, punctuation_list_to_string, NON_PERMITTED_PUNCTUATION_GLOSS, NON_PERMITTED_PUNCTUATION_TRANSCRIPTION_SEG, OUT_OF_LANGUAGE_MARKER, UNICODE_STRESS
 
 ALL_BOUNDARIES = [LEFT_INFIX_BOUNDARY, RIGHT_INFIX_BOUNDARY, LEFT_REDUP_INFIX_BOUNDARY, RIGHT_REDUP_INFIX_BOUNDARY, REGULAR_BOUNDARY, CLITIC_BOUNDARY, REDUPLICATION_BOUNDARY]
 NON_GLOSS_LINE_BOUNDARIES = [LEFT_INFIX_BOUNDARY, RIGHT_INFIX_BOUNDARY, LEFT_REDUP_INFIX_BOUNDARY, RIGHT_REDUP_INFIX_BOUNDARY, CLITIC_BOUNDARY, REDUPLICATION_BOUNDARY]
@@ -18,6 +22,9 @@ GLOSS_DISCONNECTED_BOUNDARY_REGEX = ALL_BOUNDARIES_FOR_REGEX_SANS_CLOSERS + r"(\
 NON_PERMITTED_PUNCTUATION_TRANSCRIPTION_ONLY = ["=", "∅"] # Removed "-" bc it's used in the Se orthography
 NON_PERMITTED_PUNCTUATION_TRANSCRIPTION = NON_PERMITTED_PUNCTUATION_TRANSCRIPTION_SEG + NON_PERMITTED_PUNCTUATION_TRANSCRIPTION_ONLY
 
+# The gloss inventory is only counted in parallel once there's at least this many sentences per worker
+MIN_SENTENCES_PER_SHARD = 5000
+
 # Matching stress isn't *essential* for system functioning, so these checks can be turned off.
 CHECK_STRESS = True
 CHECK_PUNC = True
@@ -138,8 +145,9 @@ def seg_screen(transcription_line, seg_line):
         # Stress checks
         if CHECK_STRESS:
             # First, convert to split chars/diacritics so that we don't have to handle BOTH combined- and uncombined-formatted inputs
-            transcription_word = normalize('NFD', transcription_word)
-            seg_word = normalize('NFD', seg_word)
+            transcription_word_unstressed = remove_stress(transcription_word)
+            transcription_word = to_NFD(transcription_word)
+            seg_word = to_NFD(seg_word)
 
             # Check the transcription line for double stress
             if transcription_word.count(UNICODE_STRESS) > 1:
@@ -150,7 +158,6 @@ def seg_screen(transcription_line, seg_line):
             # Check that stress matches b/w the trans and seg lines
             # Catches cases where a) one line has the word with stress marking, the other lacks it altogether and b) both lines have the word with stress, but in different places
             # For now, only check words that are not otherwise modified (e.g. underlying sounds added in seg line)
-            transcription_word_unstressed = transcription_word.replace(UNICODE_STRESS, "")
             seg_word_unsegmented = re.sub(ALL_BOUNDARIES_FOR_REGEX, "", seg_word)
             seg_word_unsegmented_unstressed = seg_word_unsegmented.replace(UNICODE_STRESS, "")
             # If they're the same without stress marking, whereas with stress (and no boundaries in the seg line) they're no longer the same
@@ -210,7 +217,7 @@ def seg_and_gloss_screen(seg_line):
         seg_words = seg_line.split()
         for word in seg_words:
             # First, convert to split chars/diacritics so that we don't have to handle BOTH combined- and uncombined-formatted inputs
-            word = normalize('NFD', word)
+            word = to_NFD(word)
             if word.count(UNICODE_STRESS) > 1:
                 print(f"\n- Error: this sentence has a word with multiple stress marking in the segmented line. Word: {word}.")
                 print(seg_line)
@@ -499,39 +506,51 @@ def organize_tags_by_morpheme(gram_list, stem_list):
 
     return morphemes_list
 
-# Returns three lists
-# Each list element is a tuple
-# Tuple[0] = a string gloss, like "1PL.EMPH"
-# Tuple[1] = a dictionary with morphemes glossed with that label and their counts, like {'nmímɬ': 1, 'nmimɬ': 1}
-def get_tags(all_data, segmentation_line_number, gloss_line_number):
-    # Dictionary where the keys are glosses, and the values are also dicts with morpheme keys and count values
-    # e.g. 3ERG: [es, s]
-    gloss_dict = {}
-    for sentence in all_data:
+# Counts each (gloss, morpheme) pair in one shard of the data
+# Returns a Counter, whose keys are in the order the pairs first appeared
+def _count_tags_in_shard(shard, segmentation_line_number, gloss_line_number):
+    counts = Counter()
+    for sentence in shard:
         seg_line = sentence[segmentation_line_number]
         gloss_line = sentence[gloss_line_number]
         morphemes = seg_line_to_morphemes(seg_line, do_ignore_brackets = True, keep_word_boundaries = False)
         glosses = gloss_line_to_morphemes(gloss_line)
         assert(len(morphemes) == len(glosses))
-        for morpheme, gloss in zip(morphemes, glosses):
+        for morpheme in morphemes:
             assert(morpheme)
-            # If there's no entry for the gloss, add a new one
-            # If there is an entry, check if this morpheme is already listed
-            # If not, add it
-            if not (gloss in gloss_dict.keys()):
-                gloss_dict.update({gloss: {morpheme: 1}})
-            else: # Add to the existing entry
-                existing_entry = (gloss_dict.get(gloss))
-                if morpheme in existing_entry:
-                    current_count = existing_entry[morpheme]
-                    # Update the morpheme + count dictionary
-                    existing_entry.update({morpheme: current_count + 1 })
-                    # Then update the gloss entry (with this updated morpheme/count dict)
-                    gloss_dict.update({gloss: existing_entry})
-                else:
-                    existing_entry.update({morpheme: 1})
-                    gloss_dict.update({gloss: existing_entry})
+        counts.update(zip(glosses, morphemes))
+
+    return counts
+
+# Returns three lists
+# Each list element is a tuple
+# Tuple[0] = a string gloss, like "1PL.EMPH"
+# Tuple[1] = a dictionary with morphemes glossed with that label and their counts, like {'nmímɬ': 1, 'nmimɬ': 1}
+# The counting is split into contiguous shards, which are counted over a process pool and then merged in order
+# (so the result is the same as counting the whole dataset in one go).  Small datasets are just counted here.
+def get_tags(all_data, segmentation_line_number, gloss_line_number, num_workers = None):
+    num_workers = num_workers or cpu_count() or 1
+    shard_size = max(MIN_SENTENCES_PER_SHARD, ceil(len(all_data) / num_workers))
+    shards = [all_data[i : i + shard_size] for i in range(0, len(all_data), shard_size)]
+    if len(shards) <= 1 or num_workers == 1:
+        counts = _count_tags_in_shard(all_data, segmentation_line_number, gloss_line_number)
+    else:
+        counts = Counter()
+        with ProcessPoolExecutor(max_workers = min(num_workers, len(shards))) as executor:
+            for shard_counts in executor.map(_count_tags_in_shard, shards, repeat(segmentation_line_number), repeat(gloss_line_number)):
+                counts.update(shard_counts)
 
+    # Dictionary where the keys are glosses, and the values are also dicts with morpheme keys and count values
+    # e.g. 3ERG: {es: 4, s: 10}
+    gloss_dict = {}
+    for (gloss, morpheme), count in counts.items():
+        gloss_dict.setdefault(gloss, {})[morpheme] = count
+
+    return classify_tags(gloss_dict)
+
+# Takes a dictionary where the keys are glosses, and the values are dicts with morpheme keys and count values
+# Returns the three lists described above get_tags
+def classify_tags(gloss_dict):
     # Switch to a separate dict for grams and stems, and words that are not translated (e.g., English words, people's names)
     gram_dict = {}
     stem_dict = {}
@@ -567,6 +586,10 @@ def get_tags(all_data, segmentation_line_number, gloss_line_number):
 
     return gram_list, stem_list, english_list
 
+# Same as get_tags, but the counting is done by the corpus database
+def get_tags_from_db(connection, language):
+    return classify_tags(get_gloss_dict(connection, language))
+
 def print_tags(tag_list):
     for entry in tag_list:
         gloss = entry[0]
@@ -588,14 +611,70 @@ def compare_tags(lang_1_data, lang_2_data, segmentation_line_number, gloss_line_
     lang_1_tags = [entry[0] for entry in gram_list_1]
     lang_2_tags = [entry[0] for entry in gram_list_2]
 
-    shared_tags = []
-    for tag in lang_1_tags:
-        if tag in lang_2_tags:
-            shared_tags.append(tag)
-
-    lang_1_tags = [entry for entry in lang_1_tags if entry not in shared_tags]
-    lang_2_tags = [entry for entry in lang_2_tags if entry not in shared_tags]
-
+    # Sets for the membership checks, lists to keep the (alphabetical) order for printing
+    lang_1_tag_set = set(lang_1_tags)
+    lang_2_tag_set = set(lang_2_tags)
+    shared_tags = [tag for tag in lang_1_tags if tag in lang_2_tag_set]
+    lang_1_tags = [tag for tag in lang_1_tags if tag not in lang_2_tag_set]
+    lang_2_tags = [tag for tag in lang_2_tags if tag not in lang_1_tag_set]
+
+    print_tag_comparison(lang_1_tags, lang_2_tags, shared_tags)
+
+# Reads a language's train/dev/test files and returns the set of gram glosses used in them
+# This is run in its own process for each language, so it doesn't parallelize any further itself
+def _get_gram_tag_set(language_data):
+    file_paths, segmentation_line_number, gloss_line_number = language_data
+    all_data = []
+    for file_path in file_paths:
+        all_data.extend(read_file(file_path))
+    gram_list, throwaway, throwaway = get_tags(all_data, segmentation_line_number, gloss_line_number, num_workers = 1)
+
+    return frozenset(entry[0] for entry in gram_list)
+
+# Like compare_tags, but for any number of languages
+# Input: a dict of language label -> (list of that language's data files, its segmentation line number, its gloss line number)
+# (the line numbers are per language, since e.g. the gloss is the third line in some corpora and the fourth in others)
+# Each language's gram inventory is built in parallel, then we get:
+# - a presence matrix (each gram tag vs. each language)
+# - the Jaccard overlap (shared tags / all tags) for each pair of languages
+# Returns the tag sets (by language), and prints (and optionally writes a CSV of) the matrix
+def compare_tags_across_languages(data_by_language, output_csv = None):
+    languages = list(data_by_language.keys())
+    with ProcessPoolExecutor(max_workers = min(len(languages), cpu_count() or 1)) as executor:
+        tag_sets = list(executor.map(_get_gram_tag_set, data_by_language.values()))
+    tags_by_language = dict(zip(languages, tag_sets))
+    all_tags = sorted(set().union(*tag_sets))
+
+    print("\nGram Tags by Language:")
+    print("Tag\t" + "\t".join(languages))
+    for tag in all_tags:
+        print(tag + "\t" + "\t".join(("x" if tag in tags_by_language[language] else "") for language in languages))
+    print("Total\t" + "\t".join(str(len(tags_by_language[language])) for language in languages))
+
+    print("\nPairwise Overlap (Jaccard):")
+    for language_1, language_2 in combinations(languages, 2):
+        tags_1 = tags_by_language[language_1]
+        tags_2 = tags_by_language[language_2]
+        union = tags_1 | tags_2
+        shared_count = len(tags_1 & tags_2)
+        overlap = as_percent(shared_count / len(union)) if union else None
+        print(f"{language_1} vs. {language_2}: {shared_count}/{len(union)} tags shared ({overlap}%).")
+
+    if output_csv:
+        with open(output_csv, "w") as csv_file:
+            csv_file.write("Tag," + ",".join(languages) + "\n")
+            for tag in all_tags:
+                csv_file.write(tag + "," + ",".join(("1" if tag in tags_by_language[language] else "0") for language in languages) + "\n")
+        print("Wrote to", output_csv)
+
+    return tags_by_language
+
+# Same as compare_tags, but the gram glosses come straight from the corpus database
+def compare_tags_from_db(connection, language_1, language_2):
+    lang_1_tags, lang_2_tags, shared_tags = compare_gram_tags(connection, language_1, language_2)
+    print_tag_comparison(lang_1_tags, lang_2_tags, shared_tags)
+
+def print_tag_comparison(lang_1_tags, lang_2_tags, shared_tags):
     print("\nTags Only in Language 1:")
     print("Total: ", (len(lang_1_tags)))
     for tag in lang_1_tags:
@@ -640,6 +719,9 @@ def search_data(search_transcription_line, search_seg_line, search_gloss_line, d
 @click.option("--do_screen_data", is_flag = True, help = "A flag that indicates we should prescreen the inputed datasets.")
 @click.option("--do_print_tags", is_flag = True, help = "A flag that indicates we should summarize the glossing tags found in the inputted datasets.")
 @click.option("--do_compare_tags", is_flag = True, help = "A flag that indicates we should compare the tags from two languages.")
+@click.option("--do_compare_tags_across_languages", is_flag = True, help = "A flag that indicates we should compare the gram tags from the main language and every --other_language, as a presence matrix with pairwise overlaps.")
+@click.option("--other_language", type = (str, str, str, str, int, int), multiple = True, help = "A language to include in --do_compare_tags_across_languages, given as a label followed by its train, dev, and test files, and then its segmentation and gloss line numbers (e.g., 2 3).  Can be repeated.")
+@click.option("--tag_matrix_csv", type = str, help = "Optional CSV file to write the --do_compare_tags_across_languages presence matrix to.")
 @click.option("--do_search", is_flag = True, help = "A flag that indicates whether the search function should be called.")
 @click.option("--search_transcription_line", is_flag = True, type = str, help = "Should the transcription line be searched?")
 @click.option("--search_seg_line", is_flag = True, type = str, help = "Should the seg line be searched?")
@@ -650,11 +732,14 @@ def search_data(search_transcription_line, search_seg_line, search_gloss_line, d
 @click.option("--train_file_to_compare", type = str, help = "The name of the file containing all sentences in the train set *of the language to be compared with*.")
 @click.option("--dev_file_to_compare", type = str, help = "The name of the file containing all sentences in the dev set *of the language to be compared with*.")
 @click.option("--test_file_to_compare", type = str, help = "The name of the file containing all sentences in the test set *of the language to be compared with*.")
+@click.option("--corpus_db", type = str, help = "Optional SQLite database (see corpus_db.py) to import the datasets into and build the gloss inventory/comparison from.  Unchanged files are not re-imported.")
+@click.option("--language", default = DEFAULT_LANGUAGE, type = str, help = "The label for the language of the train/dev/test files in the corpus database.")
+@click.option("--language_to_compare", default = "lang_2", type = str, help = "The label for the language *to be compared with* in the corpus database.")
 @click.option("--dir_to_search", type = str, help = "Every data file in this directory will be searched.")
 @click.option("--search_term", type = str, help = "The string we are looking for in our search.")
 @click.option("--segmentation_line_number", required = True, type = int, help = "The line that contains the segmented sentence.  Note that this starts with the first line = 1.  For example if there are four lines each and the segmentation is the second line, this will be 2.")
 @click.option("--gloss_line_number", required = True, type = int, help = "The line that contains the glossed sentence.  Note that this starts with the first line = 1.  For example if there are four lines each and the gloss is the third line, this will be 3.")
-def main(train_file, dev_file, test_file, segmentation_line_number, gloss_line_number, do_screen_data, do_print_tags, do_compare_tags, do_search, search_transcription_line, search_seg_line, search_gloss_line, train_file_to_compare = None, dev_file_to_compare = None, test_file_to_compare = None, dir_to_search = None, search_term = None):
+def main(train_file, dev_file, test_file, segmentation_line_number, gloss_line_number, do_screen_data, do_print_tags, do_compare_tags, do_search, search_transcription_line, search_seg_line, search_gloss_line, language, language_to_compare, do_compare_tags_across_languages, other_language, train_file_to_compare = None, dev_file_to_compare = None, test_file_to_compare = None, corpus_db = None, tag_matrix_csv = None, dir_to_search = None, search_term = None):
     # Convert right away to prevent off-by-one errors
     segmentation_line_number = int(segmentation_line_number) - 1
     gloss_line_number = int(gloss_line_number) - 1
@@ -677,8 +762,15 @@ def main(train_file, dev_file, test_file, segmentation_line_number, gloss_line_n
         # Print the results
         print_screen_summary()
 
+    if corpus_db and (do_print_tags or do_compare_tags):
+        connection = connect(corpus_db)
+        import_datasets(connection, train_file, dev_file, test_file, language, segmentation_line_number, gloss_line_number)
+
     if do_print_tags:
-        gram_list, stem_list, english_list = get_tags(train + dev + test, segmentation_line_number, gloss_line_number)
+        if corpus_db:
+            gram_list, stem_list, english_list = get_tags_from_db(connection, language)
+        else:
+            gram_list, stem_list, english_list = get_tags(train + dev + test, segmentation_line_number, gloss_line_number)
         print("***** GLOSS INVENTORY *****")
         print("--- Grams: ---")
         print("Total number of unique gram glosses:", len(gram_list))
@@ -696,18 +788,37 @@ def main(train_file, dev_file, test_file, segmentation_line_number, gloss_line_n
 
     if do_compare_tags:
         if train_file_to_compare and dev_file_to_compare and test_file_to_compare:
-            train_2, dev_2, test_2 = read_datasets(train_file_to_compare, dev_file_to_compare, test_file_to_compare)
-            compare_tags(train + dev + test, train_2 + dev_2 + test_2, segmentation_line_number, gloss_line_number)
+            if corpus_db:
+                import_datasets(connection, train_file_to_compare, dev_file_to_compare, test_file_to_compare, language_to_compare, segmentation_line_number, gloss_line_number)
+                compare_tags_from_db(connection, language, language_to_compare)
+            else:
+                train_2, dev_2, test_2 = read_datasets(train_file_to_compare, dev_file_to_compare, test_file_to_compare)
+                compare_tags(train + dev + test, train_2 + dev_2 + test_2, segmentation_line_number, gloss_line_number)
         else:
             print("\nERROR: --do_compare_tags flag used, but one or more of the train/dev/test files to compare with were NOT given!")
 
+    if corpus_db and (do_print_tags or do_compare_tags):
+        connection.close()
+
+    if do_compare_tags_across_languages:
+        if other_language:
+            labels = [language] + [label for label, *throwaway in other_language]
+            assert len(set(labels)) == len(labels), f"\nEach language label should only be used once (the main language is {language})."
+            data_by_language = {language: ([train_file, dev_file, test_file], segmentation_line_number, gloss_line_number)}
+            for label, other_train_file, other_dev_file, other_test_file, other_segmentation_line_number, other_gloss_line_number in other_language:
+                # Convert right away to prevent off-by-one errors
+                data_by_language.update({label: ([other_train_file, other_dev_file, other_test_file], other_segmentation_line_number - 1, other_gloss_line_number - 1)})
+            compare_tags_across_languages(data_by_language, tag_matrix_csv)
+        else:
+            print("\nERROR: --do_compare_tags_across_languages flag used, but no --other_language was given!")
+
     if do_search:
         if dir_to_search and (search_transcription_line or search_seg_line or search_gloss_line) and search_term:
             search_data(search_transcription_line, search_seg_line, search_gloss_line, dir_to_search, search_term, segmentation_line_number, gloss_line_number)
         else:
             print("\nERROR: --do_search flag used, but one or more of the relevant command line args were NOT given!")
 
-    if not(do_screen_data) and not(do_print_tags) and not(do_compare_tags) and not(do_search):
+    if not(do_screen_data) and not(do_print_tags) and not(do_compare_tags) and not(do_compare_tags_across_languages) and not(do_search):
         print("No tasks were requested, so this code isn't doing anything!\nRun `python src/prescreen_data.py --help` to see the possible options, including which tasks you can specify.")
 
 if __name__ == '__main__':
@@ -0,0 +1,139 @@
+# *** Runs the glossing workflow for several languages at once ***
+# Instead of editing and running prescreen.sh and dev_gloss.sh/run_gloss.sh once per language, one after the other,
+# this takes a manifest of languages and runs every language's steps over one shared pool of worker slots:
+# - prescreen (prescreen_data.py --do_screen_data)
+# - glossing, which trains the model and predicts the test set (gloss.py)
+# - evaluation of those predictions (eval_gloss.py), once glossing for that language is done
+# Each language gets its own directory under --runs_dir, since gloss.py and eval_gloss.py write stem_dict.txt and
+# gloss_results.csv to the directory they're run from.  Each step's output goes to its own log there (e.g., gloss_log.txt).
+# Afterwards, every language's evaluation results are combined into one table.
+# The manifest is a JSON list with one entry per language, e.g.:
+# [{"language": "St", "train_file": "data/train.txt", "dev_file": "data/dev.txt", "test_file": "data/test.txt", "segmentation_line_number": 2, "gloss_line_number": 3}]
+# Data paths that aren't absolute are taken to be relative to the manifest.
+import click
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import json
+from os import cpu_count, makedirs, path, remove
+import subprocess
+import sys
+from time import perf_counter
+from eval_gloss import OUTPUT_CSV, OUTPUT_CSV_HEADER
+
+SRC_DIR = path.dirname(path.abspath(__file__))
+DEFAULT_RUNS_DIR = "language_runs"
+DEFAULT_RESULTS_FILE = "language_results.csv"
+LOG_FILE_NAME = "{}_log.txt"
+OUTPUT_FOLDER = "generated_data/"
+OUTPUT_FILE = "gloss_pred.txt"
+MANIFEST_FIELDS = ["language", "train_file", "dev_file", "test_file", "segmentation_line_number", "gloss_line_number"]
+PRESCREEN = "prescreen"
+GLOSS = "gloss"
+EVALUATE = "evaluate"
+
+# Reads the manifest, checking that every language has what it needs, and making its data paths absolute
+def read_manifest(manifest_file):
+    with open(manifest_file) as file:
+        languages = json.load(file)
+    manifest_dir = path.dirname(path.abspath(manifest_file))
+
+    for language in languages:
+        missing_fields = [field for field in MANIFEST_FIELDS if field not in language]
+        assert not missing_fields, f"\n{language.get('language', language)} is missing {', '.join(missing_fields)} in {manifest_file}."
+        for field in ["train_file", "dev_file", "test_file"]:
+            language[field] = path.join(manifest_dir, language[field])
+    names = [language["language"] for language in languages]
+    assert len(set(names)) == len(names), f"\nEach language should only be listed once in {manifest_file}."
+
+    return languages
+
+# Returns the command for one step of one language's workflow
+def get_command(step, language):
+    line_numbers = [f"--segmentation_line_number={language['segmentation_line_number']}", f"--gloss_line_number={language['gloss_line_number']}"]
+    if step == PRESCREEN:
+        return [sys.executable, path.join(SRC_DIR, "prescreen_data.py"), "--do_screen_data", f"--train_file={language['train_file']}", f"--dev_file={language['dev_file']}", f"--test_file={language['test_file']}"] + line_numbers
+    if step == GLOSS:
+        return [sys.executable, path.join(SRC_DIR, "gloss.py"), f"--train_file={language['train_file']}", f"--dev_file={language['dev_file']}", f"--test_file={language['test_file']}", f"--output_folder={OUTPUT_FOLDER}", f"--output_file={OUTPUT_FILE}"] + line_numbers
+    if step == EVALUATE:
+        return [sys.executable, path.join(SRC_DIR, "eval_gloss.py"), f"--test_file={language['test_file']}", f"--output_file={OUTPUT_FOLDER}{OUTPUT_FILE}"] + line_numbers
+    raise ValueError(f"Unknown step: {step}")
+
+# Runs one step of one language's workflow in the language's directory, with its output going to the step's log
+# Returns the language, the step, its exit code, and how long it took in seconds
+def run_step(step, language, run_dir):
+    start_time = perf_counter()
+    with open(path.join(run_dir, LOG_FILE_NAME.format(step)), "w") as log_file:
+        process = subprocess.run(get_command(step, language), cwd = run_dir, stdin = subprocess.DEVNULL, stdout = log_file, stderr = subprocess.STDOUT)
+
+    return language["language"], step, process.returncode, perf_counter() - start_time
+
+# Returns the last row of results in a language's gloss_results.csv (or None, if there isn't one)
+def read_results(run_dir):
+    results_file = path.join(run_dir, OUTPUT_CSV)
+    if not path.exists(results_file):
+        return None
+    with open(results_file) as file:
+        rows = [line.strip() for line in file if line.strip()]
+
+    return rows[-1] if len(rows) > 1 else None
+
+# Writes every language's results as one table, with the language (and how long its steps took) in front
+def write_combined_results(languages, run_dirs, seconds_by_language, output_file):
+    rows = []
+    for language in languages:
+        name = language["language"]
+        results = read_results(run_dirs[name])
+        if results is not None:
+            rows.append(f"{name},{round(seconds_by_language[name], 1)},{results}")
+    with open(output_file, "w") as file:
+        file.write("Language,Seconds," + OUTPUT_CSV_HEADER + "\n")
+        file.writelines(row + "\n" for row in rows)
+
+    return rows
+
+@click.command()
+@click.option("--manifest_file", required = True, help = "A JSON list of the languages to run, each with its language label, train/dev/test files, and segmentation/gloss line numbers.")
+@click.option("--runs_dir", default = DEFAULT_RUNS_DIR, show_default = True, help = "Where to put each language's directory (with its predictions, stem_dict.txt, gloss_results.csv and logs).")
+@click.option("--results_file", default = DEFAULT_RESULTS_FILE, show_default = True, help = "Where to write the combined results for every language.")
+@click.option("--max_parallel", type = int, help = "The most steps to have running at once.  By default, as many as there are CPUs.")
+@click.option("--skip_prescreen", is_flag = True, help = "Don't prescreen the data first.")
+def main(manifest_file, runs_dir, results_file, max_parallel, skip_prescreen):
+    languages = read_manifest(manifest_file)
+    run_dirs = {}
+    for language in languages:
+        run_dir = path.abspath(path.join(runs_dir, language["language"]))
+        makedirs(path.join(run_dir, OUTPUT_FOLDER), exist_ok = True)
+        # eval_gloss.py adds to gloss_results.csv, so start it fresh
+        if path.exists(path.join(run_dir, OUTPUT_CSV)):
+            remove(path.join(run_dir, OUTPUT_CSV))
+        run_dirs[language["language"]] = run_dir
+
+    slots = max(1, max_parallel or cpu_count() or 1)
+    print(f"Running {len(languages)} language(s), {slots} step(s) at a time.")
+    seconds_by_language = {language["language"]: 0 for language in languages}
+    failed_steps = []
+    start_time = perf_counter()
+    with ThreadPoolExecutor(max_workers = slots) as executor:
+        # Prescreening and glossing don't depend on each other, so they all start right away
+        # Each language's evaluation is added as soon as its glossing is done
+        steps = [GLOSS] if skip_prescreen else [PRESCREEN, GLOSS]
+        running = {executor.submit(run_step, step, language, run_dirs[language["language"]]) for language in languages for step in steps}
+        languages_by_name = {language["language"]: language for language in languages}
+        while running:
+            finished, running = wait(running, return_when = FIRST_COMPLETED)
+            for future in finished:
+                name, step, return_code, seconds = future.result()
+                seconds_by_language[name] += seconds
+                if return_code != 0:
+                    failed_steps.append(f"{name} {step}")
+                    print(f"{name}: {step} failed (exit code {return_code}) after {seconds:.1f} seconds; see {path.join(run_dirs[name], LOG_FILE_NAME.format(step))}.")
+                    continue
+                print(f"{name}: {step} finished in {seconds:.1f} seconds.")
+                if step == GLOSS:
+                    running.add(executor.submit(run_step, EVALUATE, languages_by_name[name], run_dirs[name]))
+
+    rows = write_combined_results(languages, run_dirs, seconds_by_language, results_file)
+    print(f"Finished in {perf_counter() - start_time:.1f} seconds ({sum(seconds_by_language.values()):.1f} seconds of steps).  Wrote results for {len(rows)} language(s) to {results_file}.")
+    assert not failed_steps, f"These steps failed: {', '.join(failed_steps)}."
+
+if __name__ == '__main__':
+    main()
@@ -8,4 +8,8 @@ GLOSS_LINE_NUMBER=3 # 3 for St̓át̓imcets, 4 for Gitksan
 
 # The seg predictions used come from running the segmenter first
 # Now, run the glosser on those predictions
-python3 src/pipeline.py --seg_pred_file=$SEG_PREDICTIONS --gloss_train_file=$GLOSS_TRAIN_SET --gloss_dev_file=$GLOSS_DEV_SET --gloss_test_file=$GLOSS_TEST_SET --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER
\ No newline at end of file
+# Sentences already glossed in an earlier run (with the same seg prediction and glossing model) come from the cache
+python3 src/pipeline.py --seg_pred_file=$SEG_PREDICTIONS --gloss_train_file=$GLOSS_TRAIN_SET --gloss_dev_file=$GLOSS_DEV_SET --gloss_test_file=$GLOSS_TEST_SET --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER --gloss_cache_file=gloss_cache.db
+# Or, to segment and gloss data/test.txt in one go (with the segmentation ensemble loaded in-process), without needing seg_pred.txt:
+# python3 src/stream_pipeline.py --input_file=$GLOSS_TEST_SET --models=$MODELS --gloss_train_file=$GLOSS_TRAIN_SET --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER
+# (where MODELS is built as in run_seg.sh)
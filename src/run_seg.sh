@@ -12,5 +12,7 @@ MODELS="models_seed0/checkpoint"$EPOCHS_TO_USE".pt"
 for i in $(seq 1 $SEED_COUNT); do MODELS=$MODELS":models_seed"$i"/checkpoint"$EPOCHS_TO_USE".pt"; done
 echo "Using model(s): "$MODELS
 
-cat $INPUT | fairseq-interactive --path $MODELS data-bin > $OUTPUT
+# Each distinct word is only run through the ensemble once (the output still has every token, in order),
+# and words these checkpoints already segmented in an earlier run come from the cache
+python3 src/segment_words.py --input_file=$INPUT --output_file=$OUTPUT --models=$MODELS --data_dir=data-bin --cache_file=segmentation_cache.db
 python3 src/test_seg.py --whole_input_file=$WHOLE_INPUT --output_file=$OUTPUT --output_file_is_fairseq_formatted --gold_output_file=$GOLD_OUTPUT --train_output_file=$TRAIN_OUTPUT
\ No newline at end of file
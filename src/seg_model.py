@@ -0,0 +1,62 @@
+# *** Runs the segmentation ensemble in-process ***
+# Loads the ensemble's checkpoints once, then decodes the words in batches on the CPU,
+# instead of starting fairseq-interactive and parsing its text output.
+# Words are batched with others of a similar length, so there's as little padding as possible.
+# fairseq (and torch) are only imported when an ensemble is actually loaded.
+from math import log
+
+DEFAULT_DATA_DIR = "data-bin"
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_BEAM = 5 # fairseq-interactive's default
+
+# Loads the checkpoints (given separated by colons, as for fairseq-interactive --path) as one ensemble
+# Returns everything segment() needs
+def load_ensemble(models, data_dir = DEFAULT_DATA_DIR, beam = DEFAULT_BEAM):
+    from fairseq import checkpoint_utils
+
+    ensemble, cfg, task = checkpoint_utils.load_model_ensemble_and_task(models.split(":"), arg_overrides = {"data": data_dir})
+    for model in ensemble:
+        model.eval()
+    cfg.generation.beam = beam
+    generator = task.build_generator(ensemble, cfg.generation)
+
+    return ensemble, task, generator
+
+# Returns lists of word indices, each holding up to batch_size words of similar length
+def _length_buckets(words, batch_size):
+    order = sorted(range(len(words)), key = lambda i: len(words[i].split()))
+    for start in range(0, len(order), batch_size):
+        yield order[start : start + batch_size]
+
+# Segments char-level words (e.g., "k a s"), returning one prediction per word, in the same order
+# Each prediction is a dict with the best hypothesis (spaced out like the input, e.g. "k a - s"),
+# its score, and its positional scores (in base 2, as fairseq-interactive prints them)
+def segment(words, loaded_ensemble, batch_size = DEFAULT_BATCH_SIZE):
+    import torch
+
+    ensemble, task, generator = loaded_ensemble
+    source_dictionary = task.source_dictionary
+    target_dictionary = task.target_dictionary
+    predictions = [None] * len(words)
+    with torch.no_grad():
+        for word_indices in _length_buckets(words, batch_size):
+            source_tokens = [source_dictionary.encode_line(words[i], add_if_not_exist = False).long() for i in word_indices]
+            dataset = task.build_dataset_for_inference(source_tokens, [tokens.numel() for tokens in source_tokens])
+            # The collater reorders the batch, but keeps each word's position in source_tokens as its id
+            sample = dataset.collater([dataset[i] for i in range(len(dataset))])
+            hypotheses = task.inference_step(generator, ensemble, sample)
+            for batch_position, word_hypotheses in zip(sample["id"].tolist(), hypotheses):
+                best_hypothesis = word_hypotheses[0]
+                predictions[word_indices[batch_position]] = {
+                    "hypothesis": target_dictionary.string(best_hypothesis["tokens"].int().cpu(), extra_symbols_to_ignore = {target_dictionary.eos()}),
+                    "score": best_hypothesis["score"].item() / log(2),
+                    "positional_scores": (best_hypothesis["positional_scores"] / log(2)).tolist()
+                }
+
+    return predictions
+
+# The lines fairseq-interactive would print for this prediction (without their ids, like segment_words.run_fairseq)
+def prediction_to_fairseq_output(word, prediction):
+    score_and_hypothesis = f"{prediction['score']}\t{prediction['hypothesis']}"
+    positional_scores = " ".join(f"{score:.4f}" for score in prediction["positional_scores"])
+    return [("S", word), ("H", score_and_hypothesis), ("D", score_and_hypothesis), ("P", positional_scores)]
@@ -0,0 +1,118 @@
+# *** Runs the segmentation ensemble on each word type only once ***
+# Instead of piping every word token in the input file through fairseq-interactive, this sends each distinct word once,
+# then writes the output as if every token had been run (same S-/W-/H-/D-/P- lines, numbered in token order),
+# so test_seg.py and pipeline.py can read it exactly as before.
+# With --cache_file, words already segmented by the same checkpoints (decoded the same way) in an earlier run are taken from the cache
+# (see segmentation_cache.py), and only the rest are sent to fairseq.
+# With --in_process, the ensemble is loaded and run here (see seg_model.py) rather than through fairseq-interactive.
+import click
+import re
+import shlex
+import subprocess
+from glossed_data_utilities import as_percent
+import seg_model
+import segmentation_cache
+
+FAIRSEQ_OUTPUT_LINE_REGEX = re.compile(r"^([SWHDP])-(\d+)\t(.*)$")
+DEFAULT_FAIRSEQ_COMMAND = "fairseq-interactive"
+DEFAULT_DATA_DIR = "data-bin"
+
+# Returns the lines of the char-level input file (one word per line, as written by preprocess_seg.py)
+def read_words(input_file):
+    with open(input_file) as file:
+        return [line.rstrip("\n") for line in file]
+
+# Returns each distinct word once, in the order they first appear
+def get_word_types(words):
+    return list(dict.fromkeys(words))
+
+# Splits fairseq-interactive output into the lines for each input line, by their id
+# Returns any other lines (e.g., logging), and a dict from id to a list of (line type, rest of line) pairs
+def parse_fairseq_output(output_lines):
+    other_lines = []
+    output_by_id = {}
+    for line in output_lines:
+        match = FAIRSEQ_OUTPUT_LINE_REGEX.match(line)
+        if match:
+            output_by_id.setdefault(int(match.group(2)), []).append((match.group(1), match.group(3)))
+        else:
+            other_lines.append(line)
+
+    return other_lines, output_by_id
+
+# Runs the ensemble on the given words (one fairseq-interactive call)
+# Returns any non-prediction output lines, and a dict from each word to its fairseq output
+def run_fairseq(words, models, data_dir = DEFAULT_DATA_DIR, fairseq_command = DEFAULT_FAIRSEQ_COMMAND):
+    if not words:
+        return [], {}
+
+    command = shlex.split(fairseq_command) + ["--path", models, data_dir]
+    result = subprocess.run(command, input = "".join(word + "\n" for word in words), stdout = subprocess.PIPE, text = True, check = True)
+    other_lines, output_by_id = parse_fairseq_output(result.stdout.splitlines())
+    assert len(output_by_id) == len(words), f"fairseq returned output for {len(output_by_id)} of the {len(words)} words given to it."
+
+    return other_lines, {word: output_by_id[i] for i, word in enumerate(words)}
+
+# Like run_fairseq, but runs the ensemble in this process, in batches of words of similar length
+def run_in_process(words, models, data_dir = DEFAULT_DATA_DIR, batch_size = seg_model.DEFAULT_BATCH_SIZE, beam = seg_model.DEFAULT_BEAM):
+    if not words:
+        return [], {}
+
+    predictions = seg_model.segment(words, seg_model.load_ensemble(models, data_dir, beam), batch_size)
+
+    return [], {word: seg_model.prediction_to_fairseq_output(word, prediction) for word, prediction in zip(words, predictions)}
+
+# Describes how the words are decoded, for the cache (the same checkpoints can give different output with a different beam,
+# or in-process rather than through fairseq-interactive)
+def get_decoding(in_process, beam, fairseq_command = DEFAULT_FAIRSEQ_COMMAND):
+    if in_process:
+        return f"in_process --beam {beam}"
+    return " ".join(shlex.split(fairseq_command))
+
+# Writes the output for every word token, numbered in token order (as if fairseq had been run on every token)
+def write_fairseq_output(words, output_by_word, output_file, other_lines = []):
+    with open(output_file, "w") as file:
+        file.writelines(line + "\n" for line in other_lines)
+        for i, word in enumerate(words):
+            file.writelines(f"{line_type}-{i}\t{rest_of_line}\n" for line_type, rest_of_line in output_by_word[word])
+
+@click.command()
+@click.option("--input_file", required = True, help = "The char-level file of words to segment (e.g., generated_data/test.input).")
+@click.option("--output_file", required = True, help = "Where to write the fairseq-formatted output.")
+@click.option("--models", required = True, help = "The model checkpoint(s) to use, separated by colons (as for fairseq-interactive --path).")
+@click.option("--data_dir", default = DEFAULT_DATA_DIR, show_default = True, help = "The fairseq data directory with the dictionaries.")
+@click.option("--fairseq_command", default = DEFAULT_FAIRSEQ_COMMAND, show_default = True, help = "The command used to run fairseq-interactive.")
+@click.option("--in_process", is_flag = True, help = "Load and run the ensemble in this process instead of calling fairseq-interactive.")
+@click.option("--batch_size", default = seg_model.DEFAULT_BATCH_SIZE, show_default = True, help = "With --in_process, how many words to decode at once.")
+@click.option("--beam", default = seg_model.DEFAULT_BEAM, show_default = True, help = "With --in_process, the beam size to decode with.")
+@click.option("--cache_file", help = "Optional SQLite file to keep segmentations in between runs (created if it doesn't exist).")
+@click.option("--max_cache_entries", default = segmentation_cache.DEFAULT_MAX_ENTRIES, show_default = True, help = "The most words the cache will hold (the least recently used are removed first).")
+def main(input_file, output_file, models, data_dir, fairseq_command, in_process, batch_size, beam, cache_file, max_cache_entries):
+    words = read_words(input_file)
+    word_types = get_word_types(words)
+    print(f"Segmenting {len(word_types)} word types for {len(words)} word tokens ({as_percent(len(word_types) / max(len(words), 1))}% of the tokens).")
+
+    if cache_file:
+        connection = segmentation_cache.connect(cache_file)
+        ensemble_id = segmentation_cache.get_ensemble_id(connection, models, data_dir, get_decoding(in_process, beam, fairseq_command))
+        output_by_word = segmentation_cache.look_up(connection, ensemble_id, word_types)
+        print(f"{len(output_by_word)}/{len(word_types)} word types ({as_percent(len(output_by_word) / max(len(word_types), 1))}%) were found in the cache.")
+    else:
+        output_by_word = {}
+
+    words_to_run = [word for word in word_types if word not in output_by_word]
+    if in_process:
+        other_lines, new_output_by_word = run_in_process(words_to_run, models, data_dir, batch_size, beam)
+    else:
+        other_lines, new_output_by_word = run_fairseq(words_to_run, models, data_dir, fairseq_command)
+    output_by_word.update(new_output_by_word)
+
+    if cache_file:
+        segmentation_cache.store(connection, ensemble_id, new_output_by_word, max_cache_entries)
+        connection.close()
+
+    write_fairseq_output(words, output_by_word, output_file, other_lines)
+    print(f"Wrote the output for all {len(words)} tokens to {output_file}.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# *** A persistent cache of segmentation model output, by word ***
+# Stored in a local SQLite file, so words that were already segmented (by the same ensemble) in an earlier run
+# don't have to go through fairseq again.  Each ensemble is the exact set of checkpoints passed to fairseq-interactive
+# (the colon-separated --path, as absolute paths) along with how they're decoded (e.g., the fairseq-interactive command,
+# or running in-process with a given beam size), and its cached words are thrown out as soon as any of its checkpoints
+# (or the dictionaries in the data directory) change.
+# The cache holds at most a set number of words; past that, the least recently used ones are removed.
+from glob import glob
+from hashlib import sha1
+from os import path, stat
+import sqlite3
+from time import time
+
+DEFAULT_CACHE_FILE = "./segmentation_cache.db"
+DEFAULT_MAX_ENTRIES = 1000000
+# SQLite limits how many values can be passed to one query
+WORDS_PER_QUERY = 500
+
+CREATE_TABLES = """
+CREATE TABLE IF NOT EXISTS ensembles (
+    ensemble_id INTEGER PRIMARY KEY,
+    models TEXT NOT NULL,
+    decoding TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    UNIQUE (models, decoding)
+);
+CREATE TABLE IF NOT EXISTS segmentations (
+    ensemble_id INTEGER NOT NULL REFERENCES ensembles(ensemble_id) ON DELETE CASCADE,
+    word TEXT NOT NULL,
+    output TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (ensemble_id, word)
+);
+CREATE INDEX IF NOT EXISTS segmentations_by_last_used ON segmentations (last_used);
+"""
+
+def connect(cache_file = DEFAULT_CACHE_FILE):
+    connection = sqlite3.connect(cache_file)
+    connection.execute("PRAGMA foreign_keys = ON")
+    # Caches from before ensembles were keyed by how they're decoded can't tell which words came from which decoding,
+    # so they're started over
+    ensemble_columns = [row[1] for row in connection.execute("PRAGMA table_info(ensembles)")]
+    if ensemble_columns and "decoding" not in ensemble_columns:
+        print(f"{cache_file} is from an older version of the cache, so it was cleared.")
+        connection.executescript("DROP TABLE segmentations; DROP TABLE ensembles;")
+    connection.executescript(CREATE_TABLES)
+    return connection
+
+# Returns the checkpoints (given colon-separated, as for fairseq-interactive --path) as absolute paths, still colon-separated,
+# so the same checkpoints are the same ensemble whichever directory they're given from
+def get_absolute_models(models):
+    return ":".join(path.abspath(model) for model in models.split(":"))
+
+# Identifies the current version of every checkpoint (and the dictionaries they're used with)
+# Uses each file's size and modification time rather than its contents, so checkpoints don't have to be re-read on every run
+def get_fingerprint(models, data_dir):
+    files = models.split(":") + sorted(glob(path.join(data_dir, "dict.*.txt")))
+    fingerprint = sha1()
+    for file in files:
+        file_stat = stat(file)
+        fingerprint.update(f"{path.abspath(file)}\t{file_stat.st_size}\t{file_stat.st_mtime_ns}\n".encode())
+
+    return fingerprint.hexdigest()
+
+# Returns the id for this set of checkpoints, decoded this way (see segment_words.get_decoding),
+# clearing out its cached words if any of the files have changed
+def get_ensemble_id(connection, models, data_dir, decoding):
+    models = get_absolute_models(models)
+    fingerprint = get_fingerprint(models, data_dir)
+    existing = connection.execute("SELECT ensemble_id, fingerprint FROM ensembles WHERE models = ? AND decoding = ?", (models, decoding)).fetchone()
+    with connection:
+        if existing and existing[1] == fingerprint:
+            return existing[0]
+        if existing:
+            print(f"The checkpoints in {models} have changed since they were cached, so their cached segmentations were cleared.")
+            connection.execute("DELETE FROM ensembles WHERE ensemble_id = ?", (existing[0],))
+        cursor = connection.execute("INSERT INTO ensembles (models, decoding, fingerprint) VALUES (?, ?, ?)", (models, decoding, fingerprint))
+
+    return cursor.lastrowid
+
+# Fairseq output for a word is stored as its lines (without the line ids), e.g. "H\t-0.04\tk a s"
+def _output_to_text(output):
+    return "\n".join(line_type + "\t" + rest_of_line for line_type, rest_of_line in output)
+
+def _text_to_output(text):
+    return [tuple(line.split("\t", 1)) for line in text.split("\n")]
+
+# Returns a dict from each word that's in the cache to its fairseq output (see segment_words.run_fairseq)
+def look_up(connection, ensemble_id, words):
+    output_by_word = {}
+    for start in range(0, len(words), WORDS_PER_QUERY):
+        words_to_query = words[start : start + WORDS_PER_QUERY]
+        query = "SELECT word, output FROM segmentations WHERE ensemble_id = ? AND word IN (" + ", ".join("?" for word in words_to_query) + ")"
+        for word, text in connection.execute(query, [ensemble_id] + words_to_query):
+            output_by_word[word] = _text_to_output(text)
+
+    with connection:
+        connection.executemany("UPDATE segmentations SET last_used = ? WHERE ensemble_id = ? AND word = ?", ((time(), ensemble_id, word) for word in output_by_word))
+
+    return output_by_word
+
+# Adds the output for these words, then removes the least recently used words if the cache is over max_entries
+def store(connection, ensemble_id, output_by_word, max_entries = DEFAULT_MAX_ENTRIES):
+    now = time()
+    with connection:
+        connection.executemany("INSERT OR REPLACE INTO segmentations (ensemble_id, word, output, last_used) VALUES (?, ?, ?, ?)", ((ensemble_id, word, _output_to_text(output), now) for word, output in output_by_word.items()))
+        entry_count = connection.execute("SELECT COUNT(*) FROM segmentations").fetchone()[0]
+        if entry_count > max_entries:
+            connection.execute("DELETE FROM segmentations WHERE rowid IN (SELECT rowid FROM segmentations ORDER BY last_used LIMIT ?)", (entry_count - max_entries,))
@@ -0,0 +1,191 @@
+# *** Runs the whole pipeline in one go, from transcriptions to glosses ***
+# Unlike run_seg.sh followed by run_pipeline.sh, nothing goes through the disk in between:
+# the sentences are read in batches, and each batch is passed along a chain of stages that all run at the same time
+# (reading -> segmenting -> glossing -> writing), each in its own thread, connected by queues.
+# The segmenter is either the fairseq ensemble (run in-process, see seg_model.py) or a CRF from crf_seg.py,
+# and the glossing model is loaded from a file (or trained once from --gloss_train_file and saved there).
+# The output is the same four-line format as pipeline.py's pipeline_pred.txt.
+# The input only needs its transcription lines; any missing lines (e.g., seg and gloss) are filled in by the predictions.
+import click
+from os import path
+import pickle
+from queue import Queue
+from threading import Thread
+import crf_seg
+from gloss import index_stems, make_sentence_list_with_prediction, reassemble_predicted_words, remove_OOL_from_X_or_y, run_system, seg_line_to_features
+from glossed_data_utilities import add_back_OOL_words, handle_OOL_words_in_line, read_file
+from pipeline import remove_boundary_errors, train_gloss_model
+from preprocess_seg import tokenize_words, MODIFIER_CHARACTERS
+import seg_model
+from test_seg import predictions_to_sentences
+
+SENTENCES_PER_BATCH = 1000
+# How many batches each stage can get ahead of the next one
+BATCHES_PER_QUEUE = 4
+DEFAULT_GLOSS_MODEL_FILE = "gloss_model.pkl"
+DEFAULT_OUTPUT_FILE = "generated_data/pipeline_pred.txt"
+# Marks the end of the input, as it's passed down the chain
+END_OF_INPUT = None
+
+# Returns a function that segments a list of char-level words, with whichever segmenter was chosen
+def load_segmenter(seg_crf_file, models, data_dir, batch_size, beam):
+    if seg_crf_file:
+        with open(seg_crf_file, "rb") as file:
+            crf = pickle.load(file)
+        return lambda words: crf_seg.segment(words, crf)
+
+    loaded_ensemble = seg_model.load_ensemble(models, data_dir, beam)
+    return lambda words: [prediction["hypothesis"] for prediction in seg_model.segment(words, loaded_ensemble, batch_size)]
+
+# Replaces (or removes) OOL words in one line, without changing the number of words in it otherwise
+def _handle_OOL_words_in_line(line, replace = False):
+    return " ".join(handle_OOL_words_in_line(line.split(), replace)[0])
+
+# Gives every example enough lines to hold the predicted seg and gloss lines
+def _fill_in_lines(batch, line_count):
+    return [example + [""] * (line_count - len(example)) for example in batch]
+
+# Segments a batch of examples, returning them with their seg lines replaced by the predictions
+# (like preprocess_seg.py, then the segmenter, then test_seg.py)
+def segment_batch(batch, segment_words, modifier_characters, segmentation_line_number):
+    # Like preprocess_seg.py, the input is the lowercased transcription words, without OOL words
+    words = [word.lower() for example in batch for word in handle_OOL_words_in_line(example[0].split())[0]]
+    char_level_words = [" ".join(tokens) for tokens in tokenize_words(words, modifier_characters)]
+    return predictions_to_sentences(segment_words(char_level_words) if char_level_words else [], batch, segmentation_line_number)
+
+# Glosses a batch of examples that have predicted seg lines, returning them with their gloss lines replaced by the predictions
+# (like pipeline.py)
+def gloss_batch(seg_output, gloss_model, stem_index, segmentation_line_number, gloss_line_number):
+    stem_dict, crf = gloss_model
+    seg_lines = remove_boundary_errors(example[segmentation_line_number] for example in seg_output)
+    # Replace OOL words with the OOL label for the features, and take them out altogether for the word boundaries
+    seg_lines_with_OOL_labels = [_handle_OOL_words_in_line(line, replace = True) for line in seg_lines]
+    seg_lines_with_boundaries = [_handle_OOL_words_in_line(line) for line in seg_lines_with_OOL_labels]
+
+    X = [seg_line_to_features(line) for line in seg_lines_with_OOL_labels]
+    remove_OOL_from_X_or_y(X, is_X = True)
+    pred_y = run_system(X, None, seg_lines_with_boundaries, crf, stem_dict, stem_index)
+
+    pred_gloss_lines = add_back_OOL_words([example[0] for example in seg_output], reassemble_predicted_words([line.split() for line in seg_lines_with_boundaries], pred_y))
+    return make_sentence_list_with_prediction(seg_output, pred_gloss_lines, gloss_line_number)
+
+# Reads the examples a batch at a time, splitting them up like glossed_data_utilities.read_file
+def read_batches(input_file, line_count):
+    batch = []
+    example = []
+    with open(input_file) as file:
+        for line in file:
+            if line == "\n":
+                if example:
+                    batch.append(example)
+                    example = []
+                    if len(batch) >= SENTENCES_PER_BATCH:
+                        yield _fill_in_lines(batch, line_count)
+                        batch = []
+            else:
+                example.append(line.strip())
+    if example:
+        batch.append(example)
+    if batch:
+        yield _fill_in_lines(batch, line_count)
+
+# Writes each batch as soon as it comes in, in the same format as glossed_data_utilities.write_sentences
+# Returns how many examples were written
+def write_batches(batches, output_file):
+    example_count = 0
+    with open(output_file, "w") as file:
+        for batch in batches:
+            for example in batch:
+                if example_count > 0:
+                    file.write("\n")
+                file.writelines(line + "\n" for line in example)
+                example_count += 1
+
+    return example_count
+
+# Runs one stage of the chain: takes each batch from input_queue, and puts what the function returns for it on output_queue
+# If the stage fails, the error is kept (so it can be raised once everything stops), and the rest of the chain is told to stop
+def _run_stage(function, input_queue, output_queue, errors):
+    while True:
+        batch = input_queue.get()
+        if batch is END_OF_INPUT:
+            break
+        try:
+            output_queue.put(function(batch))
+        except Exception as error:
+            errors.append(error)
+            # Keep taking batches, so the stage before this one doesn't get stuck
+            while input_queue.get() is not END_OF_INPUT:
+                pass
+            break
+    output_queue.put(END_OF_INPUT)
+
+# Yields the batches that come out of the end of the chain
+def run_chain(batches, stage_functions):
+    errors = []
+    queues = [Queue(maxsize = BATCHES_PER_QUEUE) for i in range(len(stage_functions) + 1)]
+    threads = [Thread(target = _run_stage, args = (function, queues[i], queues[i + 1], errors), daemon = True) for i, function in enumerate(stage_functions)]
+    for thread in threads:
+        thread.start()
+
+    def feed():
+        for batch in batches:
+            if errors:
+                break
+            queues[0].put(batch)
+        queues[0].put(END_OF_INPUT)
+    feeder = Thread(target = feed, daemon = True)
+    feeder.start()
+
+    while True:
+        batch = queues[-1].get()
+        if batch is END_OF_INPUT:
+            break
+        yield batch
+
+    for thread in threads + [feeder]:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+@click.command()
+@click.option("--input_file", required = True, help = "The sentences to segment and gloss (only the transcription lines are used).")
+@click.option("--output_file", default = DEFAULT_OUTPUT_FILE, show_default = True, help = "Where to write the sentences with their predicted seg and gloss lines.")
+@click.option("--seg_crf_file", help = "Segment with this CRF (from crf_seg.py) instead of the fairseq ensemble.")
+@click.option("--models", help = "The fairseq checkpoint(s) to segment with, separated by colons (as in run_seg.sh).")
+@click.option("--data_dir", default = seg_model.DEFAULT_DATA_DIR, show_default = True, help = "With --models, the fairseq data directory with the dictionaries.")
+@click.option("--batch_size", default = seg_model.DEFAULT_BATCH_SIZE, show_default = True, help = "With --models, how many words to decode at once.")
+@click.option("--beam", default = seg_model.DEFAULT_BEAM, show_default = True, help = "With --models, the beam size to decode with.")
+@click.option("--modifier_character", "modifier_characters", multiple = True, default = MODIFIER_CHARACTERS, show_default = True, help = "A character to keep attached to the char before it (as in preprocess_seg.py).  Can be repeated.")
+@click.option("--gloss_model_file", default = DEFAULT_GLOSS_MODEL_FILE, show_default = True, help = "The saved glossing model to use (or where to save it, with --gloss_train_file).")
+@click.option("--gloss_train_file", help = "Train the glossing model on this file first, and save it to --gloss_model_file.")
+@click.option("--segmentation_line_number", required = True, help = "The line that contains the segmented sentence.  For example if there are four lines each and the segmentation is the second line, this will be 2.")
+@click.option("--gloss_line_number", required = True, help = "The line that contains the glossed sentence.  For example if there are four lines each and the gloss is the third line, this will be 3.")
+def main(input_file, output_file, seg_crf_file, models, data_dir, batch_size, beam, modifier_characters, gloss_model_file, gloss_train_file, segmentation_line_number, gloss_line_number):
+    assert seg_crf_file or models, "Either --seg_crf_file or --models is needed to segment."
+    # Convert right away to prevent off-by-one errors
+    segmentation_line_number = int(segmentation_line_number) - 1
+    gloss_line_number = int(gloss_line_number) - 1
+
+    if gloss_train_file:
+        gloss_model = train_gloss_model(read_file(gloss_train_file), segmentation_line_number, gloss_line_number)
+        with open(gloss_model_file, "wb") as file:
+            pickle.dump(gloss_model, file)
+        print(f"Saved the glossing model to {gloss_model_file}.")
+    else:
+        assert path.exists(gloss_model_file), f"There's no glossing model at {gloss_model_file}; use --gloss_train_file to train one."
+        with open(gloss_model_file, "rb") as file:
+            gloss_model = pickle.load(file)
+    stem_index = index_stems(gloss_model[0])
+    segment_words = load_segmenter(seg_crf_file, models, data_dir, batch_size, beam)
+
+    line_count = max(segmentation_line_number, gloss_line_number) + 1
+    stages = [
+        lambda batch: segment_batch(batch, segment_words, modifier_characters, segmentation_line_number),
+        lambda batch: gloss_batch(batch, gloss_model, stem_index, segmentation_line_number, gloss_line_number)
+    ]
+    example_count = write_batches(run_chain(read_batches(input_file, line_count), stages), output_file)
+    print(f"Wrote {example_count} segmented and glossed sentences to {output_file}.")
+
+if __name__ == '__main__':
+    main()
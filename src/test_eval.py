@@ -14,13 +14,29 @@ def check_results(outputted_results, expected_results):
         else:
             print(f"\nIncorrect evaluation result for {col_name}.\nExpected {expected_result}, but got {outputted_result}.")
 
+def check_output(output_lines, expected_lines):
+    assert len(output_lines) == len(expected_lines), f"The number of lines in the output file ({len(output_lines)}) does not match the number of expected lines ({len(expected_lines)})."
+    for line_number, (output_line, expected_line) in enumerate(zip(output_lines, expected_lines)):
+        if output_line != expected_line:
+            print(f"\nIncorrect output on line {line_number + 1}.\nExpected {expected_line!r}, but got {output_line!r}.")
+
 @click.command()
-@click.option("--results_csv", required = True, help = "The path to the CSV where the eval results are being printed.")
-@click.option("--expected_results", required = True, help = "A string representing the row of eval results we expect for the test data.")
-def main(results_csv, expected_results):
-    print("*** Checking evaluation results... ***")
-    current_results = (pd.read_csv(results_csv, keep_default_na = False)).tail(1)
-    check_results(current_results, expected_results.split(","))
-    print("*** Finished check for incorrect evaluation. ***\n\n")
+@click.option("--results_csv", help = "The path to the CSV where the eval results are being printed.")
+@click.option("--expected_results", help = "A string representing the row of eval results we expect for the test data.")
+@click.option("--output_file", help = "The path to an output file (e.g., of prepared sentences) to check, instead of a results CSV.")
+@click.option("--expected_output_file", help = "The path to the file we expect the output file to be identical to.")
+def main(results_csv, expected_results, output_file, expected_output_file):
+    if output_file:
+        assert expected_output_file, "--expected_output_file is needed with --output_file."
+        print("*** Checking output... ***")
+        with open(output_file) as output, open(expected_output_file) as expected:
+            check_output(output.read().split("\n"), expected.read().split("\n"))
+        print("*** Finished check for incorrect output. ***\n\n")
+    else:
+        assert results_csv and expected_results, "--results_csv and --expected_results are needed (or --output_file and --expected_output_file)."
+        print("*** Checking evaluation results... ***")
+        current_results = (pd.read_csv(results_csv, keep_default_na = False)).tail(1)
+        check_results(current_results, expected_results.split(","))
+        print("*** Finished check for incorrect evaluation. ***\n\n")
 
 main()
\ No newline at end of file
@@ -1,6 +1,10 @@
 SEG_RESULTS_CSV=./seg_results.csv
 GLOSS_RESULTS_CSV=./gloss_results.csv
 PIPELINE_RESULTS_CSV=./pipeline_results.csv
+PREP_OUTPUT=./prep_output.txt
+SEG_PRED_OUTPUT=./generated_data/seg_pred.txt
+BINARIZED_DIR=./generated_data/data-bin/
+DECODED_OUTPUT=./decoded_output.txt
 SEG_LINE_NUMBER=2
 GLOSS_LINE_NUMBER=3
 
@@ -66,6 +70,17 @@ GOLD_OUTPUT_TIGER=./src/test_data/test_21.output
 # Type-sensitive: TP: iiiiii FP: iii FN: iiiii
 EXPECTED_RESULTS_TIGER="0.00%,77.78%,63.64%,70.00%,66.67%,54.55%,60.00%,81.82%,50.00%,0.00%"
 
+# The same as TIGER, but with OOL words in the whole input (at the start, middle, and end of sentences),
+# which should be left out of the evaluation, and added back in the right places in the predicted sentences
+# The expected predicted sentences are from the original OOL handling
+WHOLE_INPUT_OOL=./src/test_data/test_ool.txt
+INPUT_OOL=./src/test_data/test_1.input
+TRAIN_INPUT_OOL=./src/test_data/test_21_train.input
+OUTPUT_OOL=./src/test_data/test_fairseq_21.output
+GOLD_OUTPUT_OOL=./src/test_data/test_21.output
+EXPECTED_RESULTS_OOL="0.00%,77.78%,63.64%,70.00%,66.67%,54.55%,60.00%,81.82%,50.00%,0.00%"
+EXPECTED_PRED_OUTPUT_OOL=./src/test_data/test_ool_seg_pred.txt
+
 # Gold all grams, predicted all grams, all wrong
 GOLD_7=./src/test_data/test_1.txt
 OUTPUT_7=./src/test_data/test_7_pred.txt
@@ -130,6 +145,12 @@ OUTPUT_16=./src/test_data/test_16_pred.txt
 STEM_DICT_16="{\"jkasdn\": \"something\", \"kasdn\": \"something\", \"a\": \"something\"}"
 EXPECTED_RESULTS_16="62.50%,50.00%,66.67%,60.00%,50.00%,75.00%,50.00%"
 
+# The same as 16, but with OOL words (which shouldn't change the results)
+GOLD_OOL=./src/test_data/test_ool_3.txt
+OUTPUT_OOL_GLOSS=./src/test_data/test_ool_16_pred.txt
+STEM_DICT_OOL="{\"jkasdn\": \"something\", \"kasdn\": \"something\", \"a\": \"something\"}"
+EXPECTED_RESULTS_OOL_GLOSS="62.50%,50.00%,66.67%,60.00%,50.00%,75.00%,50.00%"
+
 # Mixed stems/grams, glosses correct but seg mistakes, (incl. boundary-only mistakes), no OOV words
 GOLD_17=./src/test_data/test_3.txt
 INPUT_17=./src/test_data/test_1.input
@@ -161,6 +182,20 @@ INPUT_20=./src/test_data/test_1.input
 TRAIN_INPUT_20=./src/test_data/test_21_train.input
 EXPECTED_RESULTS_20="57.14%,85.71%,50.00%,50.00%,0.00%"
 
+# Tidying, clitic separation (single/double pro- and enclitics, incl. a gloss word with no clitic boundary to split),
+# OOL marking and removal, and stress fixing, both one function at a time and in stages
+# The expected output is from the original functions
+INPUT_PREP_1=./src/test_data/test_prep.txt
+CLITICS_PREP_1=./src/test_data/test_prep_clitics.json
+OOL_WORD_PREP_1=Mary
+EXPECTED_OUTPUT_PREP_1=./src/test_data/test_prep.output
+
+# Binarized fairseq datasets written by preprocess_seg.py, read back with fairseq's index layout
+# and turned back into symbols, should match the char-level files they were written from
+TRAIN_BIN=./src/test_data/test_ool.txt
+DEV_BIN=./src/test_data/test_3.txt
+TEST_BIN=./src/test_data/test_1.txt
+
 echo "Segmentation Test 1:"
 python3 src/test_seg.py --whole_input_file=$WHOLE_INPUT_1 --output_file=$OUTPUT_1 --output_file_is_fairseq_formatted --gold_output_file=$GOLD_OUTPUT_1 --train_input_file=$TRAIN_INPUT_1 --test_input_file=$INPUT_1 > /dev/null
 python3 src/test_eval.py --results_csv=$SEG_RESULTS_CSV --expected_results=$EXPECTED_RESULTS_1
@@ -189,6 +224,11 @@ echo "Segmentation Test 7:"
 python3 src/test_seg.py --whole_input_file=$WHOLE_INPUT_TIGER --output_file=$OUTPUT_TIGER --output_file_is_fairseq_formatted --gold_output_file=$GOLD_OUTPUT_TIGER --train_input_file=$TRAIN_INPUT_TIGER --test_input_file=$INPUT_TIGER > /dev/null
 python3 src/test_eval.py --results_csv=$SEG_RESULTS_CSV --expected_results=$EXPECTED_RESULTS_TIGER
 
+echo "Segmentation Test 8:"
+python3 src/test_seg.py --whole_input_file=$WHOLE_INPUT_OOL --output_file=$OUTPUT_OOL --output_file_is_fairseq_formatted --gold_output_file=$GOLD_OUTPUT_OOL --train_input_file=$TRAIN_INPUT_OOL --test_input_file=$INPUT_OOL > /dev/null
+python3 src/test_eval.py --results_csv=$SEG_RESULTS_CSV --expected_results=$EXPECTED_RESULTS_OOL
+python3 src/test_eval.py --output_file=$SEG_PRED_OUTPUT --expected_output_file=$EXPECTED_PRED_OUTPUT_OOL
+
 echo "Gloss Test 1:"
 echo $STEM_DICT_7 > stem_dict.txt
 python3 src/eval_gloss.py --test_file=$GOLD_7 --output_file=$OUTPUT_7 --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER > /dev/null
@@ -239,6 +279,11 @@ echo $STEM_DICT_16 > stem_dict.txt
 python3 src/eval_gloss.py --test_file=$GOLD_16 --output_file=$OUTPUT_16 --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER > /dev/null
 python3 src/test_eval.py --results_csv=$GLOSS_RESULTS_CSV --expected_results=$EXPECTED_RESULTS_16
 
+echo "Gloss Test 11:"
+echo $STEM_DICT_OOL > stem_dict.txt
+python3 src/eval_gloss.py --test_file=$GOLD_OOL --output_file=$OUTPUT_OOL_GLOSS --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER > /dev/null
+python3 src/test_eval.py --results_csv=$GLOSS_RESULTS_CSV --expected_results=$EXPECTED_RESULTS_OOL_GLOSS
+
 echo "Pipeline Test 1:"
 python3 src/eval_pipeline.py --test_file=$GOLD_17 --output_file=$OUTPUT_17 --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER --train_input_file=$TRAIN_INPUT_17 --test_input_file=$INPUT_17 > /dev/null
 python3 src/test_eval.py --results_csv=$PIPELINE_RESULTS_CSV --expected_results=$EXPECTED_RESULTS_17
@@ -254,3 +299,21 @@ python3 src/test_eval.py --results_csv=$PIPELINE_RESULTS_CSV --expected_results=
 echo "Pipeline Test 4:"
 python3 src/eval_pipeline.py --test_file=$GOLD_20 --output_file=$OUTPUT_20 --segmentation_line_number=$SEG_LINE_NUMBER --gloss_line_number=$GLOSS_LINE_NUMBER --train_input_file=$TRAIN_INPUT_20 --test_input_file=$INPUT_20 > /dev/null
 python3 src/test_eval.py --results_csv=$PIPELINE_RESULTS_CSV --expected_results=$EXPECTED_RESULTS_20
+
+echo "Preparation Test 1:"
+rm -f $PREP_OUTPUT
+python3 src/corpus_prep.py --input_file=$INPUT_PREP_1 --clitics_file=$CLITICS_PREP_1 --OOL_word=$OOL_WORD_PREP_1 --output_file=$PREP_OUTPUT > /dev/null
+python3 src/test_eval.py --output_file=$PREP_OUTPUT --expected_output_file=$EXPECTED_OUTPUT_PREP_1
+
+echo "Binarization Test 1:"
+rm -rf $BINARIZED_DIR
+python3 src/preprocess_seg.py --train_file=$TRAIN_BIN --dev_file=$DEV_BIN --test_file=$TEST_BIN --binarize_to=$BINARIZED_DIR > /dev/null
+rm -f $DECODED_OUTPUT
+python3 src/fairseq_data.py --dataset=${BINARIZED_DIR}train.input-output.input --dictionary=${BINARIZED_DIR}dict.input.txt --output_file=$DECODED_OUTPUT
+python3 src/test_eval.py --output_file=$DECODED_OUTPUT --expected_output_file=./generated_data/train.input
+
+echo "Binarization Test 2:"
+rm -f $DECODED_OUTPUT
+python3 src/fairseq_data.py --dataset=${BINARIZED_DIR}valid.input-output.output --dictionary=${BINARIZED_DIR}dict.output.txt --output_file=$DECODED_OUTPUT
+python3 src/test_eval.py --output_file=$DECODED_OUTPUT --expected_output_file=./generated_data/dev.output
+rm -f $DECODED_OUTPUT
@@ -4,6 +4,7 @@ import re
 from gloss import make_sentence_list_with_prediction
 from glossed_data_handling_utilities import  REGULAR_BOUNDARY, CLITIC_BOUNDARY, REDUPLICATION_BOUNDARY, LEFT_INFIX_BOUNDARY, RIGHT_INFIX_BOUNDARY, LEFT_REDUP_INFIX_BOUNDARY, RIGHT_REDUP_INFIX_BOUNDARY, LANG_LABEL_REGEX
 from glossed_data_utilities import add_back_OOL_words, as_percent, print_results_csv, read_file, create_file_of_sentences, OUT_OF_LANGUAGE_MARKER
+import seg_model
 
 OUTPUT_DIR = "generated_data/"
 GOLD_OUTPUT_FILE_NAME = "seg_gold.txt"
@@ -17,37 +18,60 @@ NO_RESULT_MARKER = None
 # Returns a list of lines in the file, "\n" within the line removed
 def read_lines_from_file(file_path):
     with open(file_path) as f:
-        lines = f.readlines()
-
-    formatted_lines = []
-    for line in lines:
-        line = line.replace("\n", "")
-        formatted_lines.append(line)
-
-    return formatted_lines
+        return [line.replace("\n", "") for line in f]
+
+# Reads the predictions out of fairseq output lines as they come in (so the whole output never has to be in memory),
+# yielding a (hypothesis, score) pair for each input word, in the order of the input
+# fairseq doesn't always print its output in input order (e.g., fairseq-generate goes batch by batch),
+# so a prediction that comes early is held back until all the ones before it have been yielded
+def stream_fairseq_predictions(output_lines):
+    waiting_predictions = {}
+    next_id = 0
+    for line in output_lines:
+        if line.startswith("H-"):
+            # The actual word comes after two tabs
+            line_id, score, word = line.replace("\n", "").split("\t", 2)
+            word_id = int(line_id[2:])
+            # With --nbest, there's more than one hypothesis per word: only keep the first (best) one
+            if word_id < next_id or word_id in waiting_predictions:
+                continue
+            waiting_predictions[word_id] = (word, float(score))
+            while next_id in waiting_predictions:
+                yield waiting_predictions.pop(next_id)
+                next_id += 1
+
+    assert not waiting_predictions, f"There's no fairseq output for word {next_id}, but there is for {len(waiting_predictions)} word(s) after it."
+
+def read_fairseq_predictions(output_file):
+    with open(output_file) as file:
+        yield from stream_fairseq_predictions(file)
 
 # Given the output from running fairseq on the test data, get just the actual output
 def format_fairseq_output(output):
-    formatted_output = []
-    # First, just grab all the H-X lines
-    for line in output:
-        if line.startswith("H-"):
-            # The actual word comes after two tabs
-            word = line.split("\t")[2]
-            formatted_output.append(word)
+    return [word for word, score in stream_fairseq_predictions(output)]
 
-    return formatted_output
+# Runs the ensemble on the test input in this process, instead of reading in fairseq-interactive's output
+# Returns the predicted words, in the same form as format_fairseq_output
+def segment_in_process(test_input, models, data_dir = seg_model.DEFAULT_DATA_DIR, batch_size = seg_model.DEFAULT_BATCH_SIZE, beam = seg_model.DEFAULT_BEAM):
+    word_types = list(dict.fromkeys(test_input))
+    predictions = seg_model.segment(word_types, seg_model.load_ensemble(models, data_dir, beam), batch_size)
+    hypothesis_by_word = {word: prediction["hypothesis"] for word, prediction in zip(word_types, predictions)}
 
-# Gets the boundary-level precision, recall, and F1.
-# Prints them all, or a message letting you know if there was an issue with the calculations.
-# Returns the three values in a list
-def _evaluate_f1(predicted_output, gold_output, is_type_sensitive):
+    return [hypothesis_by_word[word] for word in test_input]
+
+# Used to count a word's boundaries, by deleting them all
+BOUNDARY_DELETION_TABLE = str.maketrans("", "", "".join(ALL_BOUNDARIES))
+
+def _get_boundary_count(word):
+    return len(word) - len(word.translate(BOUNDARY_DELETION_TABLE))
+
+# Walks through a predicted and gold word (without spaces) together, to see which boundaries match up.
+# Returns the true positive, false positive, and false negative counts for this word
+def _align_boundaries(pred_seg_word, gold_seg_word, is_type_sensitive):
     true_pos = 0
     false_pos = 0
     false_neg = 0
 
-    # Go word by word,
-    # then character by character.
     # Because of normalization, the gold and pred words may not have the same number of letters.
     # And obviously, they may not match in where they've put boundaries.
     # We want to look for boundaries between each pair of letters.
@@ -63,41 +87,93 @@ def _evaluate_f1(predicted_output, gold_output, is_type_sensitive):
     # However, we will next move *only* the gold count forward, so that the next comparison
     # is at index 4 in the gold (s) but index 3 in the predicted (s).
     # Therefore, the second boundary is fairly evaluated as being correct.
-    for pred_seg_word, gold_seg_word in zip(predicted_output, gold_output):
-        pred_seg_word = pred_seg_word.replace(" ", "") # Go from w o r d -> word
-        gold_seg_word = gold_seg_word.replace(" ", "")
-
-        # We should index fully through each word, because when one ends, the other may have remaining boundaries
-        # that must be included in our counts (hence the 'or' below).
-        gold_word_index = 0
-        pred_word_index = 0
-        while gold_word_index < len(gold_seg_word) or pred_word_index < len(pred_seg_word):
-            gold_char = gold_seg_word[gold_word_index] if (gold_word_index < len(gold_seg_word)) else None
-            pred_char = pred_seg_word[pred_word_index] if (pred_word_index < len(pred_seg_word)) else None
-            # Either a true positive or a false negative
-            if gold_char in ALL_BOUNDARIES:
-                # True positive
-                # Depending on value of bool, will check for either an exact boundary match *or* any boundary
-                if (is_type_sensitive and gold_char == pred_char) or (not(is_type_sensitive) and pred_char in ALL_BOUNDARIES):
-                    true_pos += 1
-                    # Increment both counts
-                    gold_word_index += 1
-                    pred_word_index += 1
-                # False Negative
-                else:
-                    false_neg += 1
-                    # Increment only over the boundary
-                    gold_word_index += 1
-            # False positive
-            elif pred_char in ALL_BOUNDARIES:
-                false_pos += 1
-                # Increment only over the boundary
+    # We should index fully through each word, because when one ends, the other may have remaining boundaries
+    # that must be included in our counts (hence the 'or' below).
+    gold_word_index = 0
+    pred_word_index = 0
+    while gold_word_index < len(gold_seg_word) or pred_word_index < len(pred_seg_word):
+        gold_char = gold_seg_word[gold_word_index] if (gold_word_index < len(gold_seg_word)) else None
+        pred_char = pred_seg_word[pred_word_index] if (pred_word_index < len(pred_seg_word)) else None
+        # Either a true positive or a false negative
+        if gold_char in ALL_BOUNDARIES:
+            # True positive
+            # Depending on value of bool, will check for either an exact boundary match *or* any boundary
+            if (is_type_sensitive and gold_char == pred_char) or (not(is_type_sensitive) and pred_char in ALL_BOUNDARIES):
+                true_pos += 1
+                # Increment both counts
+                gold_word_index += 1
                 pred_word_index += 1
+            # False Negative
             else:
-                # Neither was a boundary, so just increment both counts
+                false_neg += 1
+                # Increment only over the boundary
                 gold_word_index += 1
-                pred_word_index += 1
+        # False positive
+        elif pred_char in ALL_BOUNDARIES:
+            false_pos += 1
+            # Increment only over the boundary
+            pred_word_index += 1
+        else:
+            # Neither was a boundary, so just increment both counts
+            gold_word_index += 1
+            pred_word_index += 1
+
+    return true_pos, false_pos, false_neg
+
+# Gets all the counts the segmentation metrics are calculated from, in one pass over the words
+# A word that was predicted exactly right doesn't need to be walked through: every one of its boundaries is a true positive.
+# (Type-sensitive and -insensitive alignments can go different ways, so a wrong word is walked through once for each.)
+# The OOV counts are only included if both train_input and test_input are given.
+def count_results(output, gold_output, train_input = None, test_input = None):
+    counts = {
+        "words": 0,
+        "correct_words": 0,
+        "pred_boundaries": 0,
+        "gold_boundaries": 0,
+        # [true positives, false positives, false negatives]
+        "boundary_matches": [0, 0, 0],
+        "typed_boundary_matches": [0, 0, 0],
+        "OOV_words": None,
+        "OOV_incorrect_words": None
+    }
+    assert len(output) == len(gold_output), f"\nError: There are {len(output)} predicted words, and {len(gold_output)} gold words."
+    do_count_OOV = train_input is not None and test_input is not None
+    if do_count_OOV:
+        assert len(test_input) == len(output), f"\nError: There are {len(output)} predicted words, and {len(test_input)} test input words."
+        train_words = set(train_input)
+        counts["OOV_words"] = 0
+        counts["OOV_incorrect_words"] = 0
+
+    for i, (output_seg_word, gold_seg_word) in enumerate(zip(output, gold_output)):
+        counts["words"] += 1
+        gold_boundary_count = _get_boundary_count(gold_seg_word)
+        counts["gold_boundaries"] += gold_boundary_count
+        is_correct = (output_seg_word == gold_seg_word)
+        if is_correct:
+            counts["correct_words"] += 1
+            counts["pred_boundaries"] += gold_boundary_count
+            counts["boundary_matches"][0] += gold_boundary_count
+            counts["typed_boundary_matches"][0] += gold_boundary_count
+        else:
+            counts["pred_boundaries"] += _get_boundary_count(output_seg_word)
+            pred_seg_word = output_seg_word.replace(" ", "") # Go from w o r d -> word
+            gold_seg_word = gold_seg_word.replace(" ", "")
+            for key, is_type_sensitive in [("boundary_matches", False), ("typed_boundary_matches", True)]:
+                word_matches = _align_boundaries(pred_seg_word, gold_seg_word, is_type_sensitive)
+                counts[key] = [total + count for total, count in zip(counts[key], word_matches)]
 
+        # If this word is OOV i.e., its input form is NOT in the train input
+        if do_count_OOV and not (test_input[i] in train_words):
+            counts["OOV_words"] += 1
+            if not is_correct:
+                counts["OOV_incorrect_words"] += 1
+
+    return counts
+
+# Gets the boundary-level precision, recall, and F1 from the counts.
+# Prints them all, or a message letting you know if there was an issue with the calculations.
+# Returns the three values in a list
+def _evaluate_f1(true_pos, false_pos, false_neg):
     # Calculations
     # No predicted boundaries -> no precision
     # No gold boundaries -> no recall
@@ -139,37 +215,34 @@ def _evaluate_f1(predicted_output, gold_output, is_type_sensitive):
 
 # No return value, just prints
 # Go word-by-word -- the entire thing must be right to be correct!
-def _evaluate_word_level_acc(output, gold_output):
-    num_words = 0
-    num_incorrect_words = 0
-
-    for output_seg_word, gold_seg_word in zip(output, gold_output):
-        if output_seg_word != gold_seg_word:
-            num_incorrect_words += 1
-        num_words += 1
-
+def _evaluate_word_level_acc(num_words, num_correct_words):
     assert(num_words > 0)
-    accuracy = (num_words - num_incorrect_words) / num_words
+    accuracy = num_correct_words / num_words
     accuracy = as_percent(accuracy)
     print(f"\nWord-level accuracy: {accuracy}% on {num_words} words.")
     return accuracy
 
-def evaluate(output, gold_output):
+# counts can be passed in if they were already calculated with count_results
+def evaluate(output, gold_output, counts = None):
     results = []
     assert len(output) == len(gold_output), f"\nError: There are {len(output)} predicted words, and {len(gold_output)} gold words."
+    if counts is None:
+        counts = count_results(output, gold_output)
     print("\n** Segmentation accuracy: **")
-    results.append(_evaluate_word_level_acc(output, gold_output))
-    results.extend(_evaluate_f1(output, gold_output, is_type_sensitive = False))
-    results.extend(_evaluate_f1(output, gold_output, is_type_sensitive = True))
+    results.append(_evaluate_word_level_acc(counts["words"], counts["correct_words"]))
+    results.extend(_evaluate_f1(*counts["boundary_matches"]))
+    results.extend(_evaluate_f1(*counts["typed_boundary_matches"]))
 
     return results
 
 # It may be interesting to know whether the model is under- or over-segmenting
 # i.e. inserting too few or too many boundaries
 # So let's compare the number of boundaries predicted to the number in the gold version
-def compare_boundary_count(output, gold_output):
-    predicted_count = _get_boundary_count(output)
-    gold_count = _get_boundary_count(gold_output)
+def compare_boundary_count(output, gold_output, counts = None):
+    if counts is None:
+        counts = count_results(output, gold_output)
+    predicted_count = counts["pred_boundaries"]
+    gold_count = counts["gold_boundaries"]
     predicted_portion  = (NO_RESULT_MARKER if gold_count <= 0 else as_percent(predicted_count/gold_count))
     if gold_count:
         print(f"\nBoundary count: {predicted_count} predicted vs. {gold_count} in gold ({predicted_portion}%).")
@@ -178,28 +251,16 @@ def compare_boundary_count(output, gold_output):
 
     return predicted_portion
 
-def _get_boundary_count(output):
-    boundary_count = 0
-    for word in output:
-        for boundary in ALL_BOUNDARIES:
-            boundary_count += word.count(boundary)
-
-    return boundary_count
-
 # Compare the train and test input word-lists to see how many OOV tokens we dealt with
 # Plus track performance on just those OOV tokens
 # Note that some of these OOV tokens may be repeats
-def evaluate_OOV_performance(output, gold_output, train_input, test_input):
+def evaluate_OOV_performance(output, gold_output, train_input, test_input, counts = None):
     assert(len(output) == len(gold_output))
     assert(len(output) == len(test_input))
-    OOV_count = 0
-    OOV_incorrect_count = 0
-    for input_word, output_word, gold_output_word in zip(test_input, output, gold_output):
-        # If this word is OOV i.e., its input form is NOT in the train input
-        if not (input_word in train_input):
-            OOV_count += 1
-            if gold_output_word != output_word:
-                OOV_incorrect_count += 1
+    if counts is None or counts["OOV_words"] is None:
+        counts = count_results(output, gold_output, train_input, test_input)
+    OOV_count = counts["OOV_words"]
+    OOV_incorrect_count = counts["OOV_incorrect_words"]
 
     if len(output):
         OOV_proportion = as_percent(OOV_count / len(output))
@@ -243,39 +304,58 @@ def reassemble_predicted_line(transcription_lines, predicted_seg_word_list):
 
     return predicted_seg_line_list
 
-def print_predictions(predictions, entire_input):
-    formatted_predictions = reassemble_predicted_line((sentence[0] for sentence in entire_input), predictions)
+# Returns the input sentences with their segmentation lines replaced by the predicted ones
+# predictions is the predicted words (e.g., from read_fairseq_predictions), in order, across all the sentences
+def predictions_to_sentences(predictions, entire_input, segmentation_line_number = 1):
+    formatted_predictions = reassemble_predicted_line((sentence[0] for sentence in entire_input), list(predictions))
     formatted_predictions = add_back_OOL_words((sentence[0] for sentence in entire_input), formatted_predictions)
-    sentences_with_predictions = make_sentence_list_with_prediction(entire_input, formatted_predictions, 1)
-    create_file_of_sentences(sentences_with_predictions, PRED_OUTPUT_FILE_NAME, OUTPUT_DIR)
+    return make_sentence_list_with_prediction(entire_input, formatted_predictions, segmentation_line_number)
+
+def print_predictions(predictions, entire_input):
+    create_file_of_sentences(predictions_to_sentences(predictions, entire_input), PRED_OUTPUT_FILE_NAME, OUTPUT_DIR)
 
 @click.command()
 @click.option("--whole_input_file", required=True, help="The name of the input file (i.e., with the transcription, seg, gloss, etc.).")
-@click.option("--output_file", required=True, help="The name of the output file.")
+@click.option("--output_file", help="The name of the output file (not needed with --models).")
 # If this not specified, then we assume the output is just a list of words, like the input
 @click.option("--output_file_is_fairseq_formatted", is_flag = True, help = "A flag the output has fairseq formatting and needs to be handled as such.")
 @click.option("--gold_output_file", required=True, help="The name of the gold output file.")
 @click.option("--train_input_file", help="The name of the training input file, for OOV calculations.")
-@click.option("--test_input_file", help="The name of the test input file, for OOV calculations.")
-def main(whole_input_file, output_file, output_file_is_fairseq_formatted, gold_output_file, train_input_file = None, test_input_file = None):
-    print("Comparing these files:", output_file, gold_output_file)
-    
+@click.option("--test_input_file", help="The name of the test input file, for OOV calculations (and the words to segment, with --models).")
+@click.option("--models", help="Segment the test input here with these model checkpoint(s), separated by colons (as for fairseq-interactive --path), instead of reading an output file.")
+@click.option("--data_dir", default = seg_model.DEFAULT_DATA_DIR, show_default = True, help = "With --models, the fairseq data directory with the dictionaries.")
+@click.option("--batch_size", default = seg_model.DEFAULT_BATCH_SIZE, show_default = True, help = "With --models, how many words to decode at once.")
+@click.option("--beam", default = seg_model.DEFAULT_BEAM, show_default = True, help = "With --models, the beam size to decode with.")
+def main(whole_input_file, output_file, output_file_is_fairseq_formatted, gold_output_file, train_input_file = None, test_input_file = None, models = None, data_dir = seg_model.DEFAULT_DATA_DIR, batch_size = seg_model.DEFAULT_BATCH_SIZE, beam = seg_model.DEFAULT_BEAM):
     # Get the test results
-    output = read_lines_from_file(output_file)
-    if output_file_is_fairseq_formatted:
-        output = format_fairseq_output(output)
+    if models:
+        assert test_input_file, "--test_input_file is needed to segment with --models."
+        print("Segmenting", test_input_file, "and comparing to", gold_output_file)
+        output = segment_in_process(read_lines_from_file(test_input_file), models, data_dir, batch_size, beam)
+    else:
+        assert output_file, "Either --output_file or --models is needed."
+        print("Comparing these files:", output_file, gold_output_file)
+        if output_file_is_fairseq_formatted:
+            output = [word for word, score in read_fairseq_predictions(output_file)]
+        else:
+            output = read_lines_from_file(output_file)
 
     # Get the labels
     gold_output = read_lines_from_file(gold_output_file)
     
     # Compare!
     results = []
-    results.extend(evaluate(output, gold_output))
-    results.append(compare_boundary_count(output, gold_output))
     if train_input_file and test_input_file:
         train_input = read_lines_from_file(train_input_file)
         test_input = read_lines_from_file(test_input_file)
-        results.extend(evaluate_OOV_performance(output, gold_output, train_input, test_input))
+    else:
+        train_input = None
+        test_input = None
+    counts = count_results(output, gold_output, train_input, test_input)
+    results.extend(evaluate(output, gold_output, counts))
+    results.append(compare_boundary_count(output, gold_output, counts))
+    if train_input_file and test_input_file:
+        results.extend(evaluate_OOV_performance(output, gold_output, train_input, test_input, counts))
     if DO_PRINT_RESULTS_CSV:
         print_results_csv(results, OUTPUT_CSV_HEADER, OUTPUT_CSV, NO_RESULT_MARKER)
 
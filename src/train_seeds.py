@@ -0,0 +1,120 @@
+# *** Trains the segmentation models for every seed at once ***
+# Instead of running train_seg.sh once per seed, one after the other, this runs several seeds side by side.
+# The number running at a time depends on how many CPUs there are: each training run gets --threads_per_job threads
+# (torch's intra-op threads), and no more runs are started than there are threads to go around.
+# Each run's output goes to train_log.txt in its models_seed<seed> directory, and afterwards the JSON log records
+# (train_seg.sh uses --log-format json) from every run are collected into one file.
+# When a seed's training exits successfully, a training_done file is written to its directory.  Seeds that have one are skipped,
+# so the script can be run again after an interruption.  (fairseq writes checkpoint_best.pt after the first epoch,
+# so that doesn't mean a seed has finished.)  A seed that was stopped part-way is picked up by fairseq-train from its checkpoint_last.pt.
+# (A seed that finished before training_done was written is started again, but fairseq-train stops right away,
+# since its checkpoint_last.pt is already at the last epoch.)
+import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+from os import cpu_count, environ, makedirs, path
+import shlex
+import subprocess
+from time import perf_counter
+
+DEFAULT_TRAIN_COMMAND = "sh src/train_seg.sh"
+SAVE_DIR = "models_seed{}"
+DONE_MARKER_NAME = "training_done"
+LAST_CHECKPOINT_NAME = "checkpoint_last.pt"
+LOG_FILE_NAME = "train_log.txt"
+DEFAULT_COLLECTED_LOG_FILE = "train_logs.json"
+# The environment variables that cap how many threads torch (and the libraries under it) use
+THREAD_LIMIT_VARIABLES = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+# Returns how many threads each run gets, and how many runs can go at once
+def get_slots(seed_count, threads_per_job = None, max_parallel = None):
+    cpus = cpu_count() or 1
+    if not threads_per_job:
+        threads_per_job = max(1, cpus // max(seed_count, 1))
+    if not max_parallel:
+        max_parallel = max(1, cpus // threads_per_job)
+
+    return threads_per_job, max(1, min(max_parallel, seed_count))
+
+def has_finished(seed):
+    return path.exists(path.join(SAVE_DIR.format(seed), DONE_MARKER_NAME))
+
+# Runs training for one seed, with its output going to its log file
+# Returns the seed, its exit code, and how long it took in seconds
+def train_seed(seed, train_command = DEFAULT_TRAIN_COMMAND, threads_per_job = 1):
+    save_dir = SAVE_DIR.format(seed)
+    makedirs(save_dir, exist_ok = True)
+    environment = dict(environ)
+    for variable in THREAD_LIMIT_VARIABLES:
+        environment[variable] = str(threads_per_job)
+
+    start_time = perf_counter()
+    with open(path.join(save_dir, LOG_FILE_NAME), "a") as log_file:
+        process = subprocess.run(shlex.split(train_command) + [str(seed)], stdin = subprocess.DEVNULL, stdout = log_file, stderr = subprocess.STDOUT, env = environment)
+    if process.returncode == 0:
+        open(path.join(save_dir, DONE_MARKER_NAME), "w").close()
+
+    return seed, process.returncode, perf_counter() - start_time
+
+# Returns every JSON record in a run's output (fairseq puts them at the end of its log lines, after the " | " prefixes)
+def read_json_records(log_file_path):
+    records = []
+    if not path.exists(log_file_path):
+        return records
+
+    with open(log_file_path) as log_file:
+        for line in log_file:
+            start = line.find("{")
+            if start < 0 or not line.rstrip().endswith("}"):
+                continue
+            try:
+                records.append(json.loads(line[start:]))
+            except json.JSONDecodeError:
+                continue
+
+    return records
+
+# Writes the records for every seed to one file, as a dict from seed to its list of records
+def collect_logs(seeds, output_file):
+    logs = {str(seed): read_json_records(path.join(SAVE_DIR.format(seed), LOG_FILE_NAME)) for seed in seeds}
+    with open(output_file, "w") as file:
+        json.dump(logs, file, indent = 1)
+
+    return logs
+
+@click.command()
+@click.option("--first_seed", default = 0, show_default = True, help = "The first seed to train.")
+@click.option("--last_seed", default = 9, show_default = True, help = "The last seed to train (so by default, 10 models are trained, as run_seg.sh expects).")
+@click.option("--threads_per_job", type = int, help = "How many threads each training run may use.  By default, the CPUs are split evenly between the seeds (at least 1 each).")
+@click.option("--max_parallel", type = int, help = "The most training runs to have going at once.  By default, as many as there are CPUs for (given --threads_per_job).")
+@click.option("--train_command", default = DEFAULT_TRAIN_COMMAND, show_default = True, help = "The command that trains one model, given the seed as its last argument.")
+@click.option("--collected_log_file", default = DEFAULT_COLLECTED_LOG_FILE, show_default = True, help = "Where to write the JSON log records from every seed.")
+def main(first_seed, last_seed, threads_per_job, max_parallel, train_command, collected_log_file):
+    seeds = list(range(first_seed, last_seed + 1))
+    seeds_to_train = [seed for seed in seeds if not has_finished(seed)]
+    if len(seeds_to_train) < len(seeds):
+        print(f"Skipping seed(s) {', '.join(str(seed) for seed in seeds if seed not in seeds_to_train)}, which have already finished training.")
+    resumed_seeds = [seed for seed in seeds_to_train if path.exists(path.join(SAVE_DIR.format(seed), LAST_CHECKPOINT_NAME))]
+    if resumed_seeds:
+        print(f"Resuming seed(s) {', '.join(str(seed) for seed in resumed_seeds)} from their {LAST_CHECKPOINT_NAME}.")
+
+    failed_seeds = []
+    if seeds_to_train:
+        threads_per_job, slots = get_slots(len(seeds_to_train), threads_per_job, max_parallel)
+        print(f"Training {len(seeds_to_train)} seed(s), {slots} at a time with {threads_per_job} thread(s) each.")
+        with ThreadPoolExecutor(max_workers = slots) as executor:
+            futures = [executor.submit(train_seed, seed, train_command, threads_per_job) for seed in seeds_to_train]
+            for future in as_completed(futures):
+                seed, return_code, seconds = future.result()
+                if return_code == 0:
+                    print(f"Seed {seed} finished in {seconds / 60:.1f} minutes.")
+                else:
+                    failed_seeds.append(seed)
+                    print(f"Seed {seed} failed (exit code {return_code}) after {seconds / 60:.1f} minutes; see {path.join(SAVE_DIR.format(seed), LOG_FILE_NAME)}.")
+
+    logs = collect_logs(seeds, collected_log_file)
+    print(f"Wrote {sum(len(records) for records in logs.values())} log records from {len(seeds)} seed(s) to {collected_log_file}.")
+    assert not failed_seeds, f"Training failed for seed(s) {', '.join(str(seed) for seed in sorted(failed_seeds))}."
+
+if __name__ == '__main__':
+    main()
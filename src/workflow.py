@@ -0,0 +1,296 @@
+# *** Runs the segmentation and glossing workflow as a graph of cached steps ***
+# The shell scripts (prepare_seg.sh, run_seg.sh, run_gloss.sh, run_pipeline.sh, ...) redo every step each time,
+# writing over generated_data/.  Here, each step writes to its own directory in --artifacts_dir instead, named by a key:
+# the hash of the step's parameters, the contents of the data files and scripts it uses, and the keys of the steps it needs.
+# So a step is only run if something it depends on changed, and any other experiment that uses the same artifacts
+# directory (e.g., one that only changes the glossing line numbers) reuses whatever it has in common with earlier runs.
+# Steps that don't depend on each other (e.g., glossing and segmentation) run at the same time.
+# The steps are:
+# - tidy (only with --tidy): the data files, tidied with corpus_prep.py's tidy_stage
+# - preprocess_seg: the char-level word lists (and, for fairseq, the data-bin/ from fairseq-preprocess)
+# - train_seg: the fairseq seeds (with train_seeds.py), or a CRF (with crf_seg.py)
+# - segment: the segmenter's predictions for the test words
+# - evaluate_seg: seg_pred.txt and seg_results.csv (test_seg.py)
+# - gloss: gloss_pred.txt and stem_dict.txt (gloss.py)
+# - evaluate_gloss: gloss_results.csv (eval_gloss.py)
+# - pipeline: pipeline_pred.txt, glossing the predicted segmentations (pipeline.py)
+# - evaluate_pipeline: pipeline_results.csv (eval_pipeline.py)
+# Each step's directory has the files it wrote (in the same places as the scripts would under generated_data/),
+# a log.txt with its output, and a step.json with what went into its key.
+# Only the listed scripts (and the shared utilities) are hashed, so after changing some other module they import,
+# remove the affected artifacts (or use a new --artifacts_dir).
+import click
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from hashlib import sha1
+import json
+from os import cpu_count, getpid, makedirs, path, remove, rename, symlink
+import shutil
+import subprocess
+import sys
+from time import perf_counter
+from corpus_prep import run_stages, tidy_stage
+from glossed_data_utilities import read_file, write_sentences
+
+SRC_DIR = path.dirname(path.abspath(__file__))
+DEFAULT_ARTIFACTS_DIR = "artifacts"
+OUTPUT_FOLDER = "generated_data/"
+LOG_FILE_NAME = "log.txt"
+STEP_FILE_NAME = "step.json"
+# Every step depends on these, as well as its own scripts
+SHARED_SCRIPTS = ["glossed_data_utilities.py", "glossed_data_handling_utilities.py"]
+# The key is a sha1 hex digest, but this much of it is plenty to tell artifacts apart
+KEY_LENGTH = 16
+SEGMENTERS = ["fairseq", "crf"]
+EVALUATION_STEPS = ["evaluate_seg", "evaluate_gloss", "evaluate_pipeline"]
+DATA_SETS = ["train", "dev", "test"]
+
+def _hash_file(file_path):
+    file_hash = sha1()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+# Runs each command in the step's directory, with all of their output going to its log
+def _run_commands(commands, step_dir):
+    with open(path.join(step_dir, LOG_FILE_NAME), "a") as log_file:
+        for command in commands:
+            log_file.write("$ " + " ".join(command) + "\n")
+            log_file.flush()
+            subprocess.run(command, cwd = step_dir, stdin = subprocess.DEVNULL, stdout = log_file, stderr = subprocess.STDOUT, check = True)
+
+def _script(name):
+    return [sys.executable, path.join(SRC_DIR, name)]
+
+# Returns every step, in an order where each one comes after the steps it needs, as a dict from its name to:
+# - depends_on: the names of the steps whose artifacts it reads
+# - parameters: everything else that determines its output
+# - scripts: the scripts it runs
+# - run: a function that is given the step's (empty) directory and the directories of the steps it needs, and fills it in
+def get_steps(data_files, segmentation_line_number, gloss_line_number, segmenter, tidy, first_seed, last_seed, epochs_to_use, crf_max_iterations, crf_c2):
+    line_numbers = [f"--segmentation_line_number={segmentation_line_number}", f"--gloss_line_number={gloss_line_number}"]
+    # The data either comes from the tidy step, or straight from the data files (in which case their contents are part of the key)
+    data_dependency = ["tidy"] if tidy else []
+    data_parameters = {} if tidy else {"data": {data_set: _hash_file(data_files[data_set]) for data_set in DATA_SETS}}
+    def get_data_file(data_set, input_dirs):
+        return path.join(input_dirs["tidy"], "data", f"{data_set}.txt") if tidy else data_files[data_set]
+    def get_data_options(input_dirs):
+        return [f"--{data_set}_file={get_data_file(data_set, input_dirs)}" for data_set in DATA_SETS]
+    def get_seg_file(name, input_dirs):
+        return path.join(input_dirs["preprocess_seg"], OUTPUT_FOLDER, name)
+
+    steps = {}
+
+    def run_tidy(step_dir, input_dirs):
+        makedirs(path.join(step_dir, "data"))
+        for data_set in DATA_SETS:
+            # tidy_stage takes 0-indexed line numbers
+            tidied = run_stages(read_file(data_files[data_set]), [tidy_stage(segmentation_line_number - 1, gloss_line_number - 1)])
+            write_sentences(list(tidied), path.join(step_dir, "data", f"{data_set}.txt"))
+    if tidy:
+        steps["tidy"] = {"depends_on": [], "parameters": {"data": {data_set: _hash_file(data_files[data_set]) for data_set in DATA_SETS}, "segmentation_line_number": segmentation_line_number, "gloss_line_number": gloss_line_number}, "scripts": ["corpus_prep.py"], "run": run_tidy}
+
+    def run_preprocess_seg(step_dir, input_dirs):
+        commands = [_script("preprocess_seg.py") + get_data_options(input_dirs)]
+        if segmenter == "fairseq":
+            # Binarized the same way as in prepare_seg.sh
+            commands.append(["fairseq-preprocess", "--source-lang", "input", "--target-lang", "output", "--trainpref", OUTPUT_FOLDER + "train", "--validpref", OUTPUT_FOLDER + "dev", "--destdir", "data-bin/"])
+        _run_commands(commands, step_dir)
+    steps["preprocess_seg"] = {"depends_on": data_dependency, "parameters": dict(data_parameters, segmenter = segmenter), "scripts": ["preprocess_seg.py"], "run": run_preprocess_seg}
+
+    seeds = list(range(first_seed, last_seed + 1))
+    def run_train_seg(step_dir, input_dirs):
+        if segmenter == "fairseq":
+            # train_seg.sh reads data-bin/ from the directory it's run in
+            symlink(path.join(input_dirs["preprocess_seg"], "data-bin"), path.join(step_dir, "data-bin"))
+            _run_commands([_script("train_seeds.py") + [f"--first_seed={first_seed}", f"--last_seed={last_seed}", f"--train_command=sh {path.join(SRC_DIR, 'train_seg.sh')}"]], step_dir)
+        else:
+            _run_commands([_script("crf_seg.py") + [f"--train_input_file={get_seg_file('train.input', input_dirs)}", f"--train_output_file={get_seg_file('train.output', input_dirs)}", f"--max_iterations={crf_max_iterations}", f"--c2={crf_c2}"]], step_dir)
+    train_parameters = {"segmenter": segmenter, "seeds": seeds} if segmenter == "fairseq" else {"segmenter": segmenter, "max_iterations": crf_max_iterations, "c2": crf_c2}
+    train_scripts = ["train_seeds.py", "train_seg.sh"] if segmenter == "fairseq" else ["crf_seg.py", "gloss.py"]
+    steps["train_seg"] = {"depends_on": ["preprocess_seg"], "parameters": train_parameters, "scripts": train_scripts, "run": run_train_seg}
+
+    seg_output_name = "test_fairseq.output" if segmenter == "fairseq" else "test_crf.output"
+    def run_segment(step_dir, input_dirs):
+        output_option = f"--output_file={OUTPUT_FOLDER}{seg_output_name}"
+        if segmenter == "fairseq":
+            models = ":".join(path.join(input_dirs["train_seg"], f"models_seed{seed}", f"checkpoint{epochs_to_use}.pt") for seed in seeds)
+            _run_commands([_script("segment_words.py") + [f"--input_file={get_seg_file('test.input', input_dirs)}", output_option, f"--models={models}", f"--data_dir={path.join(input_dirs['preprocess_seg'], 'data-bin')}"]], step_dir)
+        else:
+            _run_commands([_script("crf_seg.py") + [f"--model_file={path.join(input_dirs['train_seg'], 'seg_crf.pkl')}", f"--input_file={get_seg_file('test.input', input_dirs)}", output_option]], step_dir)
+    segment_parameters = {"epochs_to_use": epochs_to_use} if segmenter == "fairseq" else {}
+    segment_scripts = ["segment_words.py", "seg_model.py"] if segmenter == "fairseq" else ["crf_seg.py"]
+    steps["segment"] = {"depends_on": ["preprocess_seg", "train_seg"], "parameters": segment_parameters, "scripts": segment_scripts, "run": run_segment}
+
+    def run_evaluate_seg(step_dir, input_dirs):
+        fairseq_formatted = ["--output_file_is_fairseq_formatted"] if segmenter == "fairseq" else []
+        _run_commands([_script("test_seg.py") + [f"--whole_input_file={get_data_file('test', input_dirs)}", f"--output_file={path.join(input_dirs['segment'], OUTPUT_FOLDER, seg_output_name)}", f"--gold_output_file={get_seg_file('test.output', input_dirs)}", f"--train_input_file={get_seg_file('train.input', input_dirs)}", f"--test_input_file={get_seg_file('test.input', input_dirs)}"] + fairseq_formatted], step_dir)
+    steps["evaluate_seg"] = {"depends_on": data_dependency + ["preprocess_seg", "segment"], "parameters": dict(data_parameters, segmenter = segmenter), "scripts": ["test_seg.py"], "run": run_evaluate_seg}
+
+    def run_gloss(step_dir, input_dirs):
+        _run_commands([_script("gloss.py") + get_data_options(input_dirs) + [f"--output_folder={OUTPUT_FOLDER}", "--output_file=gloss_pred.txt"] + line_numbers], step_dir)
+    steps["gloss"] = {"depends_on": data_dependency, "parameters": dict(data_parameters, segmentation_line_number = segmentation_line_number, gloss_line_number = gloss_line_number), "scripts": ["gloss.py"], "run": run_gloss}
+
+    def run_evaluate_gloss(step_dir, input_dirs):
+        # eval_gloss.py reads the stem_dict.txt that gloss.py wrote from the directory it's run in
+        shutil.copy(path.join(input_dirs["gloss"], "stem_dict.txt"), step_dir)
+        _run_commands([_script("eval_gloss.py") + [f"--test_file={get_data_file('test', input_dirs)}", f"--output_file={path.join(input_dirs['gloss'], OUTPUT_FOLDER, 'gloss_pred.txt')}"] + line_numbers], step_dir)
+    steps["evaluate_gloss"] = {"depends_on": data_dependency + ["gloss"], "parameters": dict(data_parameters, segmentation_line_number = segmentation_line_number, gloss_line_number = gloss_line_number), "scripts": ["eval_gloss.py", "gloss.py"], "run": run_evaluate_gloss}
+
+    def run_pipeline(step_dir, input_dirs):
+        gloss_data_options = [f"--gloss_{data_set}_file={get_data_file(data_set, input_dirs)}" for data_set in DATA_SETS]
+        _run_commands([_script("pipeline.py") + [f"--seg_pred_file={path.join(input_dirs['evaluate_seg'], OUTPUT_FOLDER, 'seg_pred.txt')}"] + gloss_data_options + line_numbers], step_dir)
+    steps["pipeline"] = {"depends_on": data_dependency + ["evaluate_seg"], "parameters": dict(data_parameters, segmentation_line_number = segmentation_line_number, gloss_line_number = gloss_line_number), "scripts": ["pipeline.py", "gloss.py"], "run": run_pipeline}
+
+    def run_evaluate_pipeline(step_dir, input_dirs):
+        _run_commands([_script("eval_pipeline.py") + [f"--test_file={get_data_file('test', input_dirs)}", f"--output_file={path.join(input_dirs['pipeline'], OUTPUT_FOLDER, 'pipeline_pred.txt')}", f"--train_input_file={get_seg_file('train.input', input_dirs)}", f"--test_input_file={get_seg_file('test.input', input_dirs)}"] + line_numbers], step_dir)
+    steps["evaluate_pipeline"] = {"depends_on": data_dependency + ["preprocess_seg", "pipeline"], "parameters": dict(data_parameters, segmentation_line_number = segmentation_line_number, gloss_line_number = gloss_line_number), "scripts": ["eval_pipeline.py", "eval_gloss.py", "test_seg.py"], "run": run_evaluate_pipeline}
+
+    return steps
+
+# Returns the key for every step (steps must come after the steps they depend on)
+def get_keys(steps):
+    script_hashes = {}
+    keys = {}
+    for name, step in steps.items():
+        for script in step["scripts"] + SHARED_SCRIPTS:
+            if script not in script_hashes:
+                script_hashes[script] = _hash_file(path.join(SRC_DIR, script))
+        key_contents = {
+            "step": name,
+            "parameters": step["parameters"],
+            "scripts": {script: script_hashes[script] for script in step["scripts"] + SHARED_SCRIPTS},
+            "depends_on": {dependency: keys[dependency] for dependency in step["depends_on"]}
+        }
+        keys[name] = sha1(json.dumps(key_contents, sort_keys = True).encode()).hexdigest()[:KEY_LENGTH]
+        step["key_contents"] = key_contents
+
+    return keys
+
+# Returns the names of the target steps and every step they need, in the same order as the steps
+def get_needed_steps(steps, targets):
+    needed = set()
+    to_visit = list(targets)
+    while to_visit:
+        name = to_visit.pop()
+        assert name in steps, f"\nThere's no step called {name}.  The steps are: {', '.join(steps)}."
+        if name not in needed:
+            needed.add(name)
+            to_visit += steps[name]["depends_on"]
+
+    return [name for name in steps if name in needed]
+
+def get_step_dir(artifacts_dir, name, key):
+    return path.abspath(path.join(artifacts_dir, f"{name}-{key}"))
+
+# Runs one step into a temporary directory, which only takes the artifact's place once the step has finished
+# That way, an artifact that exists is always complete, even if a run was stopped part-way
+# Returns the step's name and how long it took in seconds
+def run_step(name, step, step_dir, input_dirs):
+    start_time = perf_counter()
+    temporary_dir = f"{step_dir}.tmp{getpid()}"
+    if path.exists(temporary_dir):
+        shutil.rmtree(temporary_dir)
+    makedirs(path.join(temporary_dir, OUTPUT_FOLDER))
+    with open(path.join(temporary_dir, STEP_FILE_NAME), "w") as file:
+        json.dump(step["key_contents"], file, indent = 1)
+
+    try:
+        step["run"](temporary_dir, input_dirs)
+    except Exception as error:
+        raise RuntimeError(f"{name} failed; see {path.join(temporary_dir, LOG_FILE_NAME)}.") from error
+
+    if path.exists(step_dir):
+        # Another run (e.g., of another experiment) finished the same artifact first
+        shutil.rmtree(temporary_dir)
+    else:
+        rename(temporary_dir, step_dir)
+
+    return name, perf_counter() - start_time
+
+# Points a link for each step in the experiment directory to its artifact, so an experiment's outputs are easy to find
+def link_artifacts(experiment_dir, step_dirs):
+    makedirs(experiment_dir, exist_ok = True)
+    for name, step_dir in step_dirs.items():
+        link = path.join(experiment_dir, name)
+        if path.islink(link):
+            remove(link)
+        symlink(step_dir, link)
+
+# Returns the last row of each evaluation step's results, as (step, header, row)
+def read_evaluation_results(step_dirs):
+    results = []
+    for name in EVALUATION_STEPS:
+        if name not in step_dirs:
+            continue
+        for results_file in ["seg_results.csv", "gloss_results.csv", "pipeline_results.csv"]:
+            results_path = path.join(step_dirs[name], results_file)
+            if path.exists(results_path):
+                with open(results_path) as file:
+                    rows = [line.strip() for line in file if line.strip()]
+                if len(rows) > 1:
+                    results.append((name, rows[0], rows[-1]))
+
+    return results
+
+@click.command()
+@click.option("--train_file", default = "data/train.txt", show_default = True, help = "The name of the file containing all sentences in the train set.")
+@click.option("--dev_file", default = "data/dev.txt", show_default = True, help = "The name of the file containing all sentences in the dev set.")
+@click.option("--test_file", default = "data/test.txt", show_default = True, help = "The name of the file containing all sentences in the test set.")
+@click.option("--segmentation_line_number", required = True, type = int, help = "The line that contains the segmented sentence.  For example if there are four lines each and the segmentation is the second line, this will be 2.")
+@click.option("--gloss_line_number", required = True, type = int, help = "The line that contains the glossed sentence.  For example if there are four lines each and the gloss is the third line, this will be 3.")
+@click.option("--segmenter", type = click.Choice(SEGMENTERS), default = "fairseq", show_default = True, help = "Segment with the fairseq ensemble, or with a CRF (crf_seg.py).")
+@click.option("--tidy", is_flag = True, help = "Tidy the data files (as corpus_prep.py's tidy_stage does) before using them.")
+@click.option("--first_seed", default = 0, show_default = True, help = "With --segmenter=fairseq, the first seed to train.")
+@click.option("--last_seed", default = 9, show_default = True, help = "With --segmenter=fairseq, the last seed to train.")
+@click.option("--epochs_to_use", default = "_best", show_default = True, help = "With --segmenter=fairseq, which checkpoint of each seed to segment with (as in run_seg.sh).")
+@click.option("--crf_max_iterations", default = 100, show_default = True, help = "With --segmenter=crf, the most training iterations to run.")
+@click.option("--crf_c2", default = 0.1, show_default = True, help = "With --segmenter=crf, the L2 regularization coefficient.")
+@click.option("--target", "targets", multiple = True, help = "A step to run (along with the steps it needs).  Can be repeated.  By default, every evaluation step is run.")
+@click.option("--artifacts_dir", default = DEFAULT_ARTIFACTS_DIR, show_default = True, help = "Where each step's artifacts are kept (and looked for).  Experiments that share it share their artifacts.")
+@click.option("--experiment_dir", help = "Optional directory to put a link to each of this run's artifacts in, named by step.")
+@click.option("--max_parallel", type = int, help = "The most steps to have running at once.  By default, as many as there are CPUs.")
+def main(train_file, dev_file, test_file, segmentation_line_number, gloss_line_number, segmenter, tidy, first_seed, last_seed, epochs_to_use, crf_max_iterations, crf_c2, targets, artifacts_dir, experiment_dir, max_parallel):
+    data_files = {"train": path.abspath(train_file), "dev": path.abspath(dev_file), "test": path.abspath(test_file)}
+    steps = get_steps(data_files, segmentation_line_number, gloss_line_number, segmenter, tidy, first_seed, last_seed, epochs_to_use, crf_max_iterations, crf_c2)
+    keys = get_keys(steps)
+    needed_steps = get_needed_steps(steps, targets or EVALUATION_STEPS)
+    step_dirs = {name: get_step_dir(artifacts_dir, name, keys[name]) for name in needed_steps}
+
+    steps_to_run = [name for name in needed_steps if not path.exists(step_dirs[name])]
+    for name in needed_steps:
+        if name not in steps_to_run:
+            print(f"{name}: using {step_dirs[name]}")
+    start_time = perf_counter()
+    if steps_to_run:
+        slots = max(1, max_parallel or cpu_count() or 1)
+        print(f"Running {len(steps_to_run)} step(s), up to {slots} at a time.")
+        finished = set(name for name in needed_steps if name not in steps_to_run)
+        waiting = list(steps_to_run)
+        with ThreadPoolExecutor(max_workers = slots) as executor:
+            running = set()
+            while waiting or running:
+                # Start every step whose inputs are all ready
+                for name in [name for name in waiting if all(dependency in finished for dependency in steps[name]["depends_on"])]:
+                    waiting.remove(name)
+                    input_dirs = {dependency: step_dirs[dependency] for dependency in steps[name]["depends_on"]}
+                    running.add(executor.submit(run_step, name, steps[name], step_dirs[name], input_dirs))
+                done, running = wait(running, return_when = FIRST_COMPLETED)
+                for future in done:
+                    # A failed step raises its error here; the steps already running are left to finish
+                    name, seconds = future.result()
+                    finished.add(name)
+                    print(f"{name}: finished in {seconds:.1f} seconds ({step_dirs[name]})")
+        print(f"Ran {len(steps_to_run)} step(s) in {perf_counter() - start_time:.1f} seconds.")
+    else:
+        print("Every step was already done.")
+
+    if experiment_dir:
+        link_artifacts(experiment_dir, step_dirs)
+        print(f"Linked the artifacts from {experiment_dir}.")
+    for name, header, row in read_evaluation_results(step_dirs):
+        print(f"\n** {name}: **\n{header}\n{row}")
+
+if __name__ == '__main__':
+    main()